@@ -171,7 +171,7 @@ deleteQuiz: async (quizId: string) => {
     return response.json();
   },
 
-generateQuiz: async (files: { url: string; display_name: string; content_type: string }[], course_id?: number, quiz_ids?: number[], question_count?: number, title?: string, instructions?: string) => {
+generateQuiz: async (files: { id?: number; modified_at?: string; size?: number; url: string; display_name: string; content_type: string }[], course_id?: number, quiz_ids?: number[], question_count?: number, title?: string, instructions?: string) => {
     const headers = await getAuthHeaders();
     const response = await fetch(`${API_BASE}/api/generate-quiz`, {
       method: 'POST',
@@ -172,6 +172,9 @@ function QuizStructure() {
         const selectedFiles = files
             .filter(file => selectedFileIds.includes(file.id))
             .map(file => ({
+                id: file.id,
+                modified_at: file.modified_at,
+                size: file.size,
                 url: file.url,
                 display_name: file.display_name,
                 content_type: file['content-type'] || 'application/pdf'
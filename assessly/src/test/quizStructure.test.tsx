@@ -140,6 +140,7 @@ describe('QuizStructure page', () => {
 			expect(mockGenerateQuiz).toHaveBeenCalledWith(
 				[
 					{
+						id: 21,
 						url: 'https://canvas.test/lecture-1.pdf',
 						display_name: 'Lecture 1 Notes.pdf',
 						content_type: 'application/pdf',
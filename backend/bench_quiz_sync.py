@@ -0,0 +1,72 @@
+"""
+SYNC MICRO-BENCHMARK
+- Times plan_canvas_sync (the diff behind POST /api/quizzes/{id}/sync-from-canvas) on synthetic
+  quizzes from 10 to 2,000 questions, with a realistic mix of Canvas-side changes:
+    every 10th item edited, every 25th deleted, a few added at the end, a block of items reordered
+- Prints the time per question for each size; a flat µs/question column means sync scales linearly
+- No Canvas or MongoDB needed
+
+Usage:
+    python bench_quiz_sync.py [--repeat 20]
+"""
+
+import argparse
+import time
+
+from quiz_sync import plan_canvas_sync, question_from_canvas_item
+
+SIZES = (10, 100, 500, 1000, 2000)
+
+
+def make_item(n: int, stem: str = None) -> dict:
+    return {
+        "id": f"item_{n}", "position": n, "points_possible": 1,
+        "entry": {
+            "item_body": stem or f"<p>Question {n}</p>",
+            "interaction_data": {"choices": [{"id": f"{n}_{c}", "item_body": f"Choice {c}"} for c in "abcd"]},
+            "scoring_data": {"value": f"{n}_a"},
+        },
+    }
+
+
+def make_case(size: int):
+    """A stored quiz that was in sync with Canvas, plus the Canvas items after some edits."""
+    items = [make_item(n) for n in range(1, size + 1)]
+    quiz = {"title": "Bench", "question_count": size, "questions": [question_from_canvas_item(i, 0) for i in items]}
+
+    changed = []
+    for n, item in enumerate(items, start=1):
+        if n % 25 == 0:
+            continue
+        if n % 10 == 0:
+            item = make_item(n, stem=f"<p>Question {n}, edited in Canvas</p>")
+        changed.append(item)
+    # Swap a block of positions and add a few new items
+    for item in changed[: max(1, size // 20)]:
+        item["position"] = size + 100 - item["position"]
+    changed.extend(make_item(n) for n in range(size + 1, size + 1 + max(1, size // 50)))
+    return quiz, changed
+
+
+def bench(size: int, repeat: int) -> float:
+    quiz, items = make_case(size)
+    plan_canvas_sync(quiz, "Bench", items)  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        plan_canvas_sync(quiz, "Bench", items)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'questions':>10} {'ms / sync':>10} {'µs / question':>14}")
+    for size in SIZES:
+        seconds = bench(size, args.repeat)
+        print(f"{size:>10} {seconds * 1000:>10.2f} {seconds * 1e6 / size:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
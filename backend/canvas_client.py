@@ -0,0 +1,502 @@
+"""
+ASYNC CANVAS CLIENT
+- httpx.AsyncClient version of CanvasContentRetriever, plus the Canvas publisher (payloads and errors from canvas_publisher.py)
+- Every async route in main.py uses this so a slow Canvas round-trip doesn't stall the event loop
+- All instances share one keep-alive (HTTP/2 when available) connection pool from http_pool.py
+- Same method names and return shapes as CanvasContentRetriever; the access token is bound to the client
+- Paginated listings fetch their remaining pages concurrently once the `last` link says how many there are
+- Publishing creates quiz items concurrently, retries 429 / 5xx, and can resume a publish that failed partway
+- Publish / unpublish / points edits send minimal PATCH bodies in one round-trip; quiz and item reads
+  are conditional on the state cached in quiz_state.py (a 304 reuses the cached body), and item
+  listings are cached per item
+- Errors:
+    retriever methods raise httpx.HTTPStatusError (the httpx equivalent of raise_for_status)
+    publisher methods raise RuntimeError, which routes turn into a 502
+
+Usage:
+    async with AsyncCanvasClient(canvas_url="https://ufl.instructure.com", access_token=token) as canvas:
+        courses = await canvas.get_courses()
+"""
+
+import asyncio
+import hashlib
+import io
+from typing import AsyncIterator, BinaryIO, Callable, Dict, List, Optional
+
+import httpx
+
+from canvas_retriever import (
+    DOWNLOAD_CHUNK_BYTES, check_download_size, filter_teaching_courses, summarize_file, summarize_quiz
+)
+from canvas_publisher import PublishError, ShellNotFoundError, build_shell_payload, build_item_payload
+from fan_out import FAN_OUT_CONCURRENCY, FanOutResult, fan_out
+from http_pool import shared_async_client
+from quiz_state import QuizStateCache, quiz_state_cache
+
+# How many pages of one paginated listing are fetched at the same time
+PAGE_CONCURRENCY = 4
+
+# Publishing: how many quiz items are created at the same time, and how transient Canvas errors are retried
+ITEM_CONCURRENCY = 4
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# A POST that got a 500 / 502 / 504 may still have created something, so only retry it when
+# Canvas says it refused the request outright
+RETRYABLE_POST_STATUS_CODES = {429, 503}
+MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 0.5
+MAX_RETRY_AFTER_SECONDS = 30.0
+
+# Canvas answers a PATCH body it won't accept as partial with one of these, naming a field we didn't send
+# (e.g. "entry is required"); only then is the full object sent. Any other 400 / 422 is a real error.
+MINIMAL_PATCH_REJECTED = {400, 422}
+MISSING_FIELD_MARKERS = ("is required", "can't be blank", "cannot be blank", "is missing", "must be present")
+
+
+def _numbered_page_urls(current_url: str, last_url: Optional[str]) -> Optional[List[str]]:
+    """
+    URLs of the pages after `current_url` up to and including `last_url`, when Canvas numbers its pages.
+    Returns None when it can't tell (no `last` link, or opaque bookmark cursors), so the caller
+    falls back to following `next` links one at a time.
+    """
+    if not last_url:
+        return None
+    last = httpx.URL(last_url)
+    last_page = last.params.get("page", "")
+    current_page = httpx.URL(current_url).params.get("page", "1")
+    if not (last_page.isdigit() and current_page.isdigit()):
+        return None
+    return [str(last.copy_set_param("page", str(n))) for n in range(int(current_page) + 1, int(last_page) + 1)]
+
+
+def _rejects_partial_body(response: httpx.Response, sent_fields: dict) -> bool:
+    """Whether Canvas refused a minimal PATCH because fields we left out are required (vs. a bad value we sent)."""
+    if response.status_code not in MINIMAL_PATCH_REJECTED:
+        return False
+    message = response.text.lower()
+    if not any(marker in message for marker in MISSING_FIELD_MARKERS):
+        return False
+    return not any(field.lower() in message for field in sent_fields)
+
+
+def _retry_delay(response: httpx.Response, backoff: float) -> float:
+    # Canvas sends Retry-After (seconds) with most 429s; otherwise back off exponentially
+    retry_after = response.headers.get("Retry-After", "")
+    try:
+        return min(float(retry_after), MAX_RETRY_AFTER_SECONDS)
+    except ValueError:
+        return backoff
+
+
+class AsyncCanvasClient:
+
+    # Uses the process-wide keep-alive pool (http_pool.py) unless a `client` is passed in; neither is closed here
+    def __init__(
+        self,
+        canvas_url: str,
+        access_token: str,
+        client: Optional[httpx.AsyncClient] = None,
+        page_concurrency: int = PAGE_CONCURRENCY,
+        item_concurrency: int = ITEM_CONCURRENCY,
+        retry_backoff: float = RETRY_BACKOFF_SECONDS,
+        quiz_state: Optional[QuizStateCache] = None
+    ):
+        self.base_url = canvas_url.rstrip('/')
+        self.headers = {"Authorization": f"Bearer {access_token}"}
+        self._token = access_token
+        self.quiz_state = quiz_state or quiz_state_cache
+        self.page_concurrency = max(1, page_concurrency)
+        self.item_concurrency = max(1, item_concurrency)
+        self.retry_backoff = retry_backoff
+        self._client = client or shared_async_client()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        # Nothing to close: the pool outlives this client and keeps its connections for the next request
+        return None
+
+    async def _get_page(self, url: str, params: Optional[Dict] = None) -> httpx.Response:
+        response = await self._client.get(url, headers=self.headers, params=params)
+        response.raise_for_status()
+        return response
+
+    async def iter_pages(self, url: str, params: Optional[Dict] = None) -> AsyncIterator[List[Dict]]:
+        """
+        Yield each page of a paginated Canvas listing, in order, as soon as it is available.
+        The first response's `last` link tells us how many pages there are, so the rest are fetched
+        concurrently (at most `page_concurrency` at a time); without it, `next` links are followed serially.
+        """
+        response = await self._get_page(url, params)
+        yield response.json()
+
+        next_url = response.links.get('next', {}).get('url')
+        if not next_url:
+            return
+
+        remaining = _numbered_page_urls(str(response.url), response.links.get('last', {}).get('url'))
+        if remaining is None:
+            while next_url:
+                response = await self._get_page(next_url)  # Params already in next URL
+                yield response.json()
+                next_url = response.links.get('next', {}).get('url')
+            return
+
+        semaphore = asyncio.Semaphore(self.page_concurrency)
+
+        async def fetch(page_url: str) -> List[Dict]:
+            async with semaphore:
+                return (await self._get_page(page_url)).json()
+
+        tasks = [asyncio.create_task(fetch(page_url)) for page_url in remaining]
+        try:
+            for task in tasks:
+                yield await task
+        finally:
+            # Caller stopped early or a page failed: don't leave requests running in the background
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _get_all_pages(self, url: str, params: Optional[Dict] = None) -> List[Dict]:
+        results = []
+        async for page in self.iter_pages(url, params):
+            results.extend(page)
+        return results
+
+    # --- Retriever surface (mirrors CanvasContentRetriever) ---
+
+    async def get_courses(self) -> List[Dict]:
+        response = await self._client.get(
+            f"{self.base_url}/api/v1/courses",
+            headers=self.headers,
+            params={"enrollment_state": "active", "per_page": 100}
+        )
+        response.raise_for_status()
+        return filter_teaching_courses(response.json())
+
+    async def get_course_files(self, course_id: int) -> List[Dict]:
+        all_files = await self._get_all_pages(
+            f"{self.base_url}/api/v1/courses/{course_id}/files", {"per_page": 100}
+        )
+        return [summarize_file(file) for file in all_files]
+
+    async def get_course_quizzes(self, course_id: int) -> List[Dict]:
+        all_quizzes = await self._get_all_pages(
+            f"{self.base_url}/api/v1/courses/{course_id}/quizzes", {"per_page": 100}
+        )
+        return [summarize_quiz(quiz) for quiz in all_quizzes]
+
+    async def get_quiz_questions(self, course_id: int, quiz_id: int) -> List[Dict]:
+        return await self._get_all_pages(
+            f"{self.base_url}/api/v1/courses/{course_id}/quizzes/{quiz_id}/questions", {"per_page": 100}
+        )
+
+    async def stream_file(self, file_url: str, dest: BinaryIO, max_bytes: Optional[int] = None) -> str:
+        async with self._client.stream("GET", file_url, headers=self.headers) as response:
+            response.raise_for_status()
+            check_download_size(response.headers.get("Content-Length"), max_bytes)
+
+            digest = hashlib.sha256()
+            received = 0
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_BYTES):
+                received += len(chunk)
+                check_download_size(received, max_bytes)
+                digest.update(chunk)
+                dest.write(chunk)
+            return digest.hexdigest()
+
+    async def download_file(self, file_url: str, save_path: Optional[str] = None, max_bytes: Optional[int] = None) -> bytes:
+        buffer = io.BytesIO()
+        await self.stream_file(file_url, buffer, max_bytes)
+        content = buffer.getvalue()
+
+        if save_path:
+            with open(save_path, 'wb') as f:
+                f.write(content)
+
+        return content
+
+    def get_file_hash(self, file_content: bytes) -> str:
+        return hashlib.sha256(file_content).hexdigest()
+
+    async def get_assignment_groups(self, course_id: int) -> List[Dict]:
+        response = await self._client.get(
+            f"{self.base_url}/api/v1/courses/{course_id}/assignment_groups",
+            headers=self.headers,
+            params={"per_page": 100}
+        )
+        response.raise_for_status()
+        return [{"id": g["id"], "name": g["name"]} for g in response.json()]
+
+    async def get_all_course_content(self, course_id: int, concurrency: int = FAN_OUT_CONCURRENCY) -> Dict:
+        files = await self.get_course_files(course_id)
+        quizzes = await self.get_course_quizzes(course_id)
+
+        outcome = await fan_out(quizzes, lambda quiz: self.get_quiz_questions(course_id, quiz['id']), limit=concurrency)
+        for quiz, questions in zip(quizzes, outcome.results):
+            quiz['questions'] = questions or []
+
+        return {
+            'files': files,
+            'quizzes': quizzes,
+            'question_errors': [
+                {'quiz_id': f['item']['id'], 'error': str(f['error'])} for f in outcome.failures
+            ]
+        }
+
+    # --- Publisher surface (payloads built by canvas_publisher) ---
+
+    def _quiz_url(self, course_id: int, new_quiz_id: Optional[str] = None) -> str:
+        url = f"{self.base_url}/api/quiz/v1/courses/{course_id}/quizzes"
+        return f"{url}/{new_quiz_id}" if new_quiz_id else url
+
+    async def _get_state(self, url: str, params: Optional[Dict] = None) -> httpx.Response:
+        """
+        GET a quiz / item, conditional on the cached copy (If-None-Match / If-Modified-Since).
+        A 304 is answered from the cache, so callers always see a 200 with the body.
+        """
+        cached = self.quiz_state.get(self._token, url)
+        headers = {**self.headers, **(cached.conditional_headers() if cached else {})}
+        resp = await self._client.get(url, headers=headers, params=params)
+        if resp.status_code == 304 and cached:
+            return httpx.Response(200, json=cached.body, request=resp.request)
+        if resp.is_success:
+            self.quiz_state.remember(self._token, url, resp.json(), resp.headers)
+        return resp
+
+    def _remember_patch(self, url: str, resp: httpx.Response, fields: dict) -> None:
+        # Canvas usually echoes the updated object back; otherwise apply the change to our cached copy
+        try:
+            body = resp.json()
+        except ValueError:
+            body = None
+        if isinstance(body, dict) and body.get("id"):
+            self.quiz_state.remember(self._token, url, body, resp.headers)
+        else:
+            self.quiz_state.merge(self._token, url, fields)
+
+    async def _patch_minimal(self, url: str, key: str, fields: dict, full_body: Callable[[dict], dict], action: str) -> httpx.Response:
+        """
+        PATCH only `fields` ({key: fields}) in a single round-trip.
+        If Canvas rejects the partial body itself (a field we left out is required), fall back to the old
+        read-modify-write: fetch the object (a 304 when our cached copy is current), apply full_body() and
+        PATCH the whole thing. Any other error is returned as-is from the first response.
+        """
+        resp = await self._client.patch(url, headers=self.headers, json={key: fields})
+        if _rejects_partial_body(resp, fields):
+            print(f"Canvas rejected a partial {key} update ({resp.status_code}), sending the full object")
+            get_resp = await self._get_state(url)
+            if not get_resp.is_success:
+                raise RuntimeError(f"Failed to fetch {action}: {get_resp.status_code} {get_resp.text}")
+            resp = await self._client.patch(url, headers=self.headers, json={key: full_body(get_resp.json())})
+        if resp.is_success:
+            self._remember_patch(url, resp, fields)
+        return resp
+
+    async def _set_quiz_published(self, course_id: int, new_quiz_id: str, published: bool, action: str) -> httpx.Response:
+        return await self._patch_minimal(
+            self._quiz_url(course_id, new_quiz_id),
+            "quiz",
+            {"published": published},
+            lambda quiz: {**quiz, "published": published},
+            action
+        )
+
+    async def _send_with_retry(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a Canvas request, retrying 429 / 5xx responses (only 429 / 503 for POSTs, which aren't
+        idempotent) and failed connections with exponential backoff.
+        The last response is returned as-is once retries run out, so callers keep their own error handling.
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            backoff = self.retry_backoff * 2 ** attempt
+            try:
+                response = await self._client.request(method, url, headers=self.headers, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                # The request never reached Canvas, so even a POST is safe to send again
+                if attempt == MAX_RETRIES:
+                    raise
+                await asyncio.sleep(backoff)
+                continue
+
+            retryable = RETRYABLE_POST_STATUS_CODES if method.upper() == "POST" else RETRYABLE_STATUS_CODES
+            if response.status_code not in retryable or attempt == MAX_RETRIES:
+                return response
+            print(f"Canvas returned {response.status_code} for {method} {url}, retrying ({attempt + 1}/{MAX_RETRIES})")
+            await asyncio.sleep(_retry_delay(response, backoff))
+
+    async def publish_quiz_to_canvas(
+        self,
+        quiz_doc: dict,
+        publish: bool = True,
+        on_shell_created: Optional[Callable[[str], None]] = None,
+        on_item_created: Optional[Callable[[str, str], None]] = None
+    ) -> dict:
+        """
+        Create the New Quizzes shell, then one item per question, then publish (unless publish=False).
+        Items are created concurrently (item_concurrency at a time) with explicit positions.
+
+        Resumable: if quiz_doc already has a new_quiz_id (an earlier attempt got partway), that shell is
+        reused and questions that already have a canvas_item_id are skipped.
+        on_shell_created(new_quiz_id) / on_item_created(internal_question_id, canvas_item_id) are called as soon
+        as Canvas confirms each step, so the caller can checkpoint progress (see publish_jobs.py).
+
+        Returns new_quiz_id, assignment_id, questions (with canvas_item_id filled in).
+        Raises RuntimeError on any Canvas API failure - PublishError (carrying what was created) once the shell exists,
+        ShellNotFoundError if the shell being resumed was deleted on Canvas.
+        """
+        course_id = quiz_doc["course_id"]
+        new_quiz_id = quiz_doc.get("new_quiz_id")
+        # canvas_item_ids only mean something inside the shell they were created in; without one they're stale
+        questions = quiz_doc["questions"] if new_quiz_id else [{**q, "canvas_item_id": None} for q in quiz_doc["questions"]]
+
+        # Build every payload first so a malformed question fails before anything is created on Canvas
+        pending = [q for q in questions if not q.get("canvas_item_id")]
+        payloads = {q["internal_question_id"]: build_item_payload(q) for q in pending}
+
+        if new_quiz_id:
+            # The shell may have been deleted on Canvas since the earlier attempt; items can't be posted into it then
+            shell_resp = await self._get_state(self._quiz_url(course_id, new_quiz_id))
+            if shell_resp.status_code == 404:
+                self.quiz_state.forget(self._token, self._quiz_url(course_id, new_quiz_id))
+                raise ShellNotFoundError(new_quiz_id)
+            print(f"Resuming publish into existing quiz shell: new_quiz_id={new_quiz_id}")
+        else:
+            shell_resp = await self._send_with_retry("POST", self._quiz_url(course_id), json=build_shell_payload(quiz_doc))
+            if not shell_resp.is_success:
+                raise RuntimeError(f"Failed to create quiz shell: {shell_resp.status_code} {shell_resp.text}")
+
+            shell_data = shell_resp.json()
+            new_quiz_id = shell_data.get("id")
+            if not new_quiz_id:
+                raise RuntimeError(f"Canvas did not return a quiz id. Response: {shell_data}")
+
+            print(f"Created quiz shell: new_quiz_id={new_quiz_id}")
+            self.quiz_state.remember(self._token, self._quiz_url(course_id, new_quiz_id), shell_data, shell_resp.headers)
+            if on_shell_created:
+                on_shell_created(new_quiz_id)
+
+        item_ids = {q["internal_question_id"]: q.get("canvas_item_id") for q in questions}
+        items_url = f"{self._quiz_url(course_id, new_quiz_id)}/items"
+
+        async def create_item(question: dict) -> None:
+            item_resp = await self._send_with_retry("POST", items_url, json=payloads[question["internal_question_id"]])
+            if not item_resp.is_success:
+                raise RuntimeError(
+                    f"Failed to create item for question {question['internal_question_id']}: "
+                    f"{item_resp.status_code} {item_resp.text}"
+                )
+            canvas_item_id = item_resp.json().get("id")
+            item_ids[question["internal_question_id"]] = canvas_item_id
+            print(f"  Created item {canvas_item_id} for question position {question['position']}")
+            if on_item_created:
+                on_item_created(question["internal_question_id"], canvas_item_id)
+
+        outcome = await fan_out(pending, create_item, limit=self.item_concurrency)
+        updated_questions = [{**q, "canvas_item_id": item_ids[q["internal_question_id"]]} for q in questions]
+
+        if outcome.failures:
+            errors = [str(f["error"]) for f in outcome.failures]
+            more = f" (and {len(errors) - 1} more)" if len(errors) > 1 else ""
+            raise PublishError(f"{errors[0]}{more}", new_quiz_id, updated_questions)
+
+        if publish:
+            try:
+                publish_resp = await self._set_quiz_published(course_id, new_quiz_id, True, "quiz for publishing")
+            except RuntimeError as e:
+                raise PublishError(str(e), new_quiz_id, updated_questions)
+            if not publish_resp.is_success:
+                raise PublishError(
+                    f"Failed to publish quiz: {publish_resp.status_code} {publish_resp.text}", new_quiz_id, updated_questions
+                )
+            print(f"Quiz {new_quiz_id} published successfully.")
+        else:
+            print(f"Quiz {new_quiz_id} saved to Canvas as unpublished draft.")
+
+        # For Canvas New Quizzes, assignment_id == new_quiz_id
+        return {
+            "new_quiz_id": new_quiz_id,
+            "assignment_id": new_quiz_id,
+            "questions": updated_questions
+        }
+
+    async def publish_existing_canvas_quiz(self, course_id: int, new_quiz_id: str) -> None:
+        patch_resp = await self._set_quiz_published(course_id, new_quiz_id, True, "existing quiz for publishing")
+        if not patch_resp.is_success:
+            raise RuntimeError(f"Failed to publish existing quiz: {patch_resp.status_code} {patch_resp.text}")
+
+    async def unpublish_canvas_quiz(self, course_id: int, new_quiz_id: str) -> None:
+        patch_resp = await self._set_quiz_published(course_id, new_quiz_id, False, "quiz for unpublishing")
+        if not patch_resp.is_success:
+            raise RuntimeError(f"Failed to unpublish quiz: {patch_resp.status_code} {patch_resp.text}")
+
+    async def update_item_points_on_canvas(self, course_id: int, new_quiz_id: str, canvas_item_id: str, points_possible: float) -> None:
+        def with_points(item_data: dict) -> dict:
+            item_data = {**item_data, "points_possible": points_possible}
+            if "entry" in item_data:
+                item_data["entry"] = {**item_data["entry"], "points_possible": points_possible}
+            return item_data
+
+        patch_resp = await self._patch_minimal(
+            f"{self._quiz_url(course_id, new_quiz_id)}/items/{canvas_item_id}",
+            "item",
+            {"points_possible": points_possible},
+            with_points,
+            f"item {canvas_item_id} for points update"
+        )
+        if not patch_resp.is_success:
+            raise RuntimeError(f"Failed to update points for item {canvas_item_id}: {patch_resp.status_code} {patch_resp.text}")
+
+    async def update_items_points_on_canvas(self, course_id: int, new_quiz_id: str, points: Dict[str, float]) -> FanOutResult:
+        """
+        Bulk version of update_item_points_on_canvas: {canvas_item_id: points_possible}, item_concurrency at a time.
+        One failed item doesn't stop the rest; outcome.failures lists them ({"item": canvas_item_id, "error": ...}).
+        """
+        return await fan_out(
+            list(points),
+            lambda canvas_item_id: self.update_item_points_on_canvas(course_id, new_quiz_id, canvas_item_id, points[canvas_item_id]),
+            limit=self.item_concurrency
+        )
+
+    async def fetch_canvas_quiz_items(self, course_id: int, new_quiz_id: str) -> list:
+        # Every page: sync treats an item missing from this list as deleted on Canvas
+        items_url = f"{self._quiz_url(course_id, new_quiz_id)}/items"
+        try:
+            items = await self._get_all_pages(items_url, {"per_page": 100})
+        except httpx.HTTPStatusError as e:
+            raise RuntimeError(f"Failed to fetch quiz items from Canvas: {e.response.status_code} {e.response.text}")
+        for item in items:
+            if isinstance(item, dict) and item.get("id"):
+                self.quiz_state.remember(self._token, f"{items_url}/{item['id']}", item)
+        return items
+
+    async def fetch_canvas_quiz_title(self, course_id: int, new_quiz_id: str) -> str:
+        resp = await self._get_state(self._quiz_url(course_id, new_quiz_id))
+        if not resp.is_success:
+            raise RuntimeError(f"Failed to fetch quiz from Canvas: {resp.status_code} {resp.text}")
+        return resp.json().get("title", "")
+
+    async def delete_quiz_from_canvas(self, course_id: int, new_quiz_id: str) -> None:
+        # The New Quizzes endpoint has no DELETE — delete the assignment (assignment_id == new_quiz_id)
+        resp = await self._client.delete(
+            f"{self.base_url}/api/v1/courses/{course_id}/assignments/{new_quiz_id}",
+            headers=self.headers
+        )
+        # 404: already deleted on Canvas, which is what the caller wants
+        if not resp.is_success and resp.status_code != 404:
+            raise RuntimeError(f"Failed to delete quiz from Canvas: {resp.status_code} {resp.text}")
+        self.quiz_state.forget(self._token, self._quiz_url(course_id, new_quiz_id))
+
+    async def get_all_new_quizzes_for_course(self, course_id: int) -> dict:
+        resp = await self._client.get(self._quiz_url(course_id), headers=self.headers, params={"per_page": 100})
+        if not resp.is_success:
+            raise RuntimeError(f"Failed to fetch New Quizzes for course: {resp.status_code} {resp.text}")
+
+        return {
+            str(q["id"]): {"title": q.get("title", ""), "published": bool(q.get("published", False))}
+            for q in resp.json() if q.get("id")
+        }
@@ -0,0 +1,259 @@
+"""
+CANVAS RATE LIMITING
+- Canvas throttles each access token with a leaky bucket: every response reports the bucket
+  (X-Rate-Limit-Remaining) and what the call cost (X-Request-Cost); an empty bucket answers
+  403 "Rate Limit Exceeded"
+- One RateLimiter per token tracks those headers and decides when the next call may start:
+    - the last reported remaining budget, refilled over time at REFILL_PER_SECOND (up to CAPACITY)
+    - minus the estimated cost of every call still in flight
+    - calls wait (instead of failing) until the estimate covers one more call plus RESERVE,
+      so concurrency shrinks automatically as the bucket drains; never more than MAX_CONCURRENCY
+- A 403 "Rate Limit Exceeded" empties the estimate and the call is queued again (up to MAX_THROTTLE_RETRIES)
+- Enforced underneath the shared pools in http_pool.py, so every Canvas call goes through it:
+    RateLimitedAsyncTransport / RateLimitedTransport (httpx) and RateLimitedAdapter (requests)
+  requests without a Bearer token (e.g. file CDN redirects) pass straight through
+- canvas_rate_limits.metrics_for(token) reports a token's throttle counters
+
+Usage:
+    transport = RateLimitedAsyncTransport(httpx.AsyncHTTPTransport(), canvas_rate_limits)
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import httpx
+from requests.adapters import HTTPAdapter
+
+# Canvas' documented bucket size and roughly how fast it drains back
+CAPACITY = 700.0
+REFILL_PER_SECOND = 10.0
+# Budget kept free so other clients using the same token (e.g. the Canvas web UI) aren't starved
+RESERVE = 50.0
+# Cost assumed until Canvas reports one; most GETs cost well under this
+DEFAULT_COST = 5.0
+MAX_CONCURRENCY = 8
+MAX_THROTTLE_RETRIES = 5
+# Shortest wait between attempts to start a call
+MIN_WAIT_SECONDS = 0.05
+
+RATE_LIMITED_MARKER = b"Rate Limit Exceeded"
+
+
+def token_fingerprint(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+def _header_float(headers, name: str) -> Optional[float]:
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+
+    def __init__(
+        self,
+        capacity: float = CAPACITY,
+        refill_per_second: float = REFILL_PER_SECOND,
+        reserve: float = RESERVE,
+        max_concurrency: int = MAX_CONCURRENCY,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.reserve = reserve
+        self.max_concurrency = max(1, max_concurrency)
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self.remaining = capacity
+        self._reported_at = clock()
+        self.cost = DEFAULT_COST
+        self.in_flight = 0
+        # Metrics
+        self.requests = 0
+        self.throttled_waits = 0
+        self.wait_seconds = 0.0
+        self.rate_limited_responses = 0
+
+    def _available(self, now: float) -> float:
+        """Estimated budget left for new calls: refilled bucket minus in-flight calls and the reserve."""
+        bucket = min(self.capacity, self.remaining + (now - self._reported_at) * self.refill_per_second)
+        return bucket - self.in_flight * self.cost - self.reserve
+
+    def try_acquire(self) -> float:
+        """Take a slot and return 0, or return how long to wait before trying again."""
+        with self._lock:
+            available = self._available(self._clock())
+            if self.in_flight < self.max_concurrency and available >= self.cost:
+                self.in_flight += 1
+                self.requests += 1
+                return 0.0
+            if available >= self.cost:
+                # Only the concurrency cap is in the way; a slot frees up when a call finishes
+                return MIN_WAIT_SECONDS
+            return max((self.cost - available) / self.refill_per_second, MIN_WAIT_SECONDS)
+
+    def acquire_sync(self) -> None:
+        waited = False
+        while (delay := self.try_acquire()) > 0:
+            waited = self._record_wait(delay, waited)
+            time.sleep(delay)
+
+    async def acquire(self) -> None:
+        waited = False
+        while (delay := self.try_acquire()) > 0:
+            waited = self._record_wait(delay, waited)
+            await asyncio.sleep(delay)
+
+    def release(self, headers=None, rate_limited: bool = False) -> None:
+        """Give the slot back and learn from the response headers (None if the call never got a response)."""
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            now = self._clock()
+            remaining = _header_float(headers or {}, "X-Rate-Limit-Remaining")
+            cost = _header_float(headers or {}, "X-Request-Cost")
+            if remaining is not None:
+                self.remaining, self._reported_at = remaining, now
+            if cost is not None and cost > 0:
+                # Smoothed so one expensive call doesn't stall everything after it
+                self.cost = 0.7 * self.cost + 0.3 * cost
+            if rate_limited:
+                self.rate_limited_responses += 1
+                self.remaining, self._reported_at = 0.0, now
+
+    def metrics(self) -> dict:
+        with self._lock:
+            available = self._available(self._clock())
+            return {
+                "remaining_estimate": round(available + self.in_flight * self.cost + self.reserve, 2),
+                "request_cost_estimate": round(self.cost, 2),
+                "in_flight": self.in_flight,
+                "concurrency_limit": max(0, min(self.max_concurrency, self.in_flight + int(max(available, 0) // self.cost))),
+                "requests": self.requests,
+                "throttled_waits": self.throttled_waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "rate_limited_responses": self.rate_limited_responses,
+            }
+
+    def _record_wait(self, delay: float, waited: bool) -> bool:
+        with self._lock:
+            if not waited:
+                self.throttled_waits += 1
+            self.wait_seconds += delay
+        return True
+
+
+class CanvasRateLimits:
+    """One RateLimiter per Canvas access token, created on first use."""
+
+    def __init__(self, **limiter_options):
+        self._limiter_options = limiter_options
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def for_token(self, token: str) -> RateLimiter:
+        key = token_fingerprint(token)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = RateLimiter(**self._limiter_options)
+            return limiter
+
+    def for_request(self, headers) -> Optional[RateLimiter]:
+        scheme, _, token = (headers.get("Authorization") or "").partition(" ")
+        return self.for_token(token) if scheme.lower() == "bearer" and token else None
+
+    def metrics_for(self, token: str) -> dict:
+        return self.for_token(token).metrics()
+
+
+canvas_rate_limits = CanvasRateLimits()
+
+
+class RateLimitedAsyncTransport(httpx.AsyncBaseTransport):
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, limits: CanvasRateLimits, max_retries: int = MAX_THROTTLE_RETRIES):
+        self.transport = transport
+        self.limits = limits
+        self.max_retries = max_retries
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        limiter = self.limits.for_request(request.headers)
+        if limiter is None:
+            return await self.transport.handle_async_request(request)
+
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except BaseException:
+                limiter.release()
+                raise
+            throttled = response.status_code == 403 and RATE_LIMITED_MARKER in await response.aread()
+            limiter.release(response.headers, rate_limited=throttled)
+            if not throttled or attempt == self.max_retries:
+                return response
+            await response.aclose()
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+
+    def __init__(self, transport: httpx.BaseTransport, limits: CanvasRateLimits, max_retries: int = MAX_THROTTLE_RETRIES):
+        self.transport = transport
+        self.limits = limits
+        self.max_retries = max_retries
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        limiter = self.limits.for_request(request.headers)
+        if limiter is None:
+            return self.transport.handle_request(request)
+
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire_sync()
+            try:
+                response = self.transport.handle_request(request)
+            except BaseException:
+                limiter.release()
+                raise
+            throttled = response.status_code == 403 and RATE_LIMITED_MARKER in response.read()
+            limiter.release(response.headers, rate_limited=throttled)
+            if not throttled or attempt == self.max_retries:
+                return response
+            response.close()
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class RateLimitedAdapter(HTTPAdapter):
+
+    def __init__(self, limits: CanvasRateLimits, max_throttle_retries: int = MAX_THROTTLE_RETRIES, **kwargs):
+        self.limits = limits
+        self.max_throttle_retries = max_throttle_retries
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        limiter = self.limits.for_request(request.headers)
+        if limiter is None:
+            return super().send(request, **kwargs)
+
+        for attempt in range(self.max_throttle_retries + 1):
+            limiter.acquire_sync()
+            try:
+                response = super().send(request, **kwargs)
+            except BaseException:
+                limiter.release()
+                raise
+            throttled = response.status_code == 403 and RATE_LIMITED_MARKER in response.content
+            limiter.release(response.headers, rate_limited=throttled)
+            if not throttled or attempt == self.max_throttle_retries:
+                return response
+            response.close()
@@ -1,17 +1,91 @@
+import io
 import os
 import requests
-from typing import List, Dict, Optional
+from typing import BinaryIO, List, Dict, Optional
 import hashlib
 from dotenv import load_dotenv
+from fan_out import FAN_OUT_CONCURRENCY, fan_out_threaded
+from http_pool import shared_session
 
 load_dotenv()
+
+VALID_TEACHING_ROLES = {'TeacherEnrollment', 'TaEnrollment', 'DesignerEnrollment'}
+
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+# Raise ValueError once a download is known to exceed max_bytes (a Content-Length header or a running byte count)
+# Shared with the async client in canvas_client.py
+def check_download_size(size, max_bytes: Optional[int]) -> None:
+    if max_bytes is None or size is None:
+        return
+    if isinstance(size, str):
+        if not size.isdigit():
+            return
+        size = int(size)
+    if size > max_bytes:
+        raise ValueError(f"File is larger than the {max_bytes} byte download limit.")
+
+
+# Keep only courses where the user has at least one teaching role
+# Shared with the async client in canvas_client.py so both return the same shape
+def filter_teaching_courses(raw_courses: List[Dict]) -> List[Dict]:
+    filtered_courses = []
+    for course in raw_courses:
+        enrollments = course.get("enrollments", [])
+        roles = {e.get("role") for e in enrollments}
+
+        if roles & VALID_TEACHING_ROLES:  # course has at least one valid role
+            filtered_courses.append({
+                "id": course["id"],
+                "name": course.get("name"),
+                "course_code": course.get("course_code"),
+                "enrollments": [
+                    {"role": e.get("role"), "enrollment_state": e.get("enrollment_state")}
+                    for e in enrollments
+                ]
+            })
+
+    return filtered_courses
+
+
+def summarize_file(file: Dict) -> Dict:
+    return {
+        "id": file["id"],
+        "folder_id": file.get("folder_id"),
+        "display_name": file.get("display_name"),
+        "filename": file.get("filename"),
+        "content-type": file.get("content-type"),
+        "url": file.get("url"),
+        "size": file.get("size"),
+        "created_at": file.get("created_at"),
+        "updated_at": file.get("updated_at"),
+        "modified_at": file.get("modified_at"),
+        "mime_class": file.get("mime_class"),
+    }
+
+
+def summarize_quiz(quiz: Dict) -> Dict:
+    return {
+        "id": quiz["id"],
+        "title": quiz.get("title"),
+        "description": quiz.get("description"),
+        "html_url": quiz.get("html_url"),
+        "question_count": quiz.get("question_count"),
+        "points_possible": quiz.get("points_possible"),
+        "due_at": quiz.get("due_at"),
+        "published": quiz.get("published")
+    }
+
  
 class CanvasContentRetriever:
 
     # Initializes Canvas API client with UF's Canvas URL and user's access token
-    def __init__(self, canvas_url: str, access_token: str):
+    # Requests go through the shared keep-alive session (http_pool.py) unless one is passed in
+    def __init__(self, canvas_url: str, access_token: str, session: Optional[requests.Session] = None):
         self.base_url = canvas_url.rstrip('/')
         self.headers = {"Authorization": f"Bearer {access_token}"}
+        self.session = session or shared_session()
     
     # Get all courses accessible for the user
     # Returns only: id, name, course_code, and enrollment role/state
@@ -22,29 +96,11 @@ class CanvasContentRetriever:
             "per_page": 100
         }
 
-        response = requests.get(url, headers=self.headers, params=params)
+        response = self.session.get(url, headers=self.headers, params=params)
         response.raise_for_status()
         raw_courses = response.json()
 
-        valid_roles = {'TeacherEnrollment', 'TaEnrollment', 'DesignerEnrollment'}
-
-        filtered_courses = []
-        for course in raw_courses:
-            enrollments = course.get("enrollments", [])
-            roles = {e.get("role") for e in enrollments}
-
-            if roles & valid_roles:  # course has at least one valid role
-                filtered_courses.append({
-                    "id": course["id"],
-                    "name": course.get("name"),
-                    "course_code": course.get("course_code"),
-                    "enrollments": [
-                        {"role": e.get("role"), "enrollment_state": e.get("enrollment_state")}
-                        for e in enrollments
-                    ]
-                })
-
-        return filtered_courses
+        return filter_teaching_courses(raw_courses)
     
     """
     Get all files for a course
@@ -68,7 +124,7 @@ class CanvasContentRetriever:
         all_files = []
 
         while url:
-            response = requests.get(url, headers=self.headers, params=params)
+            response = self.session.get(url, headers=self.headers, params=params)
             response.raise_for_status()
             all_files.extend(response.json())
 
@@ -76,23 +132,7 @@ class CanvasContentRetriever:
             url = response.links.get('next', {}).get('url')
             params = {}  # Params already in next URL
 
-        filtered_files = []
-        for file in all_files:
-            filtered_files.append({
-                "id": file["id"],
-                "folder_id": file.get("folder_id"),
-                "display_name": file.get("display_name"),
-                "filename": file.get("filename"),
-                "content-type": file.get("content-type"),
-                "url": file.get("url"),
-                "size": file.get("size"),
-                "created_at": file.get("created_at"),
-                "updated_at": file.get("updated_at"),
-                "modified_at": file.get("modified_at"),
-                "mime_class": file.get("mime_class"),
-            })
-
-        return filtered_files
+        return [summarize_file(file) for file in all_files]
     
     """
     Get all quizzes for a course (metadata - not content)
@@ -106,27 +146,14 @@ class CanvasContentRetriever:
         all_quizzes = []
 
         while url:
-            response = requests.get(url, headers=self.headers, params=params)
+            response = self.session.get(url, headers=self.headers, params=params)
             response.raise_for_status()
             all_quizzes.extend(response.json())
 
             url = response.links.get('next', {}).get('url')
             params = {}
 
-        filtered_quizzes = []
-        for quiz in all_quizzes:
-            filtered_quizzes.append({
-                "id": quiz["id"],
-                "title": quiz.get("title"),
-                "description": quiz.get("description"),
-                "html_url": quiz.get("html_url"),
-                "question_count": quiz.get("question_count"),
-                "points_possible": quiz.get("points_possible"),
-                "due_at": quiz.get("due_at"),
-                "published": quiz.get("published")
-            })
-
-        return filtered_quizzes
+        return [summarize_quiz(quiz) for quiz in all_quizzes]
     
     """
     Get all questions for a specific quiz
@@ -147,7 +174,7 @@ class CanvasContentRetriever:
         all_questions = []
         
         while url:
-            response = requests.get(url, headers=self.headers, params=params)
+            response = self.session.get(url, headers=self.headers, params=params)
             response.raise_for_status()
             all_questions.extend(response.json())
             
@@ -156,19 +183,46 @@ class CanvasContentRetriever:
         
         return all_questions
     
+    """
+    Streams a file from Canvas into `dest` (any binary file object) chunk by chunk,
+    so memory use does not grow with the file size.
+    Returns the SHA256 hash of the content.
+
+    Arguments:
+        - file_url should be the 'url' field from get_course_files() response, which is a direct download link
+        - max_bytes rejects files larger than this (ValueError) without downloading the rest
+    """
+    def stream_file(self, file_url: str, dest: BinaryIO, max_bytes: Optional[int] = None) -> str:
+        response = self.session.get(file_url, headers=self.headers, stream=True)
+        try:
+            response.raise_for_status()
+            check_download_size(response.headers.get("Content-Length"), max_bytes)
+
+            digest = hashlib.sha256()
+            received = 0
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                received += len(chunk)
+                check_download_size(received, max_bytes)
+                digest.update(chunk)
+                dest.write(chunk)
+            return digest.hexdigest()
+        finally:
+            response.close()
+
     """
     Downloads a file from Canvas using the direct URL provided in the file metadata.
     Returns the file content as bytes and optionally saves it to disk if a save_path is provided.
+    Use stream_file() instead for files that may be large.
     
     Arguments:
         - file_url should be the 'url' field from get_course_files() response, which is a direct download link
         - save_path is to save file to disk and is optional
+        - max_bytes rejects files larger than this (ValueError)
     """
-    def download_file(self, file_url: str, save_path: Optional[str] = None) -> bytes:
-        response = requests.get(file_url, headers=self.headers)
-        response.raise_for_status()
-        
-        content = response.content
+    def download_file(self, file_url: str, save_path: Optional[str] = None, max_bytes: Optional[int] = None) -> bytes:
+        buffer = io.BytesIO()
+        self.stream_file(file_url, buffer, max_bytes)
+        content = buffer.getvalue()
         
         if save_path:
             with open(save_path, 'wb') as f:
@@ -186,23 +240,28 @@ class CanvasContentRetriever:
     Returns dict with:
         - files: List of all files
         - quizzes: List of all quizzes with their questions
+        - question_errors: {quiz_id, error} for quizzes whose questions could not be fetched
     """
     def get_assignment_groups(self, course_id: int) -> List[Dict]:
         url = f"{self.base_url}/api/v1/courses/{course_id}/assignment_groups"
         params = {"per_page": 100}
-        response = requests.get(url, headers=self.headers, params=params)
+        response = self.session.get(url, headers=self.headers, params=params)
         response.raise_for_status()
         return [{"id": g["id"], "name": g["name"]} for g in response.json()]
 
-    def get_all_course_content(self, course_id: int) -> Dict:
+    def get_all_course_content(self, course_id: int, concurrency: int = FAN_OUT_CONCURRENCY) -> Dict:
         files = self.get_course_files(course_id)
         quizzes = self.get_course_quizzes(course_id)
         
-        # Optionally fetch questions for each quiz
-        for quiz in quizzes:
-            quiz['questions'] = self.get_quiz_questions(course_id, quiz['id'])
+        # Fetch questions for several quizzes at once; a quiz that fails keeps an empty list
+        outcome = fan_out_threaded(quizzes, lambda quiz: self.get_quiz_questions(course_id, quiz['id']), limit=concurrency)
+        for quiz, questions in zip(quizzes, outcome.results):
+            quiz['questions'] = questions or []
         
         return {
             'files': files,
-            'quizzes': quizzes
+            'quizzes': quizzes,
+            'question_errors': [
+                {'quiz_id': f['item']['id'], 'error': str(f['error'])} for f in outcome.failures
+            ]
         }
\ No newline at end of file
@@ -1,37 +1,116 @@
 """
 CLERK TOKEN VERIFICATION
-- Decodes JWT token to get user ID
-- Fetches full user info from Clerk API
+- Verifies the session JWT locally: RS256 signature against Clerk's JWKS, plus exp/nbf
+- The JWKS is fetched once and cached; it is re-fetched only when a token names an unknown `kid`
+- Fetching the full user profile from the Clerk API is optional (fetch_clerk_profile),
+  so the common path costs CPU only, no network hop
 """
 
 import os
+import time
 import base64
 import json
+import asyncio
+from typing import Awaitable, Callable, Optional
 import httpx
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
 from dotenv import load_dotenv
 
 load_dotenv()
 
 CLERK_SECRET_KEY = os.getenv("CLERK_SECRET_KEY")
+CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL", "https://api.clerk.com/v1/jwks")
 
+# Allowed clock skew (seconds) when checking exp / nbf
+CLOCK_SKEW_SECONDS = 5
 
-async def verify_clerk_token(token: str) -> dict:
+
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _decode_segment(segment: str) -> dict:
+    try:
+        decoded = json.loads(_b64url_decode(segment))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid token")
+    # A JWT header / payload is always a JSON object; anything else would blow up on .get() as a 500
+    if not isinstance(decoded, dict):
+        raise ValueError("Invalid token")
+    return decoded
+
+
+def _public_key_from_jwk(jwk: dict) -> rsa.RSAPublicKey:
+    n = int.from_bytes(_b64url_decode(jwk["n"]), "big")
+    e = int.from_bytes(_b64url_decode(jwk["e"]), "big")
+    return rsa.RSAPublicNumbers(e, n).public_key()
+
+
+async def _fetch_jwks_from_clerk() -> dict:
     if not CLERK_SECRET_KEY:
         raise ValueError("CLERK_SECRET_KEY not in .env")
-    
-    # Decode token to get user ID
-    parts = token.split(".")
-    if len(parts) != 3:
-        raise ValueError("Invalid token")
-    
-    payload = parts[1]
-    payload += "=" * (4 - len(payload) % 4)
-    decoded = base64.urlsafe_b64decode(payload)
-    data = json.loads(decoded)
-    
-    user_id = data.get("sub")
-    
-    # Fetch full user info from Clerk API
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        response = await client.get(CLERK_JWKS_URL, headers={"Authorization": f"Bearer {CLERK_SECRET_KEY}"})
+    if response.status_code != 200:
+        raise ValueError(f"Failed to fetch Clerk JWKS: {response.status_code}")
+    return response.json()
+
+
+class JWKSCache:
+    """
+    Signing keys by kid. Keys are loaded on first use and reloaded only when a token
+    names a kid we haven't seen (key rotation), at most once per `min_refresh_interval`
+    so garbage kids can't make us hammer the JWKS endpoint.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[dict]] = _fetch_jwks_from_clerk, min_refresh_interval: float = 60.0):
+        self._fetch = fetch
+        self._keys: dict = {}
+        self._last_refresh: Optional[float] = None
+        self._min_refresh_interval = min_refresh_interval
+        self._lock = asyncio.Lock()
+
+    async def get_key(self, kid: str) -> rsa.RSAPublicKey:
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+
+        async with self._lock:
+            # Another request may have refreshed while we waited for the lock
+            if kid not in self._keys and self._refresh_allowed():
+                await self.refresh()
+
+        key = self._keys.get(kid)
+        if key is None:
+            raise ValueError("Invalid token: unknown signing key")
+        return key
+
+    def _refresh_allowed(self) -> bool:
+        return self._last_refresh is None or time.monotonic() - self._last_refresh >= self._min_refresh_interval
+
+    async def refresh(self) -> None:
+        jwks = await self._fetch()
+        self._keys = {
+            jwk["kid"]: _public_key_from_jwk(jwk)
+            for jwk in jwks.get("keys", [])
+            if jwk.get("kty") == "RSA" and jwk.get("kid")
+        }
+        self._last_refresh = time.monotonic()
+
+
+jwks_cache = JWKSCache()
+
+
+async def fetch_clerk_profile(user_id: str) -> Optional[dict]:
+    """
+    Fetch email / name from the Clerk users API.
+    Only needed when the session token doesn't carry them; returns None if the lookup fails.
+    """
+    if not CLERK_SECRET_KEY:
+        return None
+
     async with httpx.AsyncClient() as client:
         response = await client.get(
             f"https://api.clerk.com/v1/users/{user_id}",
@@ -40,15 +119,68 @@ async def verify_clerk_token(token: str) -> dict:
                 "Content-Type": "application/json"
             }
         )
-        
-        if response.status_code == 200:
-            clerk_user = response.json()
-            return {
-                "sub": user_id,
-                "email": clerk_user.get("email_addresses", [{}])[0].get("email_address"),
-                "first_name": clerk_user.get("first_name"),
-                "last_name": clerk_user.get("last_name")
-            }
-        else:
-            # Fallback to just the user ID
-            return {"sub": user_id, "email": None, "first_name": None, "last_name": None}
\ No newline at end of file
+
+    if response.status_code != 200:
+        return None
+
+    clerk_user = response.json()
+    return {
+        "email": (clerk_user.get("email_addresses") or [{}])[0].get("email_address"),
+        "first_name": clerk_user.get("first_name"),
+        "last_name": clerk_user.get("last_name")
+    }
+
+
+async def verify_clerk_token(token: str, fetch_profile: bool = False) -> dict:
+    """
+    Verify a Clerk session token and return its identity:
+        sub, exp, and email / first_name / last_name when the token carries them (else None).
+    fetch_profile=True fills missing profile fields from the Clerk users API.
+    Raises ValueError if the token is malformed, badly signed, expired or not yet valid.
+    """
+    parts = token.split(".")
+    if len(parts) != 3:
+        raise ValueError("Invalid token")
+
+    header = _decode_segment(parts[0])
+    claims = _decode_segment(parts[1])
+    if header.get("alg") != "RS256":
+        raise ValueError("Invalid token: unsupported algorithm")
+
+    key = await jwks_cache.get_key(header.get("kid"))
+    try:
+        key.verify(
+            _b64url_decode(parts[2]),
+            f"{parts[0]}.{parts[1]}".encode(),
+            padding.PKCS1v15(),
+            hashes.SHA256()
+        )
+    except (InvalidSignature, ValueError):
+        raise ValueError("Invalid token: bad signature")
+
+    now = time.time()
+    exp = claims.get("exp")
+    if not isinstance(exp, (int, float)) or now > exp + CLOCK_SKEW_SECONDS:
+        raise ValueError("Token expired")
+    nbf = claims.get("nbf")
+    if isinstance(nbf, (int, float)) and now + CLOCK_SKEW_SECONDS < nbf:
+        raise ValueError("Token not yet valid")
+
+    user_id = claims.get("sub")
+    if not user_id:
+        raise ValueError("Invalid token: missing sub")
+
+    result = {
+        "sub": user_id,
+        "exp": exp,
+        "email": claims.get("email"),
+        "first_name": claims.get("first_name"),
+        "last_name": claims.get("last_name")
+    }
+
+    if fetch_profile and not result["email"]:
+        profile = await fetch_clerk_profile(user_id)
+        if profile:
+            result.update(profile)
+
+    return result
@@ -14,11 +14,14 @@ DATABASE SETUP - MongoDB
     - gemini_token: user's Gemini API key
     - created_at: when user first logged in
     - updated_at: when user was last updated
+- gemini_files collection caches Gemini uploads of Canvas files (see gemini_file_cache.py)
+- publish_jobs collection checkpoints quiz saves / publishes to Canvas (see publish_jobs.py)
+- quiz_results collection caches generated quizzes for repeat requests (see quiz_result_cache.py)
 - get_db(): returns the database instance
 - user_has_tokens(): checks if user completed onboarding
 """
 
-from pymongo import MongoClient, ASCENDING
+from pymongo import MongoClient, ASCENDING, ReturnDocument
 from datetime import datetime
 import os
 import certifi
@@ -41,6 +44,9 @@ db = client[DB_NAME]
 # collections
 users_collection = db["users"]
 course_quizzes_collection = db["course_quizzes"]
+gemini_files_collection = db["gemini_files"]
+publish_jobs_collection = db["publish_jobs"]
+quiz_results_collection = db["quiz_results"]
 
 
 def init_db():
@@ -50,6 +56,20 @@ def init_db():
         course_quizzes_collection.create_index(
             [("course_id", ASCENDING)]
         )
+        gemini_files_collection.create_index(
+            [("owner", ASCENDING), ("key", ASCENDING)], unique=True
+        )
+        gemini_files_collection.create_index(
+            [("owner", ASCENDING), ("last_used_at", ASCENDING)]
+        )
+        # Gemini deletes uploads after 48h; let MongoDB drop the matching cache entries too
+        gemini_files_collection.create_index("expires_at", expireAfterSeconds=0)
+        # One job per quiz - the unique index is what makes claiming a job atomic
+        publish_jobs_collection.create_index("quiz_id", unique=True)
+        quiz_results_collection.create_index(
+            [("owner", ASCENDING), ("key", ASCENDING)], unique=True
+        )
+        quiz_results_collection.create_index("expires_at", expireAfterSeconds=0)
     except Exception as e:
         print(f"Index creation error (may already exist): {e}")
 
@@ -58,39 +78,51 @@ def get_db():
     return db
 
 
+# Fields a brand-new user document starts with (besides clerk_id / timestamps)
+NEW_USER_DEFAULTS = {
+    "university_id": None,
+    "canvas_user_id": None,
+    "first_name": None,
+    "last_name": None,
+    "email": None,
+    "canvas_token": None,
+    "gemini_token": None,
+}
+
+PROFILE_FIELDS = ("email", "first_name", "last_name")
+
+
 def get_or_create_user(clerk_id: str, user_data: dict = None) -> dict:
-    """Find user by clerk_id, or create if doesn't exist"""
-    user = users_collection.find_one({"clerk_id": clerk_id})
-    
-    if not user:
-        user = {
-            "clerk_id": clerk_id,
-            "university_id": None,
-            "canvas_user_id": None,
-            "first_name": user_data.get("first_name") if user_data else None,
-            "last_name": user_data.get("last_name") if user_data else None,
-            "email": user_data.get("email") if user_data else None,
-            "canvas_token": None,
-            "gemini_token": None,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
-        result = users_collection.insert_one(user)
-        user["_id"] = result.inserted_id
-    elif user_data:
-        # Update existing user with latest info from Clerk
-        users_collection.update_one(
-            {"clerk_id": clerk_id},
-            {"$set": {
-                "email": user_data.get("email"),
-                "first_name": user_data.get("first_name"),
-                "last_name": user_data.get("last_name"),
-                "updated_at": datetime.utcnow()
-            }}
-        )
-        user = users_collection.find_one({"clerk_id": clerk_id})
-    
-    return user
+    """
+    Find user by clerk_id, or create if doesn't exist - in one atomic round-trip.
+    Clerk profile fields (email, first/last name) are only written when they differ
+    from what's stored; None means "unknown" and never overwrites a stored value.
+    updated_at only moves when something actually changed, so a repeat login is a no-op write.
+    Returns the user document after the update.
+    """
+    now = datetime.utcnow()
+    profile = {
+        field: user_data[field]
+        for field in PROFILE_FIELDS
+        if user_data and user_data.get(field) is not None
+    }
+    # $literal so a value that happens to start with "$" isn't read as a field path
+    unchanged = {"$and": [{"$eq": [f"${field}", {"$literal": value}]} for field, value in profile.items()]}
+
+    pipeline = [{"$set": {
+        # New documents get the full schema; existing values are kept as-is
+        **{field: {"$ifNull": [f"${field}", default]} for field, default in NEW_USER_DEFAULTS.items()},
+        **{field: {"$literal": value} for field, value in profile.items()},
+        "created_at": {"$ifNull": ["$created_at", now]},
+        "updated_at": {"$cond": [unchanged, {"$ifNull": ["$updated_at", now]}, now]},
+    }}]
+
+    return users_collection.find_one_and_update(
+        {"clerk_id": clerk_id},
+        pipeline,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
 
 
 def update_user(clerk_id: str, update_data: dict):
@@ -1,14 +1,73 @@
+"""
+TOKEN ENCRYPTION
+- Canvas and Gemini tokens are stored Fernet-encrypted in MongoDB
+- TokenVault builds the cipher once (init_vault() on startup) and keeps recently decrypted
+  tokens in a bounded, TTL-expiring in-memory cache keyed by ciphertext
+- Key rotation: ENCRYPTION_KEY may hold several comma-separated keys, newest first.
+  New values are encrypted with the first key; any listed key can still decrypt (MultiFernet).
+"""
+
 import os
-from cryptography.fernet import Fernet
+from typing import List, Optional
+from cryptography.fernet import Fernet, MultiFernet
+from ttl_cache import TTLCache
+
+
+class TokenVault:
+
+    def __init__(self, keys: List[str], cache_size: int = 256, cache_ttl: float = 900.0):
+        if not keys:
+            raise RuntimeError("ENCRYPTION_KEY not set in environment")
+        self._cipher = MultiFernet([Fernet(key.encode()) for key in keys])
+        self._plaintexts = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def encrypt(self, plaintext: str) -> str:
+        return self._cipher.encrypt(plaintext.encode()).decode()
+
+    def decrypt(self, ciphertext: str) -> str:
+        plaintext = self._plaintexts.get(ciphertext)
+        if plaintext is None:
+            plaintext = self._cipher.decrypt(ciphertext.encode()).decode()
+            self._plaintexts.set(ciphertext, plaintext)
+        return plaintext
+
+    def rotate(self, ciphertext: str) -> str:
+        """Re-encrypt a stored value under the newest key (e.g. after adding a key)."""
+        return self._cipher.rotate(ciphertext.encode()).decode()
+
+    def stats(self) -> dict:
+        return self._plaintexts.stats()
+
 
-def _get_fernet() -> Fernet:
+def _keys_from_env() -> List[str]:
     key = os.getenv("ENCRYPTION_KEY")
     if not key:
         raise RuntimeError("ENCRYPTION_KEY not set in environment")
-    return Fernet(key.encode())
+    return [k.strip() for k in key.split(",") if k.strip()]
+
+
+_vault: Optional[TokenVault] = None
+
+
+def init_vault() -> TokenVault:
+    """Build the process-wide vault from ENCRYPTION_KEY - call this once on startup."""
+    global _vault
+    _vault = TokenVault(
+        _keys_from_env(),
+        cache_size=int(os.getenv("TOKEN_CACHE_SIZE", "256")),
+        cache_ttl=float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "900"))
+    )
+    return _vault
+
+
+def get_vault() -> TokenVault:
+    # Before init_vault() (scripts, tests) build a throwaway vault from the current environment
+    return _vault if _vault is not None else TokenVault(_keys_from_env())
+
 
 def encrypt(plaintext: str) -> str:
-    return _get_fernet().encrypt(plaintext.encode()).decode()
+    return get_vault().encrypt(plaintext)
+
 
 def decrypt(ciphertext: str) -> str:
-    return _get_fernet().decrypt(ciphertext.encode()).decode()
+    return get_vault().decrypt(ciphertext)
@@ -0,0 +1,70 @@
+"""
+CONCURRENT FAN-OUT
+- Runs the same Canvas call for every item in a list (e.g. get_quiz_questions per quiz id)
+  with at most `limit` calls in flight, instead of one round-trip after another
+- Results keep the input order; a failing call doesn't sink the rest - its slot in `results`
+  is None and the error is recorded in `failures`
+- fan_out is for async callables (AsyncCanvasClient), fan_out_threaded for blocking ones
+  (CanvasContentRetriever)
+
+Usage:
+    outcome = await fan_out(quiz_ids, lambda quiz_id: canvas.get_quiz_questions(course_id, quiz_id))
+    for quiz_id, questions in zip(quiz_ids, outcome.results): ...
+    for failure in outcome.failures: print(failure["item"], failure["error"])
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterable, List
+
+# Default number of concurrent Canvas calls per fan-out
+FAN_OUT_CONCURRENCY = int(os.getenv("CANVAS_FAN_OUT_CONCURRENCY", "6"))
+
+
+class FanOutResult:
+
+    def __init__(self, size: int):
+        self.results: List[Any] = [None] * size
+        # {"index", "item", "error"} per failed call, in input order
+        self.failures: List[Dict] = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.failures
+
+    def failed_items(self) -> List[Any]:
+        return [failure["item"] for failure in self.failures]
+
+
+async def fan_out(items: Iterable, call: Callable[[Any], Awaitable[Any]], limit: int = FAN_OUT_CONCURRENCY) -> FanOutResult:
+    items = list(items)
+    outcome = FanOutResult(len(items))
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(index: int, item) -> None:
+        async with semaphore:
+            try:
+                outcome.results[index] = await call(item)
+            except Exception as e:
+                outcome.failures.append({"index": index, "item": item, "error": e})
+
+    await asyncio.gather(*(run(i, item) for i, item in enumerate(items)))
+    outcome.failures.sort(key=lambda failure: failure["index"])
+    return outcome
+
+
+def fan_out_threaded(items: Iterable, call: Callable[[Any], Any], limit: int = FAN_OUT_CONCURRENCY) -> FanOutResult:
+    items = list(items)
+    outcome = FanOutResult(len(items))
+    if not items:
+        return outcome
+
+    with ThreadPoolExecutor(max_workers=max(1, min(limit, len(items)))) as pool:
+        futures = [pool.submit(call, item) for item in items]
+        for index, (item, future) in enumerate(zip(items, futures)):
+            try:
+                outcome.results[index] = future.result()
+            except Exception as e:
+                outcome.failures.append({"index": index, "item": item, "error": e})
+    return outcome
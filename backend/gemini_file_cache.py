@@ -0,0 +1,109 @@
+"""
+GEMINI FILE CACHE
+- Remembers which Canvas files are already uploaded to Gemini, so regenerating a quiz from the
+  same lecture slides skips both the Canvas download and the Gemini upload
+- Entries are keyed by a fingerprint of the Gemini API key (uploads are only visible to the key
+  that made them) plus either:
+    canvas:<file id>:<modified_at>   when the frontend sends Canvas file metadata
+    sha256:<content hash>            otherwise (the download still happens, the upload is skipped)
+- Gemini deletes uploads after 48 hours; entries are treated as stale REFRESH_MARGIN before that
+  so a handle never expires in the middle of a generation
+- At most `max_entries` live uploads per API key; the least recently used ones are evicted and
+  handed back to the caller to delete from Gemini
+- Stored in MongoDB (gemini_files collection) so it survives restarts and is shared between workers
+"""
+
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from google.genai import types
+
+# Gemini keeps uploaded files for 48 hours
+GEMINI_FILE_LIFETIME = timedelta(hours=48)
+REFRESH_MARGIN = timedelta(hours=2)
+
+
+def api_key_fingerprint(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()[:32]
+
+
+def metadata_cache_key(file_info: dict) -> Optional[str]:
+    """Cache key from Canvas metadata, or None if the file info doesn't carry id + modified_at."""
+    file_id = file_info.get("id")
+    modified_at = file_info.get("modified_at")
+    if file_id is None or not modified_at:
+        return None
+    return f"canvas:{file_id}:{modified_at}"
+
+
+def content_cache_key(content_hash: str) -> str:
+    return f"sha256:{content_hash}"
+
+
+class GeminiFileCache:
+
+    def __init__(self, collection, max_entries: int = 50, refresh_margin: timedelta = REFRESH_MARGIN):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.refresh_margin = refresh_margin
+
+    def lookup(self, api_key: str, cache_key: str) -> Optional[types.File]:
+        """Return a live Gemini file handle for this key, or None if missing / about to expire."""
+        now = datetime.now(timezone.utc)
+        doc = self.collection.find_one({"owner": api_key_fingerprint(api_key), "key": cache_key})
+        if not doc:
+            return None
+        if _as_utc(doc["expires_at"]) <= now + self.refresh_margin:
+            return None
+
+        self.collection.update_one({"_id": doc["_id"]}, {"$set": {"last_used_at": now}})
+        return types.File(name=doc["name"], uri=doc["uri"], mime_type=doc["mime_type"])
+
+    def store(self, api_key: str, cache_keys: List[str], upload) -> List[str]:
+        """
+        Remember `upload` under each of `cache_keys`.
+        Returns Gemini file names that are no longer referenced (replaced or evicted) and should be deleted.
+        """
+        owner = api_key_fingerprint(api_key)
+        now = datetime.now(timezone.utc)
+        expires_at = _as_utc(getattr(upload, "expiration_time", None) or now + GEMINI_FILE_LIFETIME)
+
+        stale_names = []
+        for cache_key in cache_keys:
+            previous = self.collection.find_one_and_update(
+                {"owner": owner, "key": cache_key},
+                {"$set": {
+                    "name": upload.name,
+                    "uri": upload.uri,
+                    "mime_type": upload.mime_type,
+                    "expires_at": expires_at,
+                    "last_used_at": now,
+                }},
+                upsert=True
+            )
+            if previous and previous.get("name") != upload.name:
+                stale_names.append(previous["name"])
+
+        stale_names.extend(self._evict(owner))
+        # A file can be stored under several keys; only delete names nothing points at anymore
+        return [name for name in dict.fromkeys(stale_names) if not self.collection.find_one({"owner": owner, "name": name})]
+
+    def forget(self, api_key: str, cache_key: str) -> None:
+        self.collection.delete_one({"owner": api_key_fingerprint(api_key), "key": cache_key})
+
+    def _evict(self, owner: str) -> List[str]:
+        overflow = list(
+            self.collection.find({"owner": owner}, {"name": 1, "last_used_at": 1})
+            .sort("last_used_at", -1)
+            .skip(self.max_entries)
+        )
+        if not overflow:
+            return []
+        self.collection.delete_many({"_id": {"$in": [doc["_id"] for doc in overflow]}})
+        return [doc["name"] for doc in overflow]
+
+
+def _as_utc(value: datetime) -> datetime:
+    # MongoDB hands back naive datetimes (in UTC) unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
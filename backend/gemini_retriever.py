@@ -4,10 +4,37 @@ import re
 from google import genai
 from dotenv import load_dotenv
 import httpx
-import io
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from gemini_file_cache import metadata_cache_key, content_cache_key
+from question_stream import QuestionStreamParser
+from question_index import QuestionIndex, topic_summary
+from prompt_context import CONTEXT_TOKEN_BUDGET, compact_previous_questions
+from question_validation import validate_question
+from http_pool import shared_sync_client
+from canvas_retriever import DOWNLOAD_CHUNK_BYTES, check_download_size
 
 load_dotenv()
 
+GEMINI_MODEL = "gemini-2.5-flash"
+GENERATION_CONFIG = {"response_mime_type": "application/json", "thinking_config": {"thinking_budget": 0}}
+
+# How many files are downloaded from Canvas / uploaded to Gemini at the same time
+MAX_PARALLEL_TRANSFERS = int(os.getenv("GEMINI_MAX_PARALLEL_TRANSFERS", "4"))
+
+# Largest Canvas file we will send to Gemini; bigger files are rejected before (or while) downloading
+MAX_FILE_BYTES = int(os.getenv("GEMINI_MAX_FILE_MB", "100")) * 1024 * 1024
+# Downloads are streamed into a spooled temp file: kept in memory up to this size, then moved to disk
+SPOOL_MEMORY_BYTES = 8 * 1024 * 1024
+
+# Requests for more questions than this are split into parallel Gemini calls ("shards") of at most this many
+SHARD_QUESTIONS = int(os.getenv("GEMINI_SHARD_QUESTIONS", "10"))
+MAX_PARALLEL_SHARDS = int(os.getenv("GEMINI_MAX_PARALLEL_SHARDS", "4"))
+# Follow-up calls that re-request only invalid / lost questions before giving up on them
+MAX_REPAIR_ROUNDS = int(os.getenv("GEMINI_MAX_REPAIR_ROUNDS", "2"))
+
 QUIZ_PROMPT = """You are an expert educator and quiz creator. From all of the provided course materials combined, create exactly 5 challenging multiple-choice practice quiz questions that test deep understanding of the most important concepts.
 
 Return ONLY a valid JSON object with no extra text, markdown code fences, or explanation. Use this exact format:
@@ -34,22 +61,441 @@ Rules:
 - Questions should be substantive and require understanding, not just recall
 - No markdown, no code fences, no text outside the JSON object"""
 
+# Identifies what the prompt + model would produce; cached quiz results from another version are ignored
+PROMPT_VERSION = hashlib.sha256(
+    json.dumps([QUIZ_PROMPT, GEMINI_MODEL, GENERATION_CONFIG], sort_keys=True).encode()
+).hexdigest()[:16]
+
+"""
+    Return a cached Gemini upload if it is still live on Gemini's side, else None.
+    Any cache problem is treated as a miss - the cache must never break generation.
+"""
+def _cached_upload(client, file_cache, api_key: str, cache_key: str):
+    try:
+        handle = file_cache.lookup(api_key, cache_key)
+        if handle is None:
+            return None
+        client.files.get(name=handle.name)
+        return handle
+    except Exception:
+        try:
+            file_cache.forget(api_key, cache_key)
+        except Exception:
+            pass
+        return None
+
+
+def _too_large_message(display_name: str, max_bytes: int) -> str:
+    return f"'{display_name}' is larger than the {max_bytes // (1024 * 1024)} MB limit for quiz generation."
+
+
+def _check_size(size, display_name: str, max_bytes: int) -> None:
+    # Same limit check as every other Canvas download, with a message that names the file
+    try:
+        check_download_size(size, max_bytes)
+    except ValueError:
+        raise ValueError(_too_large_message(display_name, max_bytes)) from None
+
+
+"""
+    Stream one Canvas file into a spooled temp file, hashing it on the way.
+    Peak memory is SPOOL_MEMORY_BYTES + one chunk regardless of file size.
+    Returns (spool positioned at 0, sha256 hex digest); the caller closes the spool.
+"""
+def _download_to_spool(h_client, url: str, headers: dict, display_name: str, max_bytes: int, failed: threading.Event):
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    digest = hashlib.sha256()
+    try:
+        with h_client.stream("GET", url, headers=headers) as dl_response:
+            if dl_response.status_code != 200:
+                raise RuntimeError(
+                    f"Failed to download '{display_name}' from Canvas "
+                    f"(HTTP {dl_response.status_code})."
+                )
+
+            _check_size(dl_response.headers.get("Content-Length"), display_name, max_bytes)
+
+            received = 0
+            for chunk in dl_response.iter_bytes(DOWNLOAD_CHUNK_BYTES):
+                received += len(chunk)
+                # Content-Length can be missing or wrong, so count what actually arrives
+                _check_size(received, display_name, max_bytes)
+                if failed.is_set():
+                    spool.close()
+                    return None, None
+                digest.update(chunk)
+                spool.write(chunk)
+    except httpx.TimeoutException:
+        spool.close()
+        raise RuntimeError(f"Timed out downloading '{display_name}' from Canvas.")
+    except httpx.RequestError as e:
+        spool.close()
+        raise RuntimeError(f"Network error downloading '{display_name}': {str(e)}")
+    except BaseException:
+        spool.close()
+        raise
+
+    spool.seek(0)
+    return spool, digest.hexdigest()
+
+
+"""
+    Download one Canvas file and upload it to Gemini. Runs on a worker thread.
+    Skips the work if another transfer already failed (fail fast).
+    With a file_cache, a file already uploaded under this API key is reused instead.
+"""
+def _transfer_file(client, h_client, headers: dict, i: int, files: list, uploaded_files: list, failed: threading.Event, file_cache=None, api_key: str = None, max_bytes: int = MAX_FILE_BYTES, on_progress=None):
+    file_info = files[i]
+    url = file_info["url"]
+    display_name = file_info.get("display_name", f"file_{i}")
+    content_type = file_info.get("content_type", "application/pdf")
+
+    if failed.is_set():
+        return None
+
+    def report(stage: str) -> None:
+        if on_progress:
+            on_progress({"stage": stage, "file": i + 1, "total": len(files), "display_name": display_name})
+
+    meta_key = metadata_cache_key(file_info) if file_cache else None
+    if meta_key:
+        cached = _cached_upload(client, file_cache, api_key, meta_key)
+        if cached:
+            print(f"Reusing Gemini upload for '{display_name}'")
+            report("cached")
+            return cached
+
+    print(f"Downloading file {i + 1}/{len(files)}: {display_name}")
+    report("downloading")
+    spool, content_hash = _download_to_spool(h_client, url, headers, display_name, max_bytes, failed)
+    if spool is None or failed.is_set():
+        if spool is not None:
+            spool.close()
+        return None
+
+    with spool:
+        content_key = None
+        if file_cache:
+            content_key = content_cache_key(content_hash)
+            cached = _cached_upload(client, file_cache, api_key, content_key)
+            if cached:
+                print(f"Reusing Gemini upload for '{display_name}' (same content)")
+                report("cached")
+                return cached
+
+        print(f"Uploading '{display_name}' to Gemini...")
+        report("uploading")
+        try:
+            # The SDK reads the spool in chunks, so the upload doesn't load the whole file either
+            file_upload = client.files.upload(
+                file=spool,
+                config={"mime_type": content_type, "display_name": display_name}
+            )
+        except Exception as e:
+            raise RuntimeError(f"Failed to upload '{display_name}' to Gemini: {str(e)}")
+
+    if file_cache:
+        try:
+            stale_names = file_cache.store(api_key, [k for k in (meta_key, content_key) if k], file_upload)
+        except Exception as e:
+            print(f"Warning: could not cache Gemini upload for '{display_name}': {e}")
+        else:
+            # Cached uploads outlive this request; only evicted/replaced ones get deleted
+            for name in stale_names:
+                try:
+                    client.files.delete(name=name)
+                except Exception:
+                    pass
+            return file_upload
+
+    uploaded_files.append(file_upload)
+    return file_upload
+
+
+def _parse_quiz_json(raw_text: str) -> dict:
+    raw_text = raw_text.strip()
+
+    # Strip markdown code fences in case Gemini wraps the output anyway
+    raw_text = re.sub(r"^```(?:json)?\s*", "", raw_text)
+    raw_text = re.sub(r"\s*```$", "", raw_text)
+    raw_text = raw_text.strip()
+
+    try:
+        quiz_data = json.loads(raw_text)
+    except json.JSONDecodeError as e:
+        raise RuntimeError(
+            f"Gemini returned invalid JSON: {str(e)}. "
+            f"Raw response preview: {raw_text[:300]}"
+        )
+
+    if "questions" not in quiz_data or not isinstance(quiz_data["questions"], list):
+        raise RuntimeError(
+            "Gemini response is missing the 'questions' field or it is not a list."
+        )
+
+    return quiz_data
+
+
+"""
+    Stream the Gemini response and call on_question(question) for each question object as soon as it
+    is complete, instead of waiting for the whole JSON document.
+    Returns the parsed quiz like the non-streaming path.
+"""
+def _generate_streaming(client, contents: list, on_question) -> dict:
+    parser = QuestionStreamParser()
+    try:
+        for chunk in client.models.generate_content_stream(
+            model=GEMINI_MODEL,
+            contents=contents,
+            config=GENERATION_CONFIG
+        ):
+            for question in parser.feed(chunk.text or ""):
+                on_question(question)
+    except Exception as e:
+        raise RuntimeError(f"Gemini content generation failed: {str(e)}")
+
+    try:
+        return _parse_quiz_json(parser.text)
+    except RuntimeError:
+        # The caller has already been handed these questions; keep them rather than fail outright
+        if parser.questions:
+            print(f"Warning: Gemini stream ended with invalid JSON; keeping {len(parser.questions)} complete question(s)")
+            return {"questions": parser.questions, "salvaged": True}
+        raise
+
+
+def _salvage_questions(raw_text: str) -> list:
+    """Every complete question object in a truncated / malformed response."""
+    parser = QuestionStreamParser()
+    parser.feed(raw_text)
+    return parser.questions
+
+
+"""
+    The prompt section describing existing questions: a topic summary plus as many compact
+    "stem -> correct answer" lines as fit in the token budget (never the raw question objects).
+"""
+def _previous_questions_section(previous_questions: list, context) -> str:
+    section = (
+        f"{len(previous_questions)} questions already exist from previous quizzes for this course. "
+        f"They mostly cover: {topic_summary(previous_questions)}. "
+        "Write new questions rather than rewording existing ones; near-duplicates of existing questions will be discarded."
+    )
+    if context.lines:
+        section += f"\n\nExisting questions (question -> correct answer):\n{context.text}"
+    if context.truncated:
+        section += f"\n({context.truncated} more existing questions not shown)"
+    return section
+
+
+def _build_prompt(question_count: int, previous_section: str = "", shard_hint: str = None) -> str:
+    prompt = QUIZ_PROMPT.replace("exactly 5", f"exactly {question_count}").replace("Exactly 5", f"Exactly {question_count}")
+    if shard_hint:
+        prompt += f"\n\n{shard_hint}"
+    if previous_section:
+        prompt += f"\n\n{previous_section}"
+    return prompt
+
+
+def _generate_once(client, contents: list, on_question=None) -> dict:
+    if on_question:
+        return _generate_streaming(client, contents, on_question)
+
+    try:
+        gemini_response = client.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=contents,
+            config=GENERATION_CONFIG
+        )
+    except Exception as e:
+        raise RuntimeError(f"Gemini content generation failed: {str(e)}")
+
+    try:
+        return _parse_quiz_json(gemini_response.text)
+    except RuntimeError:
+        salvaged = _salvage_questions(gemini_response.text or "")
+        if salvaged:
+            print(f"Warning: Gemini returned invalid JSON; salvaged {len(salvaged)} complete question(s)")
+            return {"questions": salvaged, "salvaged": True}
+        raise
+
+
+def _shard_counts(question_count: int, shard_size: int) -> list:
+    """Split question_count into as few shards of at most shard_size as possible, sizes differing by at most one."""
+    shards = -(-question_count // shard_size)
+    base, extra = divmod(question_count, shards)
+    return [base + (1 if k < extra else 0) for k in range(shards)]
+
+
+def _shard_hint(shard: int, shards: int, files: list) -> str:
+    """
+    Steer each shard to a different slice of the material so the shards don't all write the same questions:
+    a partition of the files when there are enough of them, otherwise a part of the material in reading order.
+    """
+    hint = f"This is part {shard + 1} of {shards} of a larger quiz generated in parallel."
+    if len(files) >= shards:
+        names = [f.get("display_name", f"file_{i}") for i, f in enumerate(files) if i % shards == shard]
+        return hint + f" Base these questions on the following materials only: {', '.join(names)}."
+    return hint + (
+        f" Divide the combined materials into {shards} consecutive parts of roughly equal length, in reading order,"
+        f" and base these questions only on part {shard + 1}."
+    )
+
+
+class _QuestionCollector:
+    """
+    Collects generated questions (from one call, parallel shards or repair calls), setting aside invalid
+    questions for repair and dropping near-duplicates of previous questions and of each other, and
+    anything past the requested count.
+    """
+
+    def __init__(self, question_count: int, index: QuestionIndex, on_question=None):
+        self.question_count = question_count
+        self.index = index
+        self.on_question = on_question
+        self.questions = []
+        self.dropped = 0
+        # (question, problems) for questions that failed validation; re-requested by the repair loop
+        self.invalid = []
+        # Near-duplicates dropped since the last repair round; their slots are re-requested too
+        self.duplicates = []
+        # Set when a response was cut off / malformed and only its complete questions were kept
+        self.salvaged = False
+        self._lock = threading.Lock()
+
+    @property
+    def missing(self) -> int:
+        return self.question_count - len(self.questions)
+
+    def add_result(self, quiz: dict) -> None:
+        """Take a whole response; with streaming its questions already came in through add()."""
+        if quiz.get("salvaged"):
+            self.salvaged = True
+        if not self.on_question:
+            for question in quiz["questions"]:
+                self.add(question)
+
+    def add(self, question: dict) -> None:
+        problems = validate_question(question)
+        with self._lock:
+            if problems:
+                self.invalid.append((question, problems))
+                return
+            if self.index.is_duplicate(question):
+                self.dropped += 1
+                self.duplicates.append(question)
+                return
+            if len(self.questions) >= self.question_count:
+                return
+            self.index.add(question)
+            self.questions.append(question)
+            # Under the lock so streamed questions reach the caller in the same order as the final list
+            if self.on_question:
+                self.on_question(question)
+
+
+"""
+    Run a large request as several smaller Gemini calls over the same uploads, in parallel.
+    One failed / malformed shard only costs its own questions; the call fails only if every shard does.
+"""
+def _generate_sharded(client, uploads: list, files: list, question_count: int, shard_size: int, previous_section: str, collector: _QuestionCollector) -> None:
+    counts = _shard_counts(question_count, shard_size)
+    print(f"Generating {question_count} questions in {len(counts)} parallel shards...")
+
+    def run_shard(shard: int) -> dict:
+        prompt = _build_prompt(counts[shard], previous_section, _shard_hint(shard, len(counts), files))
+        # Streaming shards feed the collector as questions complete; otherwise shards are merged in order below
+        return _generate_once(client, uploads + [prompt], collector.add if collector.on_question else None)
+
+    results, errors = [None] * len(counts), []
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_PARALLEL_SHARDS, len(counts)))) as pool:
+        futures = {pool.submit(run_shard, shard): shard for shard in range(len(counts))}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except RuntimeError as e:
+                print(f"Warning: quiz shard {futures[future] + 1}/{len(counts)} failed: {e}")
+                errors.append(e)
+
+    if len(errors) == len(counts):
+        raise errors[0]
+
+    for quiz in results:
+        if quiz is not None:
+            collector.add_result(quiz)
+
+
+def _repair_prompt(count: int, previous_section: str, collector: _QuestionCollector) -> str:
+    notes = []
+    for question, problems in collector.invalid:
+        stem = question.get("question_stem") if isinstance(question, dict) else None
+        label = f'"{stem[:120]}"' if isinstance(stem, str) and stem.strip() else "A question"
+        notes.append(f"- {label} {'; '.join(problems)}")
+    for question in collector.duplicates:
+        notes.append(f'- "{question["question_stem"][:120]}" repeats an existing question')
+    if collector.salvaged:
+        notes.append("- The response was cut off before all questions were complete")
+
+    prompt = _build_prompt(count, previous_section)
+    prompt += "\n\nAn earlier response for this quiz had problems:\n" + "\n".join(notes)
+    if collector.questions:
+        accepted = "\n".join(f"- {q['question_stem']}" for q in collector.questions)
+        prompt += f"\n\nThese questions were accepted; write different ones:\n{accepted}"
+    return prompt
+
+
+"""
+    Re-request only what was lost to invalid questions, dropped near-duplicates or a cut-off response, a few questions per call,
+    instead of regenerating the whole quiz. Questions that are still missing after the last round are dropped.
+"""
+def _repair(client, uploads: list, previous_section: str, collector: _QuestionCollector, rounds: int) -> None:
+    for attempt in range(1, rounds + 1):
+        if collector.missing <= 0 or not (collector.invalid or collector.duplicates or collector.salvaged):
+            return
+        print(f"Repair round {attempt}: re-requesting {collector.missing} question(s) "
+              f"({len(collector.invalid)} invalid, {len(collector.duplicates)} duplicate)")
+        prompt = _repair_prompt(collector.missing, previous_section, collector)
+        collector.invalid, collector.duplicates, collector.salvaged = [], [], False
+        try:
+            quiz = _generate_once(client, uploads + [prompt], collector.add if collector.on_question else None)
+        except RuntimeError as e:
+            print(f"Warning: repair call failed: {e}")
+            return
+        collector.add_result(quiz)
+
+
 """
     Generate a multiple-choice quiz from a list of Canvas file URLs.
 
     Args:
-        files: List of dicts with keys: 'url', 'display_name', 'content_type'
+        files: List of dicts with keys: 'url', 'display_name', 'content_type' (optionally 'id', 'modified_at', 'size')
         canvas_token: Canvas API token used to authenticate file downloads
         gemini_token: Gemini API key for authentication
+        max_workers: How many files to download/upload concurrently
+        file_cache: Optional GeminiFileCache; cached uploads are reused and not deleted afterwards
+        http_client: Optional httpx.Client for the Canvas downloads; defaults to the shared pool in http_pool.py
+        max_file_bytes: Per-file size limit; files whose Canvas 'size' exceeds it are rejected before downloading
+        on_progress: Optional callback, called (from worker threads) with events like
+            {"stage": "downloading" | "uploading" | "cached", "file": i, "total": n, "display_name": ...} and {"stage": "generating"}
+        on_question: Optional callback; when set the response is streamed and each question dict is passed
+            to it as soon as Gemini finishes writing it (the full quiz is still returned at the end)
+        previous_questions: Existing questions (Gemini, stored or Canvas shape); summarized and compacted into the
+            prompt, and generated questions that are near-duplicates of them (or of each other) are dropped
+        context_token_budget: Estimated-token budget for the compacted previous questions in the prompt
+        max_repair_rounds: Follow-up calls that re-request only questions that failed validation, were dropped as
+            near-duplicates or were lost to a cut-off response (valid questions from a malformed response are kept)
+        shard_size: question_count above this is generated as parallel shards
+            (the result may then hold fewer questions if shards failed); None disables sharding
 
     Returns:
-        Dict with 'questions' list, each containing: question, options, answer, rationale
+        Dict with 'questions' list, each containing: question, options, answer, rationale,
+        and 'previous_context' (how many previous questions made it into the prompt / were truncated)
 
     Raises:
-        ValueError: If files list is empty or a file entry is missing a URL
-        RuntimeError: If any download, Gemini upload, or generation step fails
+        ValueError: If files list is empty, a file entry is missing a URL, or a file is over the size limit
+        RuntimeError: If any download, Gemini upload, or generation step fails, or no valid question was generated
     """
-def generate_quiz_from_files(files: list, canvas_token: str, gemini_token: str = None, previous_questions: list = None, question_count: int = 5) -> dict:
+def generate_quiz_from_files(files: list, canvas_token: str, gemini_token: str = None, previous_questions: list = None, question_count: int = 5, max_workers: int = MAX_PARALLEL_TRANSFERS, file_cache=None, max_file_bytes: int = MAX_FILE_BYTES, on_progress=None, on_question=None, shard_size: int = SHARD_QUESTIONS, context_token_budget: int = CONTEXT_TOKEN_BUDGET, max_repair_rounds: int = MAX_REPAIR_ROUNDS, http_client: httpx.Client = None) -> dict:
     if not files:
         raise ValueError("At least one file is required to generate a quiz.")
 
@@ -57,92 +503,75 @@ def generate_quiz_from_files(files: list, canvas_token: str, gemini_token: str =
     api_key = gemini_token or os.getenv("GEMINI_KEY")
     if not api_key:
         raise ValueError("No Gemini API key provided. Please add your Gemini API key in settings.")
+
+    for i, file_info in enumerate(files):
+        if not file_info.get("url"):
+            raise ValueError(f"File at index {i} is missing a 'url'.")
+        # Canvas reports the size up front, so oversized files never start downloading
+        _check_size(file_info.get("size"), file_info.get("display_name", f"file_{i}"), max_file_bytes)
     
     client = genai.Client(api_key=api_key)
 
     headers = {"Authorization": f"Bearer {canvas_token}"}
+    # Every successful upload lands here (even ones finishing after a failure) so the finally block can delete it
     uploaded_files = []
 
     try:
-        # Download each file from Canvas and upload to Gemini
-        for i, file_info in enumerate(files):
-            url = file_info.get("url")
-            display_name = file_info.get("display_name", f"file_{i}")
-            content_type = file_info.get("content_type", "application/pdf")
-
-            if not url:
-                raise ValueError(f"File at index {i} is missing a 'url'.")
-
-            print(f"Downloading file {i + 1}/{len(files)}: {display_name}")
+        # Download each file from Canvas and upload it to Gemini, several files at a time over the shared keep-alive pool
+        failed = threading.Event()
+        h_client = http_client or shared_sync_client()
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(files)))) as pool:
+            futures = {
+                pool.submit(_transfer_file, client, h_client, headers, i, files, uploaded_files, failed, file_cache, api_key, max_file_bytes, on_progress): i
+                for i in range(len(files))
+            }
+            ordered_uploads = [None] * len(files)
             try:
-                with httpx.Client(follow_redirects=True, timeout=30.0) as h_client:
-                    dl_response = h_client.get(url, headers=headers)
-            except httpx.TimeoutException:
-                raise RuntimeError(f"Timed out downloading '{display_name}' from Canvas.")
-            except httpx.RequestError as e:
-                raise RuntimeError(f"Network error downloading '{display_name}': {str(e)}")
-
-            if dl_response.status_code != 200:
-                raise RuntimeError(
-                    f"Failed to download '{display_name}' from Canvas "
-                    f"(HTTP {dl_response.status_code})."
-                )
-
-            print(f"Uploading '{display_name}' to Gemini...")
-            file_io = io.BytesIO(dl_response.content)
-            file_io.seek(0)
-
-            try:
-                file_upload = client.files.upload(
-                    file=file_io,
-                    config={"mime_type": content_type, "display_name": display_name}
-                )
-                uploaded_files.append(file_upload)
-            except Exception as e:
-                raise RuntimeError(f"Failed to upload '{display_name}' to Gemini: {str(e)}")
+                for future in as_completed(futures):
+                    ordered_uploads[futures[future]] = future.result()
+            except BaseException:
+                # Fail fast: stop queued transfers; in-flight ones finish and are cleaned up below
+                failed.set()
+                for future in futures:
+                    future.cancel()
+                raise
 
         # Generate quiz: pass all uploaded files + the structured prompt
-        print(f"Generating quiz from {len(uploaded_files)} file(s)...")
-        prompt = QUIZ_PROMPT.replace("exactly 5", f"exactly {question_count}").replace("Exactly 5", f"Exactly {question_count}")
-        if previous_questions:
-            prev_json = json.dumps(previous_questions, indent=2)
-            prompt += f"\n\nThe following questions already exist from previous quizzes. Do not duplicate them — use them as context for topic coverage and style:\n{prev_json}"
-        contents = uploaded_files + [prompt]
+        print(f"Generating quiz from {len(ordered_uploads)} file(s)...")
+        context = compact_previous_questions(previous_questions, context_token_budget)
+        previous_section = _previous_questions_section(previous_questions, context) if previous_questions else ""
+        if context.truncated:
+            print(f"Previous-question context: {context.truncated} of {context.total} question(s) truncated to fit {context_token_budget} tokens")
+        if on_progress:
+            on_progress({"stage": "generating"})
 
-        try:
-            gemini_response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=contents,
-                config={"response_mime_type": "application/json", "thinking_config": {"thinking_budget": 0}}
-            )
-        except Exception as e:
-            raise RuntimeError(f"Gemini content generation failed: {str(e)}")
+        index = QuestionIndex()
+        index.add_all(previous_questions)
+        collector = _QuestionCollector(question_count, index, on_question)
 
-        # Step 3: Parse the JSON response
-        raw_text = gemini_response.text.strip()
+        if shard_size and question_count > shard_size:
+            _generate_sharded(client, ordered_uploads, files, question_count, shard_size, previous_section, collector)
+        else:
+            contents = ordered_uploads + [_build_prompt(question_count, previous_section)]
+            collector.add_result(_generate_once(client, contents, collector.add if on_question else None))
 
-        # Strip markdown code fences in case Gemini wraps the output anyway
-        raw_text = re.sub(r"^```(?:json)?\s*", "", raw_text)
-        raw_text = re.sub(r"\s*```$", "", raw_text)
-        raw_text = raw_text.strip()
-
-        try:
-            quiz_data = json.loads(raw_text)
-        except json.JSONDecodeError as e:
-            raise RuntimeError(
-                f"Gemini returned invalid JSON: {str(e)}. "
-                f"Raw response preview: {raw_text[:300]}"
-            )
-
-        if "questions" not in quiz_data or not isinstance(quiz_data["questions"], list):
-            raise RuntimeError(
-                "Gemini response is missing the 'questions' field or it is not a list."
-            )
+        _repair(client, ordered_uploads, previous_section, collector, max_repair_rounds)
 
-        return quiz_data
+        if collector.dropped:
+            print(f"Dropped {collector.dropped} generated question(s) that duplicate existing ones")
+        if not collector.questions:
+            if collector.invalid:
+                _, problems = collector.invalid[0]
+                raise RuntimeError(f"Gemini did not return any valid questions (e.g. a question {'; '.join(problems)}).")
+            if collector.dropped:
+                raise RuntimeError("Every question Gemini returned duplicates an existing question.")
+            raise RuntimeError("Gemini did not return any questions.")
+        if collector.missing > 0:
+            print(f"Warning: returning {len(collector.questions)} of {question_count} requested questions; repair could not make up the rest")
+        return {"questions": collector.questions, "previous_context": context.report()}
 
     finally:
-        # Best-effort cleanup: delete uploaded files from Gemini's servers
+        # Best-effort cleanup: delete this request's (uncached) uploads from Gemini's servers
         for uploaded in uploaded_files:
             try:
                 client.files.delete(name=uploaded.name)
@@ -0,0 +1,158 @@
+"""
+QUIZ GENERATION JOBS
+- POST /api/generate-quiz/jobs enqueues a generation and returns a job id right away; a small pool of
+  worker tasks runs the jobs, so a slow download / upload / Gemini call doesn't hold an HTTP request
+  (and whatever proxy sits in front of it) open for tens of seconds
+- Each job keeps an ordered list of progress events, e.g.
+    {"stage": "downloading", "file": 2, "total": 3, "display_name": "notes.pdf"}
+    {"stage": "generating"}
+    {"stage": "completed", "result": {...}}
+  clients poll the status endpoint or follow the server-sent-events stream
+- In-process: jobs live in this server process's memory and are dropped JOB_TTL after they finish
+
+Usage:
+    queue = GenerationQueue(workers=2)
+    await queue.start()                                      # on app startup
+    job = queue.submit(owner, lambda progress: run(..., on_progress=progress))
+    async for index, event in queue.follow(job): ...
+"""
+
+import asyncio
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+JOB_TTL_SECONDS = 3600.0
+
+# A job's run function receives a thread-safe progress callback and returns the job result
+JobRunner = Callable[[Callable[[dict], None]], Awaitable[Any]]
+
+
+class QueueFullError(RuntimeError):
+    """Too many generations are already waiting."""
+
+
+class GenerationJob:
+
+    def __init__(self, owner: str):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.status = "queued"  # queued | running | completed | failed
+        self.events: List[dict] = []
+        self.result: Any = None
+        self.error: Optional[dict] = None
+        self.finished_at: Optional[float] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def snapshot(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": self.events[-1] if self.events else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class GenerationQueue:
+
+    def __init__(self, workers: int = 2, max_pending: int = 100, job_ttl: float = JOB_TTL_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self._clock = clock
+        self._jobs: Dict[str, GenerationJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, owner: str, run: JobRunner) -> GenerationJob:
+        if self._queue is None:
+            raise RuntimeError("Generation queue is not running.")
+        if self._queue.qsize() >= self.max_pending:
+            raise QueueFullError("Too many quizzes are being generated right now. Please try again shortly.")
+
+        self._prune()
+        job = GenerationJob(owner)
+        self._jobs[job.id] = job
+        self._record(job, {"stage": "queued"})
+        self._queue.put_nowait((job, run))
+        return job
+
+    def get(self, job_id: str, owner: str) -> Optional[GenerationJob]:
+        """The job, or None if it doesn't exist (or belongs to someone else)."""
+        job = self._jobs.get(job_id)
+        return job if job is not None and job.owner == owner else None
+
+    async def follow(self, job: GenerationJob, since: int = 0) -> AsyncIterator[Tuple[int, dict]]:
+        """Yield (index, event) for every event from `since` on, waiting for new ones until the job is done."""
+        index = since
+        while True:
+            changed = job._changed
+            while index < len(job.events):
+                yield index, job.events[index]
+                index += 1
+            if job.done:
+                return
+            await changed.wait()
+
+    def progress_callback(self, job: GenerationJob) -> Callable[[dict], None]:
+        # Generation mostly runs in a threadpool, so reports from there hop back onto the event loop first
+        loop = self._loop
+
+        def report(event: dict) -> None:
+            try:
+                on_loop = asyncio.get_running_loop() is loop
+            except RuntimeError:
+                on_loop = False
+            if on_loop:
+                self._record(job, event)
+            else:
+                loop.call_soon_threadsafe(self._record, job, event)
+
+        return report
+
+    async def _work(self) -> None:
+        while True:
+            job, run = await self._queue.get()
+            job.status = "running"
+            self._record(job, {"stage": "started"})
+            try:
+                job.result = await run(self.progress_callback(job))
+            except Exception as e:
+                # HTTPException-style errors keep their status code so clients can tell 4xx from 5xx
+                job.error = {"status_code": getattr(e, "status_code", 500), "detail": getattr(e, "detail", None) or str(e)}
+                job.status = "failed"
+                self._record(job, {"stage": "failed", "error": job.error})
+            else:
+                job.status = "completed"
+                self._record(job, {"stage": "completed", "result": job.result})
+            finally:
+                job.finished_at = self._clock()
+                self._queue.task_done()
+
+    def _record(self, job: GenerationJob, event: dict) -> None:
+        job.events.append(event)
+        # Wake everyone following the job, then arm a fresh event for the next update
+        job._changed.set()
+        job._changed = asyncio.Event()
+
+    def _prune(self) -> None:
+        cutoff = self._clock() - self.job_ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at is not None and j.finished_at < cutoff]:
+            del self._jobs[job_id]
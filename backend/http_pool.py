@@ -0,0 +1,114 @@
+"""
+SHARED HTTP CONNECTION POOLS
+- One process-wide pool per client type instead of a fresh connection (TCP + TLS handshake to
+  ufl.instructure.com) for every Canvas call:
+    shared_session()       requests.Session   - CanvasContentRetriever
+    shared_sync_client()   httpx.Client       - Canvas file downloads in gemini_retriever
+    shared_async_client()  httpx.AsyncClient  - AsyncCanvasClient (every async route)
+- Connections are kept alive between calls; HTTP/2 is used by the httpx clients when the optional
+  h2 package is installed (pip install "httpx[http2]"), otherwise they stay on HTTP/1.1
+- Pool size, keep-alive and timeouts are tuned here once (CANVAS_POOL_* env vars)
+- The clients are thread-safe; the async client is bound to the event loop that created it, so a
+  different loop (e.g. a new test) gets its own
+- Every call through these pools is scheduled by the per-token Canvas rate limiter (canvas_rate_limit.py)
+- Every consumer also accepts an explicit session / client, which tests use to inject fakes
+"""
+
+import asyncio
+import importlib.util
+import os
+import threading
+from typing import Dict, Optional
+
+import httpx
+import requests
+
+from canvas_rate_limit import RateLimitedAdapter, RateLimitedAsyncTransport, RateLimitedTransport, canvas_rate_limits
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+POOL_CONNECTIONS = int(os.getenv("CANVAS_POOL_CONNECTIONS", "20"))
+POOL_KEEPALIVE_CONNECTIONS = int(os.getenv("CANVAS_POOL_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("CANVAS_POOL_KEEPALIVE_EXPIRY", "30"))
+CONNECT_TIMEOUT_SECONDS = 10.0
+READ_TIMEOUT_SECONDS = 30.0
+
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_sync_client: Optional[httpx.Client] = None
+_async_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+
+def pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=POOL_CONNECTIONS,
+        max_keepalive_connections=POOL_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS
+    )
+
+
+def pool_timeout() -> httpx.Timeout:
+    return httpx.Timeout(READ_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS)
+
+
+class _PooledSession(requests.Session):
+    # requests has no session-wide timeout; without one a stalled Canvas call would hang its thread forever
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (CONNECT_TIMEOUT_SECONDS, READ_TIMEOUT_SECONDS))
+        return super().request(method, url, **kwargs)
+
+
+def shared_session() -> requests.Session:
+    global _session
+    with _lock:
+        if _session is None:
+            session = _PooledSession()
+            adapter = RateLimitedAdapter(canvas_rate_limits, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_CONNECTIONS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def shared_sync_client() -> httpx.Client:
+    global _sync_client
+    with _lock:
+        if _sync_client is None:
+            # With an explicit transport, http2 / limits have to be set on the transport rather than the client
+            transport = httpx.HTTPTransport(http2=HTTP2_AVAILABLE, limits=pool_limits())
+            _sync_client = httpx.Client(
+                transport=RateLimitedTransport(transport, canvas_rate_limits), timeout=pool_timeout(), follow_redirects=True
+            )
+        return _sync_client
+
+
+def shared_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    with _lock:
+        # Drop clients whose loop is gone (only happens outside the server, e.g. between tests)
+        for stale in [l for l in _async_clients if l.is_closed()]:
+            del _async_clients[stale]
+        client = _async_clients.get(loop)
+        if client is None:
+            transport = httpx.AsyncHTTPTransport(http2=HTTP2_AVAILABLE, limits=pool_limits())
+            client = httpx.AsyncClient(
+                transport=RateLimitedAsyncTransport(transport, canvas_rate_limits), timeout=pool_timeout(), follow_redirects=True
+            )
+            _async_clients[loop] = client
+        return client
+
+
+async def aclose_shared_clients() -> None:
+    """Close every pool (call on app shutdown)."""
+    global _session, _sync_client
+    with _lock:
+        async_client = _async_clients.pop(asyncio.get_running_loop(), None)
+        session, sync_client = _session, _sync_client
+        _session, _sync_client = None, None
+
+    if async_client is not None:
+        await async_client.aclose()
+    if sync_client is not None:
+        sync_client.close()
+    if session is not None:
+        session.close()
@@ -13,27 +13,58 @@ MAIN API SERVER - MongoDB Version
 """
 
 from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, ConfigDict
 import os
+import asyncio
 import httpx
 import uuid
 import json
-from datetime import datetime, timezone
+import time
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 from bson import ObjectId
-from database import get_or_create_user, update_user, users_collection, course_quizzes_collection, init_db, user_has_tokens
-from clerk_auth import verify_clerk_token
-from canvas_retriever import CanvasContentRetriever
-from gemini_retriever import generate_quiz_from_files
-from canvas_publisher import publish_quiz_to_canvas, publish_existing_canvas_quiz, unpublish_canvas_quiz, update_item_points_on_canvas, fetch_canvas_quiz_items, fetch_canvas_quiz_title, get_all_new_quizzes_for_course, delete_quiz_from_canvas
+from pymongo import ReturnDocument
+from database import get_or_create_user, update_user, users_collection, course_quizzes_collection, gemini_files_collection, publish_jobs_collection, quiz_results_collection, init_db, user_has_tokens
+from clerk_auth import verify_clerk_token, fetch_clerk_profile
+from canvas_client import AsyncCanvasClient
+from canvas_publisher import PublishError, ShellNotFoundError
+from fan_out import fan_out
+from http_pool import aclose_shared_clients
+from canvas_rate_limit import canvas_rate_limits
+from gemini_retriever import generate_quiz_from_files, GEMINI_MODEL
+from gemini_file_cache import GeminiFileCache
+from quiz_result_cache import QuizResultCache, RESULT_TTL, result_cache_key
+from publish_jobs import PublishJobStore, JobInProgressError
+from quiz_sync import plan_canvas_sync
+from generation_jobs import GenerationQueue, QueueFullError
 import markdown as md_lib
-from encryption import encrypt, decrypt
+from encryption import encrypt, decrypt, init_vault
+from ttl_cache import TTLCache
 
 load_dotenv()
 
+CANVAS_URL = "https://ufl.instructure.com"
+
 app = FastAPI()
 
+# Gemini uploads of Canvas files, reused across generations (see gemini_file_cache.py)
+gemini_file_cache = GeminiFileCache(
+    gemini_files_collection,
+    max_entries=int(os.getenv("GEMINI_FILE_CACHE_MAX_PER_KEY", "50"))
+)
+publish_jobs = PublishJobStore(publish_jobs_collection)
+quiz_result_cache = QuizResultCache(
+    quiz_results_collection,
+    ttl=timedelta(hours=float(os.getenv("QUIZ_RESULT_CACHE_TTL_HOURS", RESULT_TTL.total_seconds() / 3600)))
+)
+generation_queue = GenerationQueue(
+    workers=int(os.getenv("GENERATION_WORKERS", "2")),
+    max_pending=int(os.getenv("GENERATION_MAX_PENDING", "100"))
+)
+
 allowed_origins = os.getenv(
     "ALLOWED_ORIGINS",
     "http://localhost:3000,http://localhost:5173"
@@ -82,6 +113,11 @@ class FileInfo(BaseModel):
     url: str
     display_name: str
     content_type: str = "application/pdf"
+    # Canvas file metadata (optional) - lets repeat generations reuse cached Gemini uploads
+    id: int | None = None
+    modified_at: str | None = None
+    # Bytes, as reported by Canvas - oversized files are rejected before downloading
+    size: int | None = None
 
 class GenerateQuizRequest(BaseModel):
     files: list[FileInfo]
@@ -90,21 +126,61 @@ class GenerateQuizRequest(BaseModel):
     question_count: int = 5
     title: str = "Generated Practice Quiz"
     instructions: str = ""
+    # Stream questions back as server-sent events while Gemini is still writing the rest
+    stream: bool = False
+    # Reuse the result of an identical earlier request (see quiz_result_cache.py); force_fresh regenerates it
+    use_cache: bool = False
+    force_fresh: bool = False
+
+
+# Verified sessions: (sub, exp) -> user doc
+# Token verification itself is local (see clerk_auth); a hit here also skips the MongoDB upsert.
+# Entries never outlive the token's exp, and are dropped whenever the user doc is updated.
+session_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("AUTH_CACHE_TTL_SECONDS", "300"))
+)
+
+
+def invalidate_cached_user(clerk_id: str):
+    """Forget cached sessions for a user so the next request re-reads their document."""
+    session_cache.discard_where(lambda key: key[0] == clerk_id)
 
 
 async def get_current_user(authorization: str = Header(...)) -> dict:
     token = authorization.replace("Bearer ", "")
-    clerk_data = await verify_clerk_token(token)
-    
-    user_data = {
-        "email": clerk_data.get("email"),
-        "first_name": clerk_data.get("first_name"),
-        "last_name": clerk_data.get("last_name")
-    }
+    try:
+        clerk_data = await verify_clerk_token(token)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+    clerk_id = clerk_data["sub"]
+    cache_key = (clerk_id, clerk_data["exp"])
+    cached = session_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Session tokens usually don't carry profile fields; only pass them when they do
+    user_data = None
+    if clerk_data.get("email"):
+        user_data = {
+            "email": clerk_data.get("email"),
+            "first_name": clerk_data.get("first_name"),
+            "last_name": clerk_data.get("last_name")
+        }
     
-    user = get_or_create_user(clerk_data.get("sub"), user_data)
+    user = get_or_create_user(clerk_id, user_data)
+
+    # Lazy profile lookup: only hit the Clerk users API when we have no email on file yet
+    if not user.get("email"):
+        profile = await fetch_clerk_profile(clerk_id)
+        if profile:
+            user = get_or_create_user(clerk_id, profile)
+
+    session_cache.set(cache_key, user, ttl=min(session_cache.ttl, clerk_data["exp"] - time.time()))
     return user
 
+
 def assert_course_access(current_user: dict, course_id: int):
     """Raise 403 if the current user is not enrolled in the given course."""
     user_courses = current_user.get("courses", [])
@@ -116,6 +192,25 @@ def assert_course_access(current_user: dict, course_id: int):
 @app.on_event("startup")
 def startup():
     init_db()
+    try:
+        init_vault()
+    except RuntimeError as e:
+        print(f"Token vault not initialized: {e}")
+
+
+@app.on_event("startup")
+async def start_generation_queue():
+    await generation_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_generation_queue():
+    await generation_queue.stop()
+
+
+@app.on_event("shutdown")
+async def close_http_pools():
+    await aclose_shared_clients()
 
 @app.get("/")
 async def root():
@@ -150,11 +245,8 @@ async def save_tokens(
     
     # Verify Canvas token works by fetching courses
     try:
-        canvas = CanvasContentRetriever(
-            canvas_url="https://ufl.instructure.com",
-            access_token=tokens.canvas_token
-        )
-        courses = canvas.get_courses()
+        async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=tokens.canvas_token) as canvas:
+            courses = await canvas.get_courses()
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid Canvas token: {str(e)}")
     
@@ -170,6 +262,7 @@ async def save_tokens(
             "canvas_token": encrypt(tokens.canvas_token),
             "gemini_token": encrypt(tokens.gemini_token)
         })
+        invalidate_cached_user(current_user["clerk_id"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save tokens: {str(e)}")
     
@@ -220,22 +313,33 @@ async def sync_courses(current_user: dict = Depends(get_current_user)):
     canvas_token = decrypt(encrypted_canvas) if encrypted_canvas else os.getenv("CANVAS_TOKEN")
     if not canvas_token:
          raise HTTPException(status_code=400, detail="No Canvas token found. Please add your Canvas API token.")
-    canvas = CanvasContentRetriever(
-        canvas_url="https://ufl.instructure.com",
-        access_token=canvas_token
-    )
-
     try:
-        courses = canvas.get_courses()
+        async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=canvas_token) as canvas:
+            courses = await canvas.get_courses()
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Failed to fetch courses from Canvas: {str(e)}")
 
     # Save courses to user's document in MongoDB
     update_user(current_user["clerk_id"], {"courses": courses})
+    invalidate_cached_user(current_user["clerk_id"])
 
     return {"courses_synced": len(courses), "courses": courses}
 
 
+"""
+Canvas throttle metrics for the current user's token (see canvas_rate_limit.py):
+remaining budget estimate, estimated cost per call, in-flight calls, current concurrency limit,
+and how often / how long calls were queued or answered with "Rate Limit Exceeded".
+"""
+@app.get("/api/canvas/rate-limit")
+async def canvas_rate_limit_metrics(current_user: dict = Depends(get_current_user)):
+    encrypted_canvas = current_user.get("canvas_token")
+    canvas_token = decrypt(encrypted_canvas) if encrypted_canvas else os.getenv("CANVAS_TOKEN")
+    if not canvas_token:
+        raise HTTPException(status_code=400, detail="No Canvas token found. Please add your Canvas API token.")
+    return canvas_rate_limits.metrics_for(canvas_token)
+
+
 """
 Retrieves all quizzes for a given course from Canvas.
 This function should be called every time an instructor tries to make a new quiz. If a quiz's metadata is not in MongoDB, a new Mongo document will be made for it at this point.
@@ -264,13 +368,9 @@ async def retrieve_quizzes(course_id: int, current_user: dict = Depends(get_curr
     if not canvas_token:
           raise HTTPException(status_code=400, detail="No Canvas token found. Please add your Canvas API token.")
 
-    canvas = CanvasContentRetriever(
-        canvas_url="https://ufl.instructure.com",
-        access_token=canvas_token
-    )
-
     try:
-        quizzes = canvas.get_course_quizzes(course_id)
+        async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=canvas_token) as canvas:
+            quizzes = await canvas.get_course_quizzes(course_id)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Failed to fetch quizzes from Canvas: {str(e)}")
     return {"quiz_count": len(quizzes), "quizzes": quizzes}
@@ -306,13 +406,9 @@ async def retrieve_files(course_id: int, current_user: dict = Depends(get_curren
     if not canvas_token:
          raise HTTPException(status_code=400, detail="No Canvas token found. Please add your Canvas API token.")
 
-    canvas = CanvasContentRetriever(
-        canvas_url="https://ufl.instructure.com",
-        access_token=canvas_token
-    )
-
     try:
-        files = canvas.get_course_files(course_id)
+        async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=canvas_token) as canvas:
+            files = await canvas.get_course_files(course_id)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Failed to fetch files from Canvas: {str(e)}")
 
@@ -347,13 +443,9 @@ async def retrieve_quiz_questions(course_id: int, quiz_id: int, current_user: di
     if not canvas_token:
          raise HTTPException(status_code=400, detail="No Canvas token found. Please add your Canvas API token.")
 
-    canvas = CanvasContentRetriever(
-        canvas_url="https://ufl.instructure.com",
-        access_token=canvas_token
-    )
-
     try:
-        questions = canvas.get_quiz_questions(course_id, quiz_id)
+        async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=canvas_token) as canvas:
+            questions = await canvas.get_quiz_questions(course_id, quiz_id)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Failed to fetch quiz questions from Canvas: {str(e)}")
 
@@ -382,13 +474,9 @@ async def retrieve_assignment_groups(course_id: int, current_user: dict = Depend
     if not canvas_token:
         raise HTTPException(status_code=400, detail="No Canvas token found.")
 
-    canvas = CanvasContentRetriever(
-        canvas_url="https://ufl.instructure.com",
-        access_token=canvas_token
-    )
-
     try:
-        groups = canvas.get_assignment_groups(course_id)
+        async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=canvas_token) as canvas:
+            groups = await canvas.get_assignment_groups(course_id)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Failed to fetch assignment groups from Canvas: {str(e)}")
 
@@ -397,6 +485,139 @@ async def retrieve_assignment_groups(course_id: int, current_user: dict = Depend
 
 @app.post("/api/generate-quiz")
 async def generate_quiz(body: GenerateQuizRequest, current_user: dict = Depends(get_current_user)):
+    if body.stream:
+        return StreamingResponse(
+            stream_generated_quiz(body, current_user), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+        )
+    return await create_generated_quiz(body, current_user)
+
+
+# Streaming generations still running; the event loop only keeps weak references to tasks, so without
+# this a generation whose client disconnected could be garbage-collected before it saves
+streaming_generations: set = set()
+
+
+async def stream_generated_quiz(body: GenerateQuizRequest, current_user: dict):
+    """
+    Server-sent events for a streaming generation:
+        event: question  - {"index", "question"} as soon as Gemini finishes writing each question
+        event: saved     - the same body the non-streaming endpoint returns
+        event: error     - {"status_code", "detail"}
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    question_count = 0
+
+    def on_question(question: dict) -> None:
+        # Called from the generation thread
+        loop.call_soon_threadsafe(events.put_nowait, ("question", question))
+
+    async def run() -> None:
+        try:
+            result = await create_generated_quiz(body, current_user, on_question=on_question)
+            events.put_nowait(("saved", result))
+        except HTTPException as e:
+            events.put_nowait(("error", {"status_code": e.status_code, "detail": e.detail}))
+        except Exception as e:
+            events.put_nowait(("error", {"status_code": 500, "detail": str(e)}))
+
+    # If the client disconnects the generation still finishes and the quiz is saved as a draft
+    task = asyncio.create_task(run())
+    streaming_generations.add(task)
+    task.add_done_callback(streaming_generations.discard)
+    while True:
+        kind, data = await events.get()
+        if kind == "question":
+            data = {"index": question_count, "question": data}
+            question_count += 1
+        yield f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+        if kind != "question":
+            return
+
+
+@app.post("/api/generate-quiz/jobs", status_code=202)
+async def enqueue_generate_quiz(body: GenerateQuizRequest, current_user: dict = Depends(get_current_user)):
+    """Queue a generation and return its job id right away; follow it via the status or events endpoint."""
+    if body.course_id:
+        assert_course_access(current_user, body.course_id)
+    try:
+        job = generation_queue.submit(
+            current_user["clerk_id"],
+            lambda progress: create_generated_quiz(
+                body, current_user, on_progress=progress,
+                on_question=lambda question: progress({"stage": "question", "question": question})
+            )
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"job_id": job.id, "status": job.status}
+
+
+@app.get("/api/generate-quiz/jobs/{job_id}")
+async def get_generate_quiz_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = generation_queue.get(job_id, current_user["clerk_id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Generation job not found.")
+    return job.snapshot()
+
+
+@app.get("/api/generate-quiz/jobs/{job_id}/events")
+async def stream_generate_quiz_job(job_id: str, since: int = 0, current_user: dict = Depends(get_current_user)):
+    """Server-sent events: one `data:` line per progress event; the stream ends when the job completes or fails."""
+    job = generation_queue.get(job_id, current_user["clerk_id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Generation job not found.")
+
+    async def event_stream():
+        async for index, event in generation_queue.follow(job, since):
+            yield f"id: {index}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+async def generate_questions(body: GenerateQuizRequest, current_user: dict, files: list, canvas_token: str, gemini_token: str, on_progress=None, on_question=None) -> dict:
+    """Gather previous-question context and run the Gemini pipeline; returns its raw output."""
+    # Fetch questions from any previously selected quizzes
+    previous_questions = []
+    if body.course_id and body.quiz_ids:
+        if on_progress:
+            on_progress({"stage": "fetching_previous_quizzes", "total": len(body.quiz_ids)})
+        async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=canvas_token) as canvas:
+            outcome = await fan_out(body.quiz_ids, lambda quiz_id: canvas.get_quiz_questions(body.course_id, quiz_id))
+        for questions in outcome.results:
+            previous_questions.extend(questions or [])
+        for failure in outcome.failures:
+            print(f"Warning: could not fetch questions for quiz {failure['item']}: {failure['error']}")
+
+    # Quizzes already generated for this course count as existing questions too, even drafts never sent to Canvas
+    if body.course_id:
+        for doc in course_quizzes_collection.find(
+            {"course_id": body.course_id, "created_by_clerk_id": current_user["clerk_id"]},
+            # The correct choice goes into the prompt next to each stem (see prompt_context.compact_line)
+            {"questions.question_stem_html": 1, "questions.choices.text_html": 1, "questions.choices.is_correct": 1}
+        ):
+            previous_questions.extend(doc.get("questions", []))
+
+    # Gemini SDK + file downloads are blocking, so run them off the event loop
+    try:
+        quiz = await run_in_threadpool(
+            generate_quiz_from_files, files, canvas_token, gemini_token, previous_questions, body.question_count,
+            file_cache=gemini_file_cache, on_progress=on_progress, on_question=on_question
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+    return quiz
+
+
+async def create_generated_quiz(body: GenerateQuizRequest, current_user: dict, on_progress=None, on_question=None) -> dict:
+    """
+    Fetch previous-quiz context, generate questions with Gemini (or reuse a cached result) and save the quiz as a draft.
+    Shared by the blocking endpoint, the streaming endpoint and the job queue.
+    on_progress (optional) receives progress events; on_question (optional) streams each generated question.
+    """
     encrypted_canvas = current_user.get("canvas_token")
     canvas_token = decrypt(encrypted_canvas) if encrypted_canvas else os.getenv("CANVAS_TOKEN")
     if not canvas_token:
@@ -408,26 +629,23 @@ async def generate_quiz(body: GenerateQuizRequest, current_user: dict = Depends(
         raise HTTPException(status_code=400, detail="No Gemini API key found. Please add your Gemini API key.")
     files = [f.model_dump() for f in body.files]
 
-    # Fetch questions from any previously selected quizzes
-    previous_questions = []
-    if body.course_id and body.quiz_ids:
-        canvas = CanvasContentRetriever(
-            canvas_url="https://ufl.instructure.com",
-            access_token=canvas_token
-        )
-        for quiz_id in body.quiz_ids:
-            try:
-                questions = canvas.get_quiz_questions(body.course_id, quiz_id)
-                previous_questions.extend(questions)
-            except Exception as e:
-                print(f"Warning: could not fetch questions for quiz {quiz_id}: {e}")
-
-    try:
-        quiz = generate_quiz_from_files(files, canvas_token, gemini_token, previous_questions, body.question_count)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except RuntimeError as e:
-        raise HTTPException(status_code=502, detail=str(e))
+    # Opt-in: a repeat of the same selection returns the earlier Gemini result
+    cache_key = result_cache_key(files, body.question_count, body.course_id, body.quiz_ids) if body.use_cache else None
+    quiz = None
+    if cache_key and not body.force_fresh:
+        quiz = quiz_result_cache.lookup(current_user["clerk_id"], cache_key)
+
+    if quiz is not None:
+        print("Using cached generation result")
+        if on_progress:
+            on_progress({"stage": "cached_result"})
+        if on_question:
+            for question in quiz.get("questions", []):
+                on_question(question)
+    else:
+        quiz = await generate_questions(body, current_user, files, canvas_token, gemini_token, on_progress, on_question)
+        if cache_key:
+            quiz_result_cache.store(current_user["clerk_id"], cache_key, quiz)
 
     print("\n--- GENERATED QUIZ ---")
     print(json.dumps(quiz, indent=2))
@@ -476,7 +694,8 @@ async def generate_quiz(body: GenerateQuizRequest, current_user: dict = Depends(
         "generation_metadata": {
             "source_file_display_names": [f["display_name"] for f in files],
             "source_prev_quiz_ids": body.quiz_ids,
-            "gemini_model_used": "gemini-2.5-flash"
+            "gemini_model_used": GEMINI_MODEL,
+            "previous_context": quiz.get("previous_context")
         },
         "publish_metadata": {
             "published_at": None,
@@ -486,6 +705,8 @@ async def generate_quiz(body: GenerateQuizRequest, current_user: dict = Depends(
 
     result = course_quizzes_collection.insert_one(quiz_doc)
     print(f"Saved quiz to MongoDB with id: {result.inserted_id}")
+    if on_progress:
+        on_progress({"stage": "saved", "quiz_id": str(result.inserted_id)})
 
     return {"quiz_id": str(result.inserted_id), "questions": questions}
 
@@ -504,23 +725,20 @@ async def get_assessly_quizzes(course_id: int, current_user: dict = Depends(get_
 
     sync_warning = False
     if canvas_token:
-        published_docs = [d for d in docs if d.get("status") in ("published_on_canvas", "saved_to_canvas") and d.get("new_quiz_id")]
+        # publish_failed docs can point at a half-built shell too; if that shell is gone they must be freed as well
+        published_docs = [
+            d for d in docs
+            if d.get("status") in ("published_on_canvas", "saved_to_canvas", "publish_failed") and d.get("new_quiz_id")
+        ]
         if published_docs:
             try:
-                canvas_quizzes = get_all_new_quizzes_for_course(course_id, canvas_token)
+                async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=canvas_token) as canvas:
+                    canvas_quizzes = await canvas.get_all_new_quizzes_for_course(course_id)
                 for doc in published_docs:
                     quiz_id_str = str(doc["new_quiz_id"])
                     if quiz_id_str not in canvas_quizzes:
-                        # Quiz was deleted from Canvas — revert to draft
-                        course_quizzes_collection.update_one(
-                            {"_id": doc["_id"]},
-                            {"$set": {
-                                "status": "generated_pending_review",
-                                "new_quiz_id": None,
-                                "assignment_id": None,
-                                "updated_at": datetime.now(timezone.utc)
-                            }}
-                        )
+                        # Quiz was deleted from Canvas — revert to draft, dropping its item ids like revert_to_draft does
+                        forget_canvas_quiz(doc["_id"], status="generated_pending_review")
                         doc["status"] = "generated_pending_review"
                         doc["new_quiz_id"] = None
                     else:
@@ -574,7 +792,8 @@ async def get_quiz(quiz_id: str, current_user: dict = Depends(get_current_user))
 async def sync_from_canvas(quiz_id: str, current_user: dict = Depends(get_current_user)):
     """
     Pulls the latest quiz data from Canvas and updates MongoDB if anything changed.
-    Compares title, question order, question text, and answer choices.
+    Compares title, question order, question text, and answer choices; items whose canvas_hash
+    matches the last sync are skipped, and only the changed questions are written back.
     Returns the updated quiz doc and a list of internal_question_ids that had changes.
     Only applies to quizzes that are saved or published on Canvas.
     """
@@ -603,148 +822,86 @@ async def sync_from_canvas(quiz_id: str, current_user: dict = Depends(get_curren
         raise HTTPException(status_code=400, detail="No Canvas token found.")
 
     try:
-        canvas_title = fetch_canvas_quiz_title(course_id, str(new_quiz_id), canvas_token)
-        canvas_items = fetch_canvas_quiz_items(course_id, str(new_quiz_id), canvas_token)
+        async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=canvas_token) as canvas:
+            canvas_title = await canvas.fetch_canvas_quiz_title(course_id, str(new_quiz_id))
+            canvas_items = await canvas.fetch_canvas_quiz_items(course_id, str(new_quiz_id))
     except RuntimeError as e:
         raise HTTPException(status_code=502, detail=str(e))
 
-    # Build a lookup of our stored questions by canvas_item_id
-    stored_by_canvas_id = {
-        str(q["canvas_item_id"]): q
-        for q in quiz.get("questions", [])
-        if q.get("canvas_item_id")
-    }
+    plan = plan_canvas_sync(quiz, canvas_title, canvas_items)
+    if not plan.set_fields:
+        quiz["_id"] = str(quiz["_id"])
+        return {"quiz": quiz, "changed_question_ids": plan.changed_question_ids}
 
-    db_updates = {}
-    changed_question_ids = []
-
-    # Check title
-    if canvas_title and canvas_title != quiz.get("title", ""):
-        db_updates["title"] = canvas_title
-
-    # Sort canvas items by position to determine ordering
-    canvas_items_sorted = sorted(canvas_items, key=lambda x: x.get("position", 0))
-
-    new_questions = list(quiz.get("questions", []))
-
-    for canvas_item in canvas_items_sorted:
-        canvas_item_id = str(canvas_item.get("id", ""))
-        entry = canvas_item.get("entry", {})
-        stored_q = stored_by_canvas_id.get(canvas_item_id)
-
-        if not stored_q:
-            # New question added directly in Canvas — build a new question doc for it
-            canvas_choices = entry.get("interaction_data", {}).get("choices", [])
-            correct_id = entry.get("scoring_data", {}).get("value", "")
-            new_q_id = str(uuid.uuid4())
-            new_q = {
-                "internal_question_id": new_q_id,
-                "canvas_item_id": canvas_item_id,
-                "type": "multiple_choice",
-                "position": canvas_item.get("position", len(new_questions) + 1),
-                "points_possible": canvas_item.get("points_possible", 1),
-                "question_stem_html": entry.get("item_body", ""),
-                "overall_rationale_html": "",
-                "publish_error": None,
-                "choices": [
-                    {
-                        "internal_choice_id": str(c["id"]),
-                        "position": idx + 1,
-                        "text_html": c.get("item_body", ""),
-                        "is_correct": str(c["id"]) == correct_id,
-                    }
-                    for idx, c in enumerate(canvas_choices)
-                ],
-            }
-            new_questions.append(new_q)
-            changed_question_ids.append(new_q_id)
-            continue
-
-        q_idx = next(i for i, q in enumerate(new_questions) if str(q.get("canvas_item_id")) == canvas_item_id)
-        q_changed = False
-        updated_q = dict(new_questions[q_idx])
-
-        # Check position/ordering
-        canvas_position = canvas_item.get("position")
-        if canvas_position and canvas_position != updated_q.get("position"):
-            updated_q["position"] = canvas_position
-            q_changed = True
-
-        # Check points
-        canvas_points = canvas_item.get("points_possible")
-        if canvas_points is not None and canvas_points != updated_q.get("points_possible"):
-            updated_q["points_possible"] = canvas_points
-            q_changed = True
-
-        # Check question stem (item_body lives in entry)
-        canvas_stem = entry.get("item_body", "")
-        if canvas_stem and canvas_stem != updated_q.get("question_stem_html", ""):
-            updated_q["question_stem_html"] = canvas_stem
-            q_changed = True
-
-        # Check answer choices — match by internal_choice_id which we set as the Canvas choice id
-        canvas_choices = entry.get("interaction_data", {}).get("choices", [])
-        if canvas_choices:
-            canvas_choice_by_id = {str(c["id"]): c for c in canvas_choices}
-            correct_id = entry.get("scoring_data", {}).get("value", "")
-            stored_choice_ids = {stored_c["internal_choice_id"] for stored_c in updated_q.get("choices", [])}
-            new_choices = []
-
-            # Update or drop existing stored choices
-            for stored_c in updated_q.get("choices", []):
-                c_id = stored_c["internal_choice_id"]
-                canvas_c = canvas_choice_by_id.get(c_id)
-                if not canvas_c:
-                    # Choice was removed in Canvas — drop it
-                    q_changed = True
-                    continue
-                updated_c = dict(stored_c)
-                if canvas_c.get("item_body", "") != stored_c.get("text_html", ""):
-                    updated_c["text_html"] = canvas_c["item_body"]
-                    q_changed = True
-                updated_c["is_correct"] = (c_id == correct_id)
-                if updated_c["is_correct"] != stored_c["is_correct"]:
-                    q_changed = True
-                new_choices.append(updated_c)
-
-            # Pick up any new choices added directly in Canvas
-            for canvas_c in canvas_choices:
-                c_id = str(canvas_c["id"])
-                if c_id not in stored_choice_ids:
-                    new_choices.append({
-                        "internal_choice_id": c_id,
-                        "position": len(new_choices) + 1,
-                        "text_html": canvas_c.get("item_body", ""),
-                        "is_correct": (c_id == correct_id),
-                    })
-                    q_changed = True
-
-            updated_q["choices"] = new_choices
-
-        if q_changed:
-            new_questions[q_idx] = updated_q
-            changed_question_ids.append(updated_q["internal_question_id"])
-
-    # Remove questions that no longer exist on Canvas
-    canvas_item_ids = {str(item.get("id", "")) for item in canvas_items}
-    new_questions = [q for q in new_questions if not q.get("canvas_item_id") or str(q.get("canvas_item_id")) in canvas_item_ids]
-
-    # Always sync question_count to the true count after additions and deletions
-    if len(new_questions) != quiz.get("question_count"):
-        db_updates["question_count"] = len(new_questions)
-
-    # Re-sort questions by their (possibly updated) position
-    new_questions.sort(key=lambda q: q.get("position", 0))
-
-    if db_updates or changed_question_ids:
-        db_updates["questions"] = new_questions
+    db_updates = dict(plan.set_fields)
+    if plan.content_changed:
         db_updates["updated_at"] = datetime.now(timezone.utc)
-        course_quizzes_collection.update_one({"_id": ObjectId(quiz_id)}, {"$set": db_updates})
-
-    # Return the updated doc
-    updated_doc = course_quizzes_collection.find_one({"_id": ObjectId(quiz_id)})
+    updated_doc = course_quizzes_collection.find_one_and_update(
+        {"_id": ObjectId(quiz_id)},
+        {"$set": db_updates},
+        array_filters=plan.array_filters,
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated_doc:
+        raise HTTPException(status_code=404, detail="Quiz not found.")
     updated_doc["_id"] = str(updated_doc["_id"])
-    return {"quiz": updated_doc, "changed_question_ids": changed_question_ids}
+    return {"quiz": updated_doc, "changed_question_ids": plan.changed_question_ids}
+
+
+def record_publish_failure(quiz_id: str, error: RuntimeError) -> None:
+    """Mark the quiz publish_failed; keep whatever already exists on Canvas so the next attempt resumes from it."""
+    update = {"status": "publish_failed", "publish_metadata.last_error": str(error), "updated_at": datetime.now(timezone.utc)}
+    if isinstance(error, PublishError):
+        update["new_quiz_id"] = error.new_quiz_id
+        update["assignment_id"] = error.new_quiz_id
+        update.update({f"questions.{i}.canvas_item_id": q["canvas_item_id"] for i, q in enumerate(error.questions)})
+    course_quizzes_collection.update_one({"_id": ObjectId(quiz_id)}, {"$set": update})
+
+
+async def run_publish_job(canvas: AsyncCanvasClient, quiz_doc: dict, publish: bool, clerk_id: str) -> dict:
+    """
+    publish_quiz_to_canvas as a checkpointed job: resumes from the quiz's last job, records the shell and
+    every item as Canvas confirms them. Raises JobInProgressError if the quiz is already being published.
+    If the shell being resumed was deleted on Canvas, the job starts over with a fresh shell.
+    """
+    job = publish_jobs.claim(quiz_doc, publish, clerk_id)
+    try:
+        try:
+            result = await _publish_from_job(canvas, job, quiz_doc, publish)
+        except ShellNotFoundError as e:
+            print(f"{e} Starting quiz {quiz_doc['_id']} over with a new shell.")
+            forget_canvas_quiz(quiz_doc["_id"])
+            quiz_doc = {**quiz_doc, "new_quiz_id": None, "assignment_id": None}
+            job = publish_jobs.claim(quiz_doc, publish, clerk_id)
+            result = await _publish_from_job(canvas, job, quiz_doc, publish)
+    except Exception as e:
+        publish_jobs.fail(job["_id"], e)
+        raise
+    publish_jobs.complete(job["_id"])
+    return result
+
+
+async def _publish_from_job(canvas: AsyncCanvasClient, job: dict, quiz_doc: dict, publish: bool) -> dict:
+    return await canvas.publish_quiz_to_canvas(
+        publish_jobs.resume_state(job, quiz_doc),
+        publish=publish,
+        on_shell_created=lambda new_quiz_id: publish_jobs.record_shell(job["_id"], new_quiz_id),
+        on_item_created=lambda question_id, item_id: publish_jobs.record_item(job["_id"], question_id, item_id)
+    )
+
+
+def forget_canvas_quiz(quiz_id, status: str | None = None) -> None:
+    """The quiz's Canvas copy is gone: drop its Canvas ids and publish job so it can be sent again from scratch."""
+    update = {
+        "new_quiz_id": None,
+        "assignment_id": None,
+        "questions.$[].canvas_item_id": None,
+        "updated_at": datetime.now(timezone.utc)
+    }
+    if status:
+        update["status"] = status
+    course_quizzes_collection.update_one({"_id": quiz_id}, {"$set": update})
+    publish_jobs.forget(quiz_id)
 
 
 @app.post("/api/quizzes/{quiz_id}/save-to-canvas")
@@ -766,12 +923,12 @@ async def save_to_canvas(quiz_id: str, current_user: dict = Depends(get_current_
         raise HTTPException(status_code=400, detail="Quiz is already on Canvas.")
 
     try:
-        result = publish_quiz_to_canvas(quiz_doc, canvas_token, publish=False)
+        async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=canvas_token) as canvas:
+            result = await run_publish_job(canvas, quiz_doc, False, current_user["clerk_id"])
+    except JobInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except RuntimeError as e:
-        course_quizzes_collection.update_one(
-            {"_id": ObjectId(quiz_id)},
-            {"$set": {"status": "publish_failed", "publish_metadata.last_error": str(e), "updated_at": datetime.now(timezone.utc)}}
-        )
+        record_publish_failure(quiz_id, e)
         raise HTTPException(status_code=502, detail=str(e))
 
     now = datetime.now(timezone.utc)
@@ -810,23 +967,23 @@ async def publish_quiz(quiz_id: str, current_user: dict = Depends(get_current_us
     existing_canvas_id = quiz_doc.get("new_quiz_id")
 
     try:
-        if existing_canvas_id:
-            # Quiz was already saved to Canvas as a draft — just publish it in place, don't recreate it
-            publish_existing_canvas_quiz(quiz_doc["course_id"], str(existing_canvas_id), canvas_token)
-            new_quiz_id = existing_canvas_id
-            assignment_id = quiz_doc.get("assignment_id", existing_canvas_id)
-            question_updates = {}
-        else:
-            # Quiz has never been sent to Canvas — create it and publish in one shot
-            publish_result = publish_quiz_to_canvas(quiz_doc, canvas_token, publish=True)
-            new_quiz_id = publish_result["new_quiz_id"]
-            assignment_id = publish_result["assignment_id"]
-            question_updates = {f"questions.{i}.canvas_item_id": q["canvas_item_id"] for i, q in enumerate(publish_result["questions"])}
+        async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=canvas_token) as canvas:
+            if existing_canvas_id and quiz_doc["status"] != "publish_failed":
+                # Quiz was already saved to Canvas as a draft — just publish it in place, don't recreate it
+                await canvas.publish_existing_canvas_quiz(quiz_doc["course_id"], str(existing_canvas_id))
+                new_quiz_id = existing_canvas_id
+                assignment_id = quiz_doc.get("assignment_id", existing_canvas_id)
+                question_updates = {}
+            else:
+                # Quiz has never been sent to Canvas (or an earlier attempt stopped partway) — create / finish it and publish in one shot
+                publish_result = await run_publish_job(canvas, quiz_doc, True, current_user["clerk_id"])
+                new_quiz_id = publish_result["new_quiz_id"]
+                assignment_id = publish_result["assignment_id"]
+                question_updates = {f"questions.{i}.canvas_item_id": q["canvas_item_id"] for i, q in enumerate(publish_result["questions"])}
+    except JobInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except RuntimeError as e:
-        course_quizzes_collection.update_one(
-            {"_id": ObjectId(quiz_id)},
-            {"$set": {"status": "publish_failed", "publish_metadata.last_error": str(e), "updated_at": datetime.now(timezone.utc)}}
-        )
+        record_publish_failure(quiz_id, e)
         raise HTTPException(status_code=502, detail=str(e))
 
     now = datetime.now(timezone.utc)
@@ -872,11 +1029,13 @@ async def delete_quiz(quiz_id: str, current_user: dict = Depends(get_current_use
         if not canvas_token:
             raise HTTPException(status_code=400, detail="No Canvas token found.")
         try:
-            delete_quiz_from_canvas(course_id, str(new_quiz_id), canvas_token)
+            async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=canvas_token) as canvas:
+                await canvas.delete_quiz_from_canvas(course_id, str(new_quiz_id))
         except RuntimeError as e:
             raise HTTPException(status_code=502, detail=str(e))
 
     course_quizzes_collection.delete_one({"_id": ObjectId(quiz_id)})
+    publish_jobs.forget(ObjectId(quiz_id))
     return {"deleted": True}
 
 
@@ -884,7 +1043,7 @@ async def delete_quiz(quiz_id: str, current_user: dict = Depends(get_current_use
 async def revert_to_draft(quiz_id: str, current_user: dict = Depends(get_current_user)):
     """
     Remove a quiz from Canvas (delete it there) but keep it in MongoDB as a draft.
-    Only valid for quizzes with status saved_to_canvas.
+    Valid for quizzes on Canvas, and for failed publishes (whose partial shell, if any, is deleted).
     """
     try:
         quiz = course_quizzes_collection.find_one({"_id": ObjectId(quiz_id)})
@@ -893,7 +1052,7 @@ async def revert_to_draft(quiz_id: str, current_user: dict = Depends(get_current
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found.")
     assert_course_access(current_user, quiz["course_id"])
-    if quiz["status"] not in ("saved_to_canvas", "published_on_canvas"):
+    if quiz["status"] not in ("saved_to_canvas", "published_on_canvas", "publish_failed"):
         raise HTTPException(status_code=400, detail="Only quizzes on Canvas can be reverted to draft.")
 
     new_quiz_id = quiz.get("new_quiz_id")
@@ -905,7 +1064,8 @@ async def revert_to_draft(quiz_id: str, current_user: dict = Depends(get_current
         if not canvas_token:
             raise HTTPException(status_code=400, detail="No Canvas token found.")
         try:
-            delete_quiz_from_canvas(course_id, str(new_quiz_id), canvas_token)
+            async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=canvas_token) as canvas:
+                await canvas.delete_quiz_from_canvas(course_id, str(new_quiz_id))
         except RuntimeError as e:
             raise HTTPException(status_code=502, detail=str(e))
 
@@ -921,6 +1081,7 @@ async def revert_to_draft(quiz_id: str, current_user: dict = Depends(get_current
             **question_clear
         }}
     )
+    publish_jobs.forget(ObjectId(quiz_id))
     return {"reverted": True}
 
 
@@ -952,7 +1113,8 @@ async def unpublish_quiz(quiz_id: str, current_user: dict = Depends(get_current_
         raise HTTPException(status_code=400, detail="No Canvas token found.")
 
     try:
-        unpublish_canvas_quiz(course_id, str(new_quiz_id), canvas_token)
+        async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=canvas_token) as canvas:
+            await canvas.unpublish_canvas_quiz(course_id, str(new_quiz_id))
     except RuntimeError as e:
         raise HTTPException(status_code=502, detail=str(e))
 
@@ -976,7 +1138,8 @@ class SaveQuizEditsBody(BaseModel):
 async def save_quiz_edits(quiz_id: str, body: SaveQuizEditsBody, current_user: dict = Depends(get_current_user)):
     """
     Save edits to quiz questions (currently: points_possible per question).
-    If the quiz is on Canvas, also syncs points to each Canvas item.
+    If the quiz is on Canvas, the item updates are sent concurrently first and MongoDB only keeps the
+    edits Canvas accepted, so the two never disagree. Canvas failures are reported per question (502).
     """
     try:
         quiz = course_quizzes_collection.find_one({"_id": ObjectId(quiz_id)})
@@ -987,19 +1150,17 @@ async def save_quiz_edits(quiz_id: str, body: SaveQuizEditsBody, current_user: d
     assert_course_access(current_user, quiz["course_id"])
 
     # Build a lookup from internal_question_id → index in the questions array
-    id_to_index = {q["internal_question_id"]: i for i, q in enumerate(quiz.get("questions", []))}
+    questions = quiz.get("questions", [])
+    id_to_index = {q["internal_question_id"]: i for i, q in enumerate(questions)}
 
-    updates = {}
+    edits = {}
     for q_update in body.questions:
-        idx = id_to_index.get(q_update.internal_question_id)
-        if idx is None:
+        if q_update.internal_question_id not in id_to_index:
             raise HTTPException(status_code=400, detail=f"Question {q_update.internal_question_id} not found in quiz.")
-        updates[f"questions.{idx}.points_possible"] = q_update.points_possible
-
-    updates["updated_at"] = datetime.now(timezone.utc)
-    course_quizzes_collection.update_one({"_id": ObjectId(quiz_id)}, {"$set": updates})
+        edits[q_update.internal_question_id] = q_update.points_possible
 
     # If the quiz is already on Canvas, sync points to each item
+    failed = []
     new_quiz_id = quiz.get("new_quiz_id")
     course_id = quiz.get("course_id")
     if new_quiz_id and course_id and quiz.get("status") in ("saved_to_canvas", "published_on_canvas"):
@@ -1007,14 +1168,29 @@ async def save_quiz_edits(quiz_id: str, body: SaveQuizEditsBody, current_user: d
         if canvas_token:
             canvas_token = decrypt(canvas_token)
         if canvas_token:
-            questions_by_id = {q["internal_question_id"]: q for q in quiz.get("questions", [])}
-            for q_update in body.questions:
-                q = questions_by_id.get(q_update.internal_question_id)
-                canvas_item_id = q.get("canvas_item_id") if q else None
-                if canvas_item_id:
-                    try:
-                        update_item_points_on_canvas(course_id, str(new_quiz_id), str(canvas_item_id), q_update.points_possible, canvas_token)
-                    except RuntimeError as e:
-                        raise HTTPException(status_code=502, detail=str(e))
-
-    return {"saved": True}
\ No newline at end of file
+            item_to_question = {
+                str(questions[id_to_index[qid]]["canvas_item_id"]): qid
+                for qid in edits if questions[id_to_index[qid]].get("canvas_item_id")
+            }
+            async with AsyncCanvasClient(canvas_url=CANVAS_URL, access_token=canvas_token) as canvas:
+                outcome = await canvas.update_items_points_on_canvas(
+                    course_id, str(new_quiz_id), {item_id: edits[qid] for item_id, qid in item_to_question.items()}
+                )
+            failed = [
+                {"internal_question_id": item_to_question[f["item"]], "error": str(f["error"])} for f in outcome.failures
+            ]
+
+    failed_ids = {f["internal_question_id"] for f in failed}
+    saved = {qid: points for qid, points in edits.items() if qid not in failed_ids}
+    if saved:
+        updates = {f"questions.{id_to_index[qid]}.points_possible": points for qid, points in saved.items()}
+        updates["updated_at"] = datetime.now(timezone.utc)
+        course_quizzes_collection.update_one({"_id": ObjectId(quiz_id)}, {"$set": updates})
+
+    if failed:
+        summary = "; ".join(f"{f['internal_question_id']}: {f['error']}" for f in failed)
+        raise HTTPException(
+            status_code=502,
+            detail=f"Saved {len(saved)} of {len(edits)} question edits. Canvas rejected {len(failed)}: {summary}"
+        )
+    return {"saved": True, "updated": list(saved)}
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+PREVIOUS-QUESTION PROMPT CONTEXT
+- Raw Canvas quiz questions carry HTML, answer ids, comments and weights; pasting them into the Gemini
+  prompt wastes most of the context on markup
+- compact_previous_questions() reduces each question to one line ("stem -> correct answer"), drops
+  near-duplicates, and keeps adding lines only while they fit in a token budget
+- Tokens are estimated (~4 characters per token), which is close enough to budget a prompt without
+  calling the tokenizer
+- Accepts every question shape the backend sees:
+    Canvas:  question_text (HTML) + answers [{text | html, weight}] (weight > 0 = correct)
+    MongoDB: question_stem_html + choices [{text_html, is_correct}]
+    Gemini:  question_stem + choices [{text, is_correct}]
+
+Usage:
+    context = compact_previous_questions(previous_questions, token_budget=4000)
+    prompt += context.text
+"""
+
+import html
+import os
+import re
+from typing import List
+
+from question_index import QuestionIndex, question_stem_text
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("GEMINI_CONTEXT_TOKEN_BUDGET", "4000"))
+CHARS_PER_TOKEN = 4
+
+_TAG = re.compile(r"<[^>]+>")
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _plain(value) -> str:
+    return " ".join(html.unescape(_TAG.sub(" ", value or "")).split())
+
+
+def correct_answer_text(question: dict) -> str:
+    """Text of the correct choice(s), joined with ' / '; empty if the question doesn't mark one."""
+    correct = []
+    for choice in question.get("choices") or []:
+        if choice.get("is_correct"):
+            correct.append(_plain(choice.get("text") or choice.get("text_html")))
+    for answer in question.get("answers") or []:
+        if (answer.get("weight") or 0) > 0:
+            correct.append(_plain(answer.get("text") or answer.get("html")))
+    return " / ".join(c for c in correct if c)
+
+
+def compact_line(question) -> str:
+    stem = " ".join(question_stem_text(question).split())
+    if not stem:
+        return ""
+    answer = correct_answer_text(question) if isinstance(question, dict) else ""
+    return f"- {stem} -> {answer}" if answer else f"- {stem}"
+
+
+class CompactContext:
+
+    def __init__(self, lines: List[str], total: int, duplicates: int, truncated: int):
+        self.lines = lines
+        self.total = total
+        self.duplicates = duplicates
+        self.truncated = truncated
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+    def report(self) -> dict:
+        return {
+            "previous_questions": self.total,
+            "included": len(self.lines),
+            "duplicates": self.duplicates,
+            "truncated": self.truncated,
+            "estimated_tokens": self.tokens,
+        }
+
+
+def compact_previous_questions(questions: list, token_budget: int = CONTEXT_TOKEN_BUDGET) -> CompactContext:
+    """
+    One line per distinct question, in the given order, until the next line would exceed token_budget.
+    Questions that didn't fit are counted in `truncated`; near-duplicates (and stemless entries) in `duplicates`.
+    """
+    index = QuestionIndex()
+    lines, used, duplicates, truncated = [], 0, 0, 0
+    for question in questions or []:
+        line = compact_line(question)
+        if not line or index.is_duplicate(question):
+            duplicates += 1
+            continue
+        index.add(question)
+        # +1 for the newline joining it to the previous line
+        cost = estimate_tokens(line) + (1 if lines else 0)
+        if truncated or used + cost > token_budget:
+            truncated += 1
+            continue
+        lines.append(line)
+        used += cost
+    return CompactContext(lines, len(questions or []), duplicates, truncated)
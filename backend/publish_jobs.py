@@ -0,0 +1,112 @@
+"""
+PUBLISH JOBS
+- Saving / publishing a quiz to Canvas is a multi-step job: create the shell, create one item per
+  question, optionally publish. Each finished step is checkpointed in MongoDB (publish_jobs collection)
+  the moment Canvas confirms it, so a crash or a failed request never loses track of what already exists
+- Re-running a job for the same quiz continues from the last checkpoint: the shell is reused and only
+  questions without a canvas_item_id are posted - no duplicate shells piling up in the course
+- One job document per quiz. Claiming it is atomic, so two concurrent save/publish requests for the
+  same quiz can't both create a shell; a claim expires after LEASE so a crashed worker doesn't block retries
+- Job document:
+    quiz_id, course_id, clerk_id, publish (bool), status: running | failed | completed,
+    new_quiz_id, items: {internal_question_id: canvas_item_id}, attempts, last_error,
+    lease_expires_at, created_at, updated_at
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+LEASE = timedelta(minutes=10)
+
+
+class JobInProgressError(RuntimeError):
+    """Another request is already running the publish job for this quiz."""
+
+
+class PublishJobStore:
+
+    def __init__(self, collection, lease: timedelta = LEASE):
+        self.collection = collection
+        self.lease = lease
+
+    def claim(self, quiz_doc: dict, publish: bool, clerk_id: str) -> dict:
+        """
+        Start (or resume) the publish job for a quiz and return it.
+        A completed job is reset so the quiz can be sent to Canvas again (e.g. after it was deleted there).
+        Raises JobInProgressError if another request holds an unexpired claim.
+        """
+        now = datetime.now(timezone.utc)
+        try:
+            job = self.collection.find_one_and_update(
+                {
+                    "quiz_id": quiz_doc["_id"],
+                    "$or": [{"status": {"$ne": "running"}}, {"lease_expires_at": {"$lt": now}}]
+                },
+                [{"$set": {
+                    "course_id": quiz_doc["course_id"],
+                    "clerk_id": clerk_id,
+                    "publish": publish,
+                    "status": "running",
+                    "new_quiz_id": {"$cond": [{"$eq": ["$status", "completed"]}, None, {"$ifNull": ["$new_quiz_id", None]}]},
+                    "items": {"$cond": [{"$eq": ["$status", "completed"]}, {"$literal": {}}, {"$ifNull": ["$items", {"$literal": {}}]}]},
+                    "attempts": {"$add": [{"$cond": [{"$eq": ["$status", "completed"]}, 0, {"$ifNull": ["$attempts", 0]}]}, 1]},
+                    "last_error": None,
+                    "lease_expires_at": now + self.lease,
+                    "created_at": {"$ifNull": ["$created_at", now]},
+                    "updated_at": now,
+                }}],
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # The filter missed an existing job (it is running) and the upsert hit the unique quiz_id index
+            raise JobInProgressError("This quiz is already being sent to Canvas.")
+        return job
+
+    def resume_state(self, job: dict, quiz_doc: dict) -> dict:
+        """The quiz document with the job's checkpoints applied, ready for publish_quiz_to_canvas."""
+        items = job.get("items") or {}
+        return {
+            **quiz_doc,
+            "new_quiz_id": job.get("new_quiz_id") or quiz_doc.get("new_quiz_id"),
+            "questions": [
+                {**q, "canvas_item_id": items.get(q["internal_question_id"]) or q.get("canvas_item_id")}
+                for q in quiz_doc["questions"]
+            ]
+        }
+
+    def record_shell(self, job_id, new_quiz_id: str) -> None:
+        self._checkpoint(job_id, {"new_quiz_id": new_quiz_id})
+
+    def record_item(self, job_id, internal_question_id: str, canvas_item_id: str) -> None:
+        self._checkpoint(job_id, {f"items.{internal_question_id}": canvas_item_id})
+
+    def complete(self, job_id) -> None:
+        self._finish(job_id, "completed", None)
+
+    def fail(self, job_id, error: Exception) -> None:
+        self._finish(job_id, "failed", str(error))
+
+    def get(self, quiz_id) -> Optional[dict]:
+        return self.collection.find_one({"quiz_id": quiz_id})
+
+    def forget(self, quiz_id) -> None:
+        """Drop the job once its Canvas quiz is gone, so a later publish starts from scratch."""
+        self.collection.delete_one({"quiz_id": quiz_id})
+
+    def _checkpoint(self, job_id, fields: dict) -> None:
+        now = datetime.now(timezone.utc)
+        # Every confirmed step also extends the claim, so a long publish doesn't lose it midway
+        self.collection.update_one(
+            {"_id": job_id},
+            {"$set": {**fields, "updated_at": now, "lease_expires_at": now + self.lease}}
+        )
+
+    def _finish(self, job_id, status: str, error: Optional[str]) -> None:
+        self.collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": status, "last_error": error, "lease_expires_at": None, "updated_at": datetime.now(timezone.utc)}}
+        )
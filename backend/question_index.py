@@ -0,0 +1,127 @@
+"""
+NEAR-DUPLICATE QUESTION INDEX
+- Holds the stems of every question a course already has (Canvas quizzes + quizzes saved in MongoDB)
+  and tells whether a newly generated question is a rewording of one of them
+- Similarity is Jaccard over word shingles of the normalized stem (lowercase, no HTML / punctuation).
+  MinHash signatures bucketed with LSH find the few candidate stems worth comparing, so a check
+  doesn't scan the whole course; candidates are then confirmed with the exact Jaccard score
+- Pure Python (no NumPy) - courses have hundreds to a few thousand questions, not millions
+- topic_summary() condenses the existing questions into their most common terms, so the Gemini
+  prompt can describe what is already covered without pasting every question
+
+Usage:
+    index = QuestionIndex()
+    index.add_all(previous_questions)
+    if not index.is_duplicate(question): index.add(question)
+"""
+
+import html
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Set
+
+SIMILARITY_THRESHOLD = 0.7
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+_TAG = re.compile(r"<[^>]+>")
+_NON_WORD = re.compile(r"[^\w\s]")
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "does", "do", "for", "from", "has", "have",
+    "how", "if", "in", "into", "is", "it", "its", "of", "on", "or", "that", "the", "their", "these",
+    "this", "to", "was", "were", "what", "when", "where", "which", "while", "who", "why", "will", "with",
+    "would", "following", "best", "most", "not", "than", "then", "there", "they", "used", "using",
+}
+
+
+def question_stem_text(question) -> str:
+    """Plain-text stem of a Gemini question, a stored quiz question or a Canvas quiz question (or a bare string)."""
+    if isinstance(question, str):
+        return question
+    if not isinstance(question, dict):
+        return ""
+    for field in ("question_stem", "question_stem_html", "question_text"):
+        if question.get(field):
+            return html.unescape(_TAG.sub(" ", question[field]))
+    return ""
+
+
+def _words(text: str) -> List[str]:
+    return _NON_WORD.sub(" ", text.lower()).split()
+
+
+def _shingles(text: str) -> Set[str]:
+    words = _words(text)
+    if len(words) < 2:
+        return set(words)
+    return {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+class QuestionIndex:
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD, num_perm: int = NUM_PERMUTATIONS, bands: int = LSH_BANDS):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands.")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        # Fixed coefficients keep signatures comparable across instances and runs
+        self._perms = [(2 * i + 1) * 0x9E3779B1 % _MERSENNE_PRIME for i in range(num_perm)]
+        self._offsets = [(i * 0x85EBCA77 + 0xC2B2AE3D) % _MERSENNE_PRIME for i in range(num_perm)]
+        self._shingle_sets: List[Set[str]] = []
+        self._buckets: List[Dict[tuple, List[int]]] = [{} for _ in range(bands)]
+
+    def __len__(self) -> int:
+        return len(self._shingle_sets)
+
+    def add(self, question) -> None:
+        shingles = _shingles(question_stem_text(question))
+        if not shingles:
+            return
+        entry = len(self._shingle_sets)
+        self._shingle_sets.append(shingles)
+        for band, key in enumerate(self._band_keys(shingles)):
+            self._buckets[band].setdefault(key, []).append(entry)
+
+    def add_all(self, questions: Iterable) -> None:
+        for question in questions or []:
+            self.add(question)
+
+    def similarity(self, question) -> float:
+        """Highest Jaccard similarity to an indexed stem among the LSH candidates (0.0 if there are none)."""
+        shingles = _shingles(question_stem_text(question))
+        if not shingles:
+            return 0.0
+        candidates = set()
+        for band, key in enumerate(self._band_keys(shingles)):
+            candidates.update(self._buckets[band].get(key, ()))
+        return max((_jaccard(shingles, self._shingle_sets[c]) for c in candidates), default=0.0)
+
+    def is_duplicate(self, question) -> bool:
+        return self.similarity(question) >= self.threshold
+
+    def _band_keys(self, shingles: Set[str]) -> List[tuple]:
+        hashes = [zlib.crc32(s.encode("utf-8")) for s in shingles]
+        signature = [
+            min((a * h + b) % _MERSENNE_PRIME & _MAX_HASH for h in hashes)
+            for a, b in zip(self._perms, self._offsets)
+        ]
+        return [tuple(signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+
+def topic_summary(questions: Iterable, max_terms: int = 30) -> str:
+    """The terms that appear in the most existing stems, most common first, e.g. "mitosis, cell cycle, ..."."""
+    counts = Counter()
+    for question in questions or []:
+        words = [w for w in _words(question_stem_text(question)) if len(w) > 2 and w not in _STOPWORDS and not w.isdigit()]
+        counts.update(set(words))
+    return ", ".join(term for term, _ in counts.most_common(max_terms))
@@ -0,0 +1,75 @@
+"""
+INCREMENTAL QUESTION PARSER
+- Gemini streams the quiz JSON ({"questions": [ {...}, {...} ]}) in arbitrary text chunks
+- QuestionStreamParser is fed those chunks and hands back each question object the moment its
+  closing brace arrives, so questions can be shown / saved before the whole response is done
+- Only a small state machine over the characters: nesting depth, whether we are inside a string,
+  and where the current question object started. Braces inside strings are ignored.
+- Anything before the first '{' (e.g. a stray ```json fence) is skipped
+
+Usage:
+    parser = QuestionStreamParser()
+    for chunk in response_stream:
+        for question in parser.feed(chunk.text):
+            ...
+"""
+
+import json
+from typing import List
+
+
+class QuestionStreamParser:
+
+    # Depth of a question object: root object (1) > "questions" array (2) > question (3)
+    QUESTION_DEPTH = 3
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._question_start = None
+        self.questions: List[dict] = []
+
+    def feed(self, chunk: str) -> List[dict]:
+        """Add the next chunk of text; returns the questions completed by it (possibly none)."""
+        self.text += chunk
+        completed = []
+
+        while self._pos < len(self.text):
+            ch = self.text[self._pos]
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "{" and self._depth == self.QUESTION_DEPTH:
+                    self._question_start = self._pos
+            elif ch in "}]":
+                if ch == "}" and self._depth == self.QUESTION_DEPTH and self._question_start is not None:
+                    question = self._parse(self.text[self._question_start:self._pos + 1])
+                    if question is not None:
+                        completed.append(question)
+                    self._question_start = None
+                self._depth -= 1
+
+            self._pos += 1
+
+        self.questions.extend(completed)
+        return completed
+
+    @staticmethod
+    def _parse(fragment: str):
+        try:
+            question = json.loads(fragment)
+        except json.JSONDecodeError:
+            return None
+        return question if isinstance(question, dict) else None
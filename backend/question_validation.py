@@ -0,0 +1,48 @@
+"""
+GENERATED QUESTION VALIDATION
+- Checks each question Gemini returns against the shape QUIZ_PROMPT asks for, so a bad question is
+  caught right after generation instead of when publish_quiz_to_canvas rejects it
+- A valid question has:
+    question_stem: non-empty string
+    choices: exactly CHOICES_PER_QUESTION objects, each with non-empty "text" and boolean "is_correct"
+    exactly one correct choice
+    rationale: string (may be empty)
+- validate_question() returns a list of human-readable problems (empty = valid); the problems are
+  fed back to Gemini when the invalid questions are re-requested
+"""
+
+from typing import List
+
+CHOICES_PER_QUESTION = 4
+
+
+def validate_question(question) -> List[str]:
+    if not isinstance(question, dict):
+        return ["is not a JSON object"]
+
+    problems = []
+    stem = question.get("question_stem")
+    if not isinstance(stem, str) or not stem.strip():
+        problems.append("has no question_stem")
+
+    choices = question.get("choices")
+    if not isinstance(choices, list):
+        problems.append("has no choices list")
+        choices = []
+    elif len(choices) != CHOICES_PER_QUESTION:
+        problems.append(f"has {len(choices)} choices instead of {CHOICES_PER_QUESTION}")
+
+    for i, choice in enumerate(choices, start=1):
+        if not isinstance(choice, dict) or not isinstance(choice.get("text"), str) or not choice["text"].strip():
+            problems.append(f"choice {i} has no text")
+        elif not isinstance(choice.get("is_correct"), bool):
+            problems.append(f"choice {i} has no true/false is_correct")
+
+    correct = sum(1 for c in choices if isinstance(c, dict) and c.get("is_correct") is True)
+    if choices and correct != 1:
+        problems.append("has no correct choice" if correct == 0 else f"has {correct} correct choices instead of 1")
+
+    if not isinstance(question.get("rationale", ""), str):
+        problems.append("has a rationale that is not a string")
+
+    return problems
@@ -0,0 +1,70 @@
+"""
+GENERATED QUIZ RESULT CACHE
+- Opt-in (use_cache on the generate request): remembers what Gemini generated for a selection so
+  clicking generate again while trying settings returns in milliseconds instead of re-running the
+  downloads, uploads, previous-quiz fetches and the Gemini call
+- Keyed per user by a hash of:
+    the sorted Canvas file ids + modified_at, question_count, course id, the sorted previous quiz ids
+    and PROMPT_VERSION (changes whenever the prompt or model does)
+  a file without id / modified_at can't be fingerprinted without downloading it, so such
+  selections are never cached
+- Entries expire after `ttl` (TTL index on expires_at); force_fresh regenerates and replaces the entry
+- Stored in MongoDB (quiz_results collection); each hit is still saved as a new draft quiz
+
+Usage:
+    key = result_cache_key(files, question_count, course_id, quiz_ids)
+    quiz = cache.lookup(clerk_id, key) or generate(...); cache.store(clerk_id, key, quiz)
+"""
+
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from gemini_file_cache import metadata_cache_key
+from gemini_retriever import PROMPT_VERSION
+
+RESULT_TTL = timedelta(hours=24)
+
+
+def result_cache_key(files: List[dict], question_count: int, course_id: Optional[int], quiz_ids: List[int], prompt_version: str = PROMPT_VERSION) -> Optional[str]:
+    """Fingerprint of a generate request, or None if some file has no Canvas id / modified_at."""
+    file_keys = [metadata_cache_key(f) for f in files]
+    if not file_keys or None in file_keys:
+        return None
+    material = {
+        "files": sorted(file_keys),
+        "question_count": question_count,
+        "course_id": course_id,
+        "quiz_ids": sorted(quiz_ids or []),
+        "prompt_version": prompt_version,
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode()).hexdigest()
+
+
+class QuizResultCache:
+
+    def __init__(self, collection, ttl: timedelta = RESULT_TTL):
+        self.collection = collection
+        self.ttl = ttl
+
+    def lookup(self, owner: str, key: str) -> Optional[dict]:
+        """The cached Gemini output ({"questions": [...], ...}), or None on a miss / expired entry."""
+        doc = self.collection.find_one({"owner": owner, "key": key})
+        # The TTL monitor only runs about once a minute, so check expiry here too
+        if not doc or _as_utc(doc["expires_at"]) <= datetime.now(timezone.utc):
+            return None
+        return doc["quiz"]
+
+    def store(self, owner: str, key: str, quiz: dict) -> None:
+        now = datetime.now(timezone.utc)
+        self.collection.update_one(
+            {"owner": owner, "key": key},
+            {"$set": {"quiz": quiz, "created_at": now, "expires_at": now + self.ttl}},
+            upsert=True
+        )
+
+
+def _as_utc(value: datetime) -> datetime:
+    # MongoDB hands back naive datetimes (in UTC) unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
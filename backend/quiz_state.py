@@ -0,0 +1,80 @@
+"""
+CANVAS QUIZ STATE CACHE
+- Remembers the last Canvas representation we saw of each New Quiz and quiz item (from GET and
+  PATCH responses), with the ETag / updated_at it came with
+- Lets AsyncCanvasClient:
+    - make reads conditional (If-None-Match / If-Modified-Since); a 304 reuses the cached body
+    - fall back to a full-object PATCH without a GET first when Canvas rejects a minimal PATCH body
+- updated_at check: a response older than the cached one (e.g. out-of-order concurrent PATCHes)
+  never replaces it
+- Keyed by token fingerprint + resource URL, so one user's view is never served to another
+- In-process TTLCache (each uvicorn worker has its own); entries expire after `ttl` so edits made
+  in the Canvas UI are picked up again
+"""
+
+from typing import Dict, Optional
+
+from canvas_rate_limit import token_fingerprint
+from ttl_cache import TTLCache
+
+QUIZ_STATE_TTL_SECONDS = 900.0
+
+
+class QuizState:
+
+    def __init__(self, body, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def updated_at(self) -> Optional[str]:
+        return self.body.get("updated_at") if isinstance(self.body, dict) else None
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class QuizStateCache:
+
+    def __init__(self, maxsize: int = 2048, ttl: float = QUIZ_STATE_TTL_SECONDS):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, token: str, url: str) -> Optional[QuizState]:
+        return self._cache.get((token_fingerprint(token), url))
+
+    def remember(self, token: str, url: str, body, headers=None) -> None:
+        """Cache a quiz / item (or a listing of items) as Canvas just returned it."""
+        if not isinstance(body, (dict, list)):
+            return
+        state = QuizState(body, (headers or {}).get("ETag"), (headers or {}).get("Last-Modified"))
+        current = self.get(token, url)
+        # ISO-8601 timestamps from Canvas compare correctly as strings
+        if current and current.updated_at and state.updated_at and state.updated_at < current.updated_at:
+            return
+        self._cache.set((token_fingerprint(token), url), state)
+
+    def merge(self, token: str, url: str, fields: dict) -> None:
+        """Apply a successful minimal PATCH to the cached body (when Canvas didn't echo the object back)."""
+        current = self.get(token, url)
+        if current and isinstance(current.body, dict):
+            self._cache.set((token_fingerprint(token), url), QuizState({**current.body, **fields}))
+
+    def forget(self, token: str, url_prefix: str) -> None:
+        """Drop the cached quiz / items under url_prefix (e.g. after the quiz is deleted)."""
+        owner = token_fingerprint(token)
+        self._cache.discard_where(
+            lambda key: key[0] == owner and (key[1] == url_prefix or key[1].startswith(url_prefix + "/"))
+        )
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+# Shared by every AsyncCanvasClient in this process
+quiz_state_cache = QuizStateCache()
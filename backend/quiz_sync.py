@@ -0,0 +1,223 @@
+"""
+CANVAS → MONGODB QUIZ SYNC
+- plan_canvas_sync(): compares a stored quiz with its Canvas title + items and returns the MongoDB
+  update (SyncPlan) that brings it in line - additions, deletions, reorders and content changes are
+  all worked out in one pass over the Canvas items, using prebuilt canvas_item_id → index maps, so
+  sync cost grows linearly with the number of questions (see bench_quiz_sync.py)
+- canvas_item_hash(): checksum of the parts of a Canvas quiz item we mirror (position, points, stem,
+  choices, correct answer); stored on each question as `canvas_hash` so sync_from_canvas can skip an
+  unchanged item with one comparison instead of diffing every field
+- question_from_canvas_item(): question doc for an item that was added directly in Canvas
+- merge_canvas_item(): apply a changed Canvas item to its stored question, field by field
+- Questions synced before canvas_hash existed get it on their next sync (without being reported as changed)
+
+Usage:
+    plan = plan_canvas_sync(quiz, canvas_title, canvas_items)
+    if plan.set_fields: collection.find_one_and_update(..., {"$set": plan.set_fields}, array_filters=plan.array_filters)
+"""
+
+import hashlib
+import json
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+HASH_FIELD = "canvas_hash"
+
+
+def _entry(canvas_item: dict) -> dict:
+    return canvas_item.get("entry") or {}
+
+
+def _canvas_choices(canvas_item: dict) -> list:
+    return _entry(canvas_item).get("interaction_data", {}).get("choices", [])
+
+
+def _correct_choice_id(canvas_item: dict) -> str:
+    return str(_entry(canvas_item).get("scoring_data", {}).get("value", ""))
+
+
+def canvas_item_hash(canvas_item: dict) -> str:
+    mirrored = {
+        "position": canvas_item.get("position"),
+        "points_possible": canvas_item.get("points_possible"),
+        "item_body": _entry(canvas_item).get("item_body", ""),
+        "choices": [[str(c.get("id")), c.get("item_body", "")] for c in _canvas_choices(canvas_item)],
+        "correct": _correct_choice_id(canvas_item),
+    }
+    return hashlib.sha256(json.dumps(mirrored, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def question_from_canvas_item(canvas_item: dict, default_position: int) -> dict:
+    correct_id = _correct_choice_id(canvas_item)
+    return {
+        "internal_question_id": str(uuid.uuid4()),
+        "canvas_item_id": str(canvas_item.get("id", "")),
+        "type": "multiple_choice",
+        "position": canvas_item.get("position", default_position),
+        "points_possible": canvas_item.get("points_possible", 1),
+        "question_stem_html": _entry(canvas_item).get("item_body", ""),
+        "overall_rationale_html": "",
+        "publish_error": None,
+        "choices": [
+            {
+                "internal_choice_id": str(c["id"]),
+                "position": idx + 1,
+                "text_html": c.get("item_body", ""),
+                "is_correct": str(c["id"]) == correct_id,
+            }
+            for idx, c in enumerate(_canvas_choices(canvas_item))
+        ],
+        HASH_FIELD: canvas_item_hash(canvas_item),
+    }
+
+
+def merge_canvas_item(stored_q: dict, canvas_item: dict) -> Tuple[dict, bool]:
+    """
+    Return (updated question, whether anything the user sees changed).
+    The updated question always carries the item's current canvas_hash.
+    """
+    q_changed = False
+    updated_q = dict(stored_q)
+    updated_q[HASH_FIELD] = canvas_item_hash(canvas_item)
+
+    # Check position/ordering
+    canvas_position = canvas_item.get("position")
+    if canvas_position and canvas_position != updated_q.get("position"):
+        updated_q["position"] = canvas_position
+        q_changed = True
+
+    # Check points
+    canvas_points = canvas_item.get("points_possible")
+    if canvas_points is not None and canvas_points != updated_q.get("points_possible"):
+        updated_q["points_possible"] = canvas_points
+        q_changed = True
+
+    # Check question stem (item_body lives in entry)
+    canvas_stem = _entry(canvas_item).get("item_body", "")
+    if canvas_stem and canvas_stem != updated_q.get("question_stem_html", ""):
+        updated_q["question_stem_html"] = canvas_stem
+        q_changed = True
+
+    # Check answer choices — match by internal_choice_id which we set as the Canvas choice id
+    canvas_choices = _canvas_choices(canvas_item)
+    if canvas_choices:
+        canvas_choice_by_id = {str(c["id"]): c for c in canvas_choices}
+        correct_id = _correct_choice_id(canvas_item)
+        stored_choice_ids = {stored_c["internal_choice_id"] for stored_c in updated_q.get("choices", [])}
+        new_choices = []
+
+        # Update or drop existing stored choices
+        for stored_c in updated_q.get("choices", []):
+            c_id = stored_c["internal_choice_id"]
+            canvas_c = canvas_choice_by_id.get(c_id)
+            if not canvas_c:
+                # Choice was removed in Canvas — drop it
+                q_changed = True
+                continue
+            updated_c = dict(stored_c)
+            if canvas_c.get("item_body", "") != stored_c.get("text_html", ""):
+                updated_c["text_html"] = canvas_c["item_body"]
+                q_changed = True
+            updated_c["is_correct"] = (c_id == correct_id)
+            if updated_c["is_correct"] != stored_c["is_correct"]:
+                q_changed = True
+            new_choices.append(updated_c)
+
+        # Pick up any new choices added directly in Canvas
+        for canvas_c in canvas_choices:
+            c_id = str(canvas_c["id"])
+            if c_id not in stored_choice_ids:
+                new_choices.append({
+                    "internal_choice_id": c_id,
+                    "position": len(new_choices) + 1,
+                    "text_html": canvas_c.get("item_body", ""),
+                    "is_correct": (c_id == correct_id),
+                })
+                q_changed = True
+
+        updated_q["choices"] = new_choices
+
+    return updated_q, q_changed
+
+
+class SyncPlan:
+
+    def __init__(self):
+        # $set document for the quiz; empty when nothing needs writing
+        self.set_fields: Dict = {}
+        # arrayFilters for the questions.$[qN] paths in set_fields (None when the array is written whole)
+        self.array_filters: Optional[List[Dict]] = None
+        self.changed_question_ids: List[str] = []
+
+    @property
+    def content_changed(self) -> bool:
+        """Whether the user would see a difference (as opposed to only canvas_hash backfills)."""
+        return bool(self.changed_question_ids) or "title" in self.set_fields or "question_count" in self.set_fields
+
+
+def plan_canvas_sync(quiz: dict, canvas_title: str, canvas_items: List[dict]) -> SyncPlan:
+    plan = SyncPlan()
+
+    # Check title
+    if canvas_title and canvas_title != quiz.get("title", ""):
+        plan.set_fields["title"] = canvas_title
+
+    questions = list(quiz.get("questions", []))
+    index_by_item_id: Dict[str, int] = {}
+    for i, q in enumerate(questions):
+        if q.get("canvas_item_id"):
+            index_by_item_id.setdefault(str(q["canvas_item_id"]), i)
+
+    canvas_item_ids = set()
+    # internal_question_id -> updated question, written back element by element
+    element_updates: Dict[str, dict] = {}
+    added = False
+
+    # Sort canvas items by position to determine ordering
+    for canvas_item in sorted(canvas_items, key=lambda x: x.get("position", 0)):
+        canvas_item_id = str(canvas_item.get("id", ""))
+        canvas_item_ids.add(canvas_item_id)
+        q_idx = index_by_item_id.get(canvas_item_id)
+
+        if q_idx is None:
+            # New question added directly in Canvas — build a new question doc for it
+            new_q = question_from_canvas_item(canvas_item, len(questions) + 1)
+            index_by_item_id[canvas_item_id] = len(questions)
+            questions.append(new_q)
+            plan.changed_question_ids.append(new_q["internal_question_id"])
+            added = True
+            continue
+
+        # Same checksum as last sync: nothing on Canvas changed for this item
+        if questions[q_idx].get(HASH_FIELD) == canvas_item_hash(canvas_item):
+            continue
+
+        updated_q, q_changed = merge_canvas_item(questions[q_idx], canvas_item)
+        questions[q_idx] = updated_q
+        element_updates[updated_q["internal_question_id"]] = updated_q
+        if q_changed:
+            plan.changed_question_ids.append(updated_q["internal_question_id"])
+
+    # Remove questions that no longer exist on Canvas
+    kept = [q for q in questions if not q.get("canvas_item_id") or str(q["canvas_item_id"]) in canvas_item_ids]
+    removed = len(kept) != len(questions)
+
+    # Always sync question_count to the true count after additions and deletions
+    if len(kept) != quiz.get("question_count"):
+        plan.set_fields["question_count"] = len(kept)
+
+    # Re-sort questions by their (possibly updated) position
+    ordered = sorted(kept, key=lambda q: q.get("position", 0))
+    reordered = any(a is not b for a, b in zip(ordered, kept))
+
+    if added or removed or reordered:
+        # The array itself changed shape, so it is written as a whole
+        plan.set_fields["questions"] = ordered
+    elif element_updates:
+        # Only rewrite the questions whose Canvas item changed, matched by internal_question_id
+        plan.array_filters = []
+        for n, (question_id, updated_q) in enumerate(element_updates.items()):
+            plan.set_fields[f"questions.$[q{n}]"] = updated_q
+            plan.array_filters.append({f"q{n}.internal_question_id": question_id})
+
+    return plan
@@ -0,0 +1,648 @@
+"""
+Unit and integration tests for canvas_client.py (async Canvas client)
+Canvas is faked with httpx.MockTransport so no network calls are made.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import pytest
+import httpx
+from canvas_client import AsyncCanvasClient
+from canvas_publisher import PublishError, ShellNotFoundError
+from quiz_state import QuizStateCache
+
+
+BASE_URL = "https://ufl.instructure.com"
+
+VALID_QUIZ_DOC = {
+    "course_id": 123,
+    "title": "Test Quiz",
+    "description_html": "",
+    "questions": [
+        {
+            "internal_question_id": "q1",
+            "position": 1,
+            "question_stem_html": "<p>What is 2+2?</p>",
+            "points_possible": 1,
+            "overall_rationale_html": "",
+            "choices": [
+                {"internal_choice_id": "c1", "text_html": "<p>3</p>", "is_correct": False},
+                {"internal_choice_id": "c2", "text_html": "<p>4</p>", "is_correct": True},
+            ]
+        }
+    ]
+}
+
+
+def make_client(handler, quiz_state=None):
+    """Build a client whose requests are answered by `handler`; returns (client, list of seen requests)."""
+    seen = []
+
+    def record(request):
+        seen.append(request)
+        return handler(request)
+
+    http = httpx.AsyncClient(transport=httpx.MockTransport(record))
+    client = AsyncCanvasClient(
+        canvas_url=BASE_URL, access_token="fake_token", client=http, quiz_state=quiz_state or QuizStateCache()
+    )
+    return client, seen
+
+
+# --- Retriever surface ---
+
+@pytest.mark.asyncio
+async def test_get_courses_filters_out_student_enrollment():
+    raw_courses = [
+        {"id": 1, "name": "Course A", "course_code": "A", "enrollments": [{"role": "TeacherEnrollment", "enrollment_state": "active"}]},
+        {"id": 2, "name": "Course B", "course_code": "B", "enrollments": [{"role": "StudentEnrollment", "enrollment_state": "active"}]},
+    ]
+    client, seen = make_client(lambda r: httpx.Response(200, json=raw_courses))
+    result = await client.get_courses()
+
+    assert [c["id"] for c in result] == [1]
+    assert seen[0].headers["Authorization"] == "Bearer fake_token"
+
+
+@pytest.mark.asyncio
+async def test_get_course_files_follows_pagination():
+    def handler(request):
+        if request.url.params.get("page") == "2":
+            return httpx.Response(200, json=[{"id": 2, "display_name": "file2.pdf"}])
+        return httpx.Response(
+            200,
+            json=[{"id": 1, "display_name": "file1.pdf"}],
+            headers={"Link": f'<{BASE_URL}/api/v1/courses/123/files?page=2>; rel="next"'}
+        )
+
+    client, seen = make_client(handler)
+    result = await client.get_course_files(123)
+
+    assert [f["display_name"] for f in result] == ["file1.pdf", "file2.pdf"]
+    assert len(seen) == 2
+
+
+def numbered_pages_handler(pages, delays=None, in_flight=None):
+    """Async MockTransport handler serving `pages` (a list of JSON lists) with numbered Link headers."""
+    delays = delays or {}
+
+    async def handler(request):
+        page = int(request.url.params.get("page", "1"))
+        if in_flight is not None:
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(delays.get(page, 0.01))
+        if in_flight is not None:
+            in_flight["now"] -= 1
+        links = [f'<{BASE_URL}/api/v1/courses/123/files?page={len(pages)}&per_page=100>; rel="last"']
+        if page < len(pages):
+            links.append(f'<{BASE_URL}/api/v1/courses/123/files?page={page + 1}&per_page=100>; rel="next"')
+        return httpx.Response(200, json=pages[page - 1], headers={"Link": ", ".join(links)})
+
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_numbered_pages_are_fetched_concurrently_in_order():
+    pages = [[{"id": n, "display_name": f"file{n}.pdf"}] for n in range(1, 6)]
+    in_flight = {"now": 0, "max": 0}
+    # Page 2 is the slowest, yet results still come back in page order
+    client, seen = make_client(numbered_pages_handler(pages, delays={2: 0.1}, in_flight=in_flight))
+    result = await client.get_course_files(123)
+
+    assert [f["id"] for f in result] == [1, 2, 3, 4, 5]
+    assert len(seen) == 5
+    assert in_flight["max"] > 1
+
+
+@pytest.mark.asyncio
+async def test_page_concurrency_is_capped():
+    pages = [[{"id": n}] for n in range(1, 10)]
+    in_flight = {"now": 0, "max": 0}
+    http = httpx.AsyncClient(transport=httpx.MockTransport(numbered_pages_handler(pages, in_flight=in_flight)))
+    client = AsyncCanvasClient(canvas_url=BASE_URL, access_token="fake_token", client=http, page_concurrency=2)
+    await client.get_course_files(123)
+
+    assert in_flight["max"] == 2
+
+
+@pytest.mark.asyncio
+async def test_bookmark_cursors_fall_back_to_serial_next_links():
+    def handler(request):
+        cursor = request.url.params.get("page")
+        if cursor == "bookmark:abc":
+            return httpx.Response(200, json=[{"id": 2}])
+        return httpx.Response(
+            200,
+            json=[{"id": 1}],
+            headers={"Link": f'<{BASE_URL}/api/v1/courses/123/files?page=bookmark:abc>; rel="next", '
+                             f'<{BASE_URL}/api/v1/courses/123/files?page=bookmark:zzz>; rel="last"'}
+        )
+
+    client, seen = make_client(handler)
+    result = await client.get_course_files(123)
+
+    assert [f["id"] for f in result] == [1, 2]
+    assert len(seen) == 2
+
+
+@pytest.mark.asyncio
+async def test_iter_pages_yields_before_listing_finishes():
+    pages = [[{"id": n}] for n in range(1, 4)]
+    ok = numbered_pages_handler(pages)
+    page_3_released = asyncio.Event()
+
+    async def handler(request):
+        # Page 3 only answers once the caller has consumed pages 1 and 2
+        if request.url.params.get("page") == "3":
+            await page_3_released.wait()
+        return await ok(request)
+
+    client, _ = make_client(handler)
+    received = []
+
+    async def consume():
+        async for page in client.iter_pages(f"{BASE_URL}/api/v1/courses/123/files", {"per_page": 100}):
+            received.append(page)
+            if len(received) == 2:
+                page_3_released.set()
+
+    await asyncio.wait_for(consume(), timeout=2)
+    assert received == pages
+
+
+@pytest.mark.asyncio
+async def test_failed_page_raises():
+    pages = [[{"id": 1}], [{"id": 2}], [{"id": 3}]]
+    ok = numbered_pages_handler(pages)
+
+    async def handler(request):
+        if request.url.params.get("page") == "2":
+            return httpx.Response(500)
+        return await ok(request)
+
+    client, _ = make_client(handler)
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.get_course_files(123)
+
+@pytest.mark.asyncio
+async def test_get_course_quizzes_failure_raises():
+    client, _ = make_client(lambda r: httpx.Response(404))
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.get_course_quizzes(123)
+
+
+@pytest.mark.asyncio
+async def test_get_all_course_content_returns_files_and_quizzes():
+    def handler(request):
+        path = request.url.path
+        if path.endswith("/files"):
+            return httpx.Response(200, json=[{"id": 1, "display_name": "notes.pdf"}])
+        if path.endswith("/questions"):
+            return httpx.Response(200, json=[{"id": 99, "question_name": "Q1"}])
+        return httpx.Response(200, json=[{"id": 10, "title": "Quiz 1"}])
+
+    client, _ = make_client(handler)
+    result = await client.get_all_course_content(123)
+
+    assert len(result["files"]) == 1
+    assert result["quizzes"][0]["questions"][0]["question_name"] == "Q1"
+
+
+@pytest.mark.asyncio
+async def test_get_all_course_content_keeps_going_when_a_quiz_fails():
+    def handler(request):
+        path = request.url.path
+        if path.endswith("/files"):
+            return httpx.Response(200, json=[])
+        if path.endswith("/11/questions"):
+            return httpx.Response(403)
+        if path.endswith("/questions"):
+            return httpx.Response(200, json=[{"id": int(path.split("/")[-2]), "question_name": "Q"}])
+        return httpx.Response(200, json=[{"id": 10, "title": "A"}, {"id": 11, "title": "B"}, {"id": 12, "title": "C"}])
+
+    client, _ = make_client(handler)
+    result = await client.get_all_course_content(123)
+
+    assert [q["questions"] for q in result["quizzes"]] == [[{"id": 10, "question_name": "Q"}], [], [{"id": 12, "question_name": "Q"}]]
+    assert [e["quiz_id"] for e in result["question_errors"]] == [11]
+
+@pytest.mark.asyncio
+async def test_download_file_returns_bytes():
+    client, _ = make_client(lambda r: httpx.Response(200, content=b"fake file content"))
+    assert await client.download_file("http://canvas/files/1/download") == b"fake file content"
+
+
+@pytest.mark.asyncio
+async def test_stream_file_returns_hash_of_written_content():
+    client, _ = make_client(lambda r: httpx.Response(200, content=b"fake file content"))
+    dest = io.BytesIO()
+    file_hash = await client.stream_file("http://canvas/files/1/download", dest)
+    assert dest.getvalue() == b"fake file content"
+    assert file_hash == hashlib.sha256(b"fake file content").hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_stream_file_over_limit_raises_value_error():
+    client, _ = make_client(lambda r: httpx.Response(200, content=b"x" * 2048))
+    with pytest.raises(ValueError, match="download limit"):
+        await client.stream_file("http://canvas/files/1/download", io.BytesIO(), max_bytes=1024)
+
+
+# --- Publisher surface ---
+
+@pytest.mark.asyncio
+async def test_publish_quiz_creates_shell_items_and_publishes():
+    def handler(request):
+        if request.method == "POST" and request.url.path.endswith("/items"):
+            return httpx.Response(200, json={"id": "item_xyz"})
+        if request.method == "POST":
+            return httpx.Response(200, json={"id": "quiz_abc"})
+        if request.method == "GET":
+            return httpx.Response(200, json={"id": "quiz_abc", "published": False})
+        return httpx.Response(200, json={})
+
+    client, seen = make_client(handler)
+    result = await client.publish_quiz_to_canvas(VALID_QUIZ_DOC, publish=True)
+
+    assert result["new_quiz_id"] == "quiz_abc"
+    assert result["questions"][0]["canvas_item_id"] == "item_xyz"
+    patch_body = json.loads(seen[-1].content)
+    assert seen[-1].method == "PATCH"
+    assert patch_body["quiz"]["published"] is True
+
+
+@pytest.mark.asyncio
+async def test_publish_false_skips_patch():
+    def handler(request):
+        if request.url.path.endswith("/items"):
+            return httpx.Response(200, json={"id": "item_xyz"})
+        return httpx.Response(200, json={"id": "quiz_abc"})
+
+    client, seen = make_client(handler)
+    await client.publish_quiz_to_canvas(VALID_QUIZ_DOC, publish=False)
+
+    assert all(r.method == "POST" for r in seen)
+
+
+@pytest.mark.asyncio
+async def test_shell_creation_failure_raises_runtime_error():
+    client, _ = make_client(lambda r: httpx.Response(401, text="Unauthorized"))
+    with pytest.raises(RuntimeError, match="Failed to create quiz shell"):
+        await client.publish_quiz_to_canvas(VALID_QUIZ_DOC)
+
+
+def make_quiz_doc(count, **overrides):
+    question = VALID_QUIZ_DOC["questions"][0]
+    questions = [{**question, "internal_question_id": f"q{n}", "position": n} for n in range(1, count + 1)]
+    return {**VALID_QUIZ_DOC, "questions": questions, **overrides}
+
+
+def publish_handler(fail_items=(), in_flight=None, throttle_first=0):
+    """Async Canvas stand-in for publishing: numbered items, optional failures / 429s / concurrency tracking."""
+    state = {"throttled": 0}
+
+    async def handler(request):
+        if request.method == "POST" and request.url.path.endswith("/items"):
+            body = json.loads(request.content)
+            position = body["item"]["position"]
+            if state["throttled"] < throttle_first:
+                state["throttled"] += 1
+                return httpx.Response(429, headers={"Retry-After": "0"})
+            if in_flight is not None:
+                in_flight["now"] += 1
+                in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            if in_flight is not None:
+                in_flight["now"] -= 1
+            if position in fail_items:
+                return httpx.Response(500, text="boom")
+            return httpx.Response(200, json={"id": f"item_{position}"})
+        if request.method == "POST":
+            return httpx.Response(200, json={"id": "quiz_abc"})
+        if request.method == "GET":
+            return httpx.Response(200, json={"id": "quiz_abc", "published": False})
+        return httpx.Response(200, json={})
+
+    return handler
+
+
+def make_publish_client(handler, **kwargs):
+    seen = []
+
+    async def record(request):
+        seen.append(request)
+        return await handler(request)
+
+    http = httpx.AsyncClient(transport=httpx.MockTransport(record))
+    kwargs.setdefault("quiz_state", QuizStateCache())
+    client = AsyncCanvasClient(canvas_url=BASE_URL, access_token="fake_token", client=http, retry_backoff=0, **kwargs)
+    return client, seen
+
+
+@pytest.mark.asyncio
+async def test_items_are_created_concurrently_with_explicit_positions():
+    in_flight = {"now": 0, "max": 0}
+    client, seen = make_publish_client(publish_handler(in_flight=in_flight), item_concurrency=3)
+    result = await client.publish_quiz_to_canvas(make_quiz_doc(8), publish=False)
+
+    assert in_flight["max"] == 3
+    assert [q["canvas_item_id"] for q in result["questions"]] == [f"item_{n}" for n in range(1, 9)]
+    positions = sorted(json.loads(r.content)["item"]["position"] for r in seen if r.url.path.endswith("/items"))
+    assert positions == list(range(1, 9))
+
+
+@pytest.mark.asyncio
+async def test_throttled_item_posts_are_retried():
+    client, seen = make_publish_client(publish_handler(throttle_first=2))
+    result = await client.publish_quiz_to_canvas(make_quiz_doc(2), publish=False)
+
+    assert [q["canvas_item_id"] for q in result["questions"]] == ["item_1", "item_2"]
+    assert sum(r.url.path.endswith("/items") for r in seen) == 4
+
+
+@pytest.mark.asyncio
+async def test_unavailable_item_posts_are_retried():
+    attempts = []
+
+    async def handler(request):
+        if request.url.path.endswith("/items"):
+            attempts.append(request)
+            if len(attempts) == 1:
+                return httpx.Response(503)
+            return httpx.Response(200, json={"id": "item_1"})
+        return httpx.Response(200, json={"id": "quiz_abc"})
+
+    client, _ = make_publish_client(handler)
+    result = await client.publish_quiz_to_canvas(make_quiz_doc(1), publish=False)
+
+    assert len(attempts) == 2
+    assert result["questions"][0]["canvas_item_id"] == "item_1"
+
+
+@pytest.mark.asyncio
+async def test_server_errors_are_retried_for_idempotent_requests_only():
+    calls = {"GET": 0, "POST": 0}
+
+    async def handler(request):
+        calls[request.method] += 1
+        return httpx.Response(502)
+
+    client, _ = make_publish_client(handler)
+    url = f"{BASE_URL}/api/quiz/v1/courses/123/quizzes"
+    assert (await client._send_with_retry("POST", url, json={})).status_code == 502
+    assert (await client._send_with_retry("GET", url)).status_code == 502
+
+    assert calls == {"GET": 4, "POST": 1}
+
+
+@pytest.mark.asyncio
+async def test_partial_failure_reports_created_items():
+    client, seen = make_publish_client(publish_handler(fail_items={2}))
+    with pytest.raises(PublishError, match="Failed to create item for question q2") as exc_info:
+        await client.publish_quiz_to_canvas(make_quiz_doc(3), publish=True)
+
+    error = exc_info.value
+    assert error.new_quiz_id == "quiz_abc"
+    assert [q["canvas_item_id"] for q in error.questions] == ["item_1", None, "item_3"]
+    # A 500 on a POST is not retried (the item may exist), and the quiz is not published with a missing question
+    assert sum(json.loads(r.content)["item"]["position"] == 2 for r in seen if r.url.path.endswith("/items")) == 1
+    assert not any(r.method == "PATCH" for r in seen)
+
+
+@pytest.mark.asyncio
+async def test_resume_reuses_shell_and_skips_existing_items():
+    quiz_doc = make_quiz_doc(3, new_quiz_id="quiz_abc")
+    quiz_doc["questions"][0]["canvas_item_id"] = "item_1"
+    quiz_doc["questions"][2]["canvas_item_id"] = "item_3"
+
+    client, seen = make_publish_client(publish_handler())
+    result = await client.publish_quiz_to_canvas(quiz_doc, publish=True)
+
+    posts = [r for r in seen if r.method == "POST"]
+    assert len(posts) == 1 and json.loads(posts[0].content)["item"]["position"] == 2
+    assert [q["canvas_item_id"] for q in result["questions"]] == ["item_1", "item_2", "item_3"]
+    assert seen[-1].method == "PATCH"
+
+
+@pytest.mark.asyncio
+async def test_resuming_into_deleted_shell_raises_shell_not_found():
+    async def handler(request):
+        if request.method == "GET":
+            return httpx.Response(404)
+        return httpx.Response(200, json={"id": "item_1"})
+
+    client, seen = make_publish_client(handler)
+    with pytest.raises(ShellNotFoundError):
+        await client.publish_quiz_to_canvas(make_quiz_doc(2, new_quiz_id="gone"))
+    assert [r.method for r in seen] == ["GET"]
+
+
+@pytest.mark.asyncio
+async def test_stale_item_ids_without_a_shell_are_posted_again():
+    # e.g. the quiz was deleted on Canvas and reverted to draft
+    quiz_doc = make_quiz_doc(2)
+    for n, q in enumerate(quiz_doc["questions"], start=1):
+        q["canvas_item_id"] = f"old_item_{n}"
+
+    client, seen = make_publish_client(publish_handler())
+    result = await client.publish_quiz_to_canvas(quiz_doc, publish=False)
+
+    assert sum(r.url.path.endswith("/items") for r in seen) == 2
+    assert [q["canvas_item_id"] for q in result["questions"]] == ["item_1", "item_2"]
+
+
+@pytest.mark.asyncio
+async def test_progress_callbacks_fire_as_canvas_confirms_each_step():
+    shells, items = [], {}
+    client, _ = make_publish_client(publish_handler(fail_items={3}))
+    with pytest.raises(PublishError):
+        await client.publish_quiz_to_canvas(
+            make_quiz_doc(3),
+            on_shell_created=shells.append,
+            on_item_created=lambda question_id, item_id: items.__setitem__(question_id, item_id)
+        )
+
+    assert shells == ["quiz_abc"]
+    assert items == {"q1": "item_1", "q2": "item_2"}
+
+@pytest.mark.asyncio
+async def test_invalid_question_fails_before_shell_is_created():
+    quiz_doc = make_quiz_doc(2)
+    quiz_doc["questions"][1]["choices"] = [{**c, "is_correct": False} for c in quiz_doc["questions"][1]["choices"]]
+
+    client, seen = make_publish_client(publish_handler())
+    with pytest.raises(RuntimeError, match="has no correct choice"):
+        await client.publish_quiz_to_canvas(quiz_doc)
+    assert seen == []
+
+@pytest.mark.asyncio
+async def test_unpublish_sends_published_false():
+    def handler(request):
+        if request.method == "GET":
+            return httpx.Response(200, json={"id": "quiz_abc", "published": True})
+        return httpx.Response(200, json={})
+
+    client, seen = make_client(handler)
+    await client.unpublish_canvas_quiz(123, "quiz_abc")
+
+    assert json.loads(seen[-1].content)["quiz"]["published"] is False
+
+
+@pytest.mark.asyncio
+async def test_publish_existing_is_a_single_minimal_patch():
+    client, seen = make_client(lambda r: httpx.Response(200, json={"id": "quiz_abc", "published": True}))
+    await client.publish_existing_canvas_quiz(123, "quiz_abc")
+
+    assert [r.method for r in seen] == ["PATCH"]
+    assert json.loads(seen[0].content) == {"quiz": {"published": True}}
+
+
+@pytest.mark.asyncio
+async def test_update_points_is_a_single_minimal_patch():
+    client, seen = make_client(lambda r: httpx.Response(200, json={}))
+    await client.update_item_points_on_canvas(123, "quiz_abc", "item_xyz", 5.0)
+
+    assert [r.method for r in seen] == ["PATCH"]
+    assert json.loads(seen[0].content) == {"item": {"points_possible": 5.0}}
+
+
+@pytest.mark.asyncio
+async def test_bulk_points_update_runs_concurrently_and_reports_failures():
+    in_flight = {"now": 0, "max": 0}
+
+    async def handler(request):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        if request.url.path.endswith("/items/item_2"):
+            return httpx.Response(404, text="Not Found")
+        return httpx.Response(200, json={})
+
+    client, seen = make_publish_client(handler, item_concurrency=3)
+    outcome = await client.update_items_points_on_canvas(123, "quiz_abc", {f"item_{n}": float(n) for n in range(1, 7)})
+
+    assert len(seen) == 6 and all(r.method == "PATCH" for r in seen)
+    assert in_flight["max"] == 3
+    assert outcome.failed_items() == ["item_2"]
+    assert "Failed to update points for item item_2" in str(outcome.failures[0]["error"])
+
+
+@pytest.mark.asyncio
+async def test_rejected_minimal_patch_falls_back_to_full_item_on_both_levels():
+    item_data = {"id": "item_xyz", "points_possible": 1, "entry": {"points_possible": 1}}
+
+    def handler(request):
+        if request.method == "GET":
+            return httpx.Response(200, json=item_data)
+        if "entry" not in json.loads(request.content)["item"]:
+            return httpx.Response(422, json={"errors": ["entry is required"]})
+        return httpx.Response(200, json={})
+
+    client, seen = make_client(handler)
+    await client.update_item_points_on_canvas(123, "quiz_abc", "item_xyz", 5.0)
+
+    assert [r.method for r in seen] == ["PATCH", "GET", "PATCH"]
+    patched = json.loads(seen[-1].content)["item"]
+    assert patched["points_possible"] == 5.0
+    assert patched["entry"]["points_possible"] == 5.0
+
+
+@pytest.mark.asyncio
+async def test_invalid_value_is_reported_without_fallback():
+    client, seen = make_client(
+        lambda r: httpx.Response(422, json={"errors": [{"message": "points_possible must be greater than or equal to 0"}]})
+    )
+    with pytest.raises(RuntimeError, match="must be greater than or equal to 0"):
+        await client.update_item_points_on_canvas(123, "quiz_abc", "item_xyz", -1.0)
+
+    assert [r.method for r in seen] == ["PATCH"]
+
+
+@pytest.mark.asyncio
+async def test_quiz_reads_are_conditional_on_cached_etag():
+    def handler(request):
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json={"id": "quiz_abc", "title": "Week 1"}, headers={"ETag": '"v1"'})
+
+    client, seen = make_client(handler)
+    assert await client.fetch_canvas_quiz_title(123, "quiz_abc") == "Week 1"
+    assert await client.fetch_canvas_quiz_title(123, "quiz_abc") == "Week 1"
+
+    assert "If-None-Match" not in seen[0].headers
+    assert seen[1].headers["If-None-Match"] == '"v1"'
+
+
+@pytest.mark.asyncio
+async def test_delete_forgets_cached_quiz_state():
+    quiz_state = QuizStateCache()
+    client, _ = make_client(lambda r: httpx.Response(200, json={"id": "quiz_abc", "title": "T"}), quiz_state)
+    await client.fetch_canvas_quiz_title(123, "quiz_abc")
+    await client.delete_quiz_from_canvas(123, "quiz_abc")
+
+    assert quiz_state.get("fake_token", client._quiz_url(123, "quiz_abc")) is None
+
+
+@pytest.mark.asyncio
+async def test_fetch_quiz_items_reads_every_page():
+    pages = [[{"id": f"item_{n}"} for n in range(p * 100 + 1, min((p + 1) * 100, 230) + 1)] for p in range(3)]
+    client, seen = make_client(numbered_pages_handler(pages))
+    items = await client.fetch_canvas_quiz_items(123, "quiz_abc")
+
+    assert len(items) == 230 and items[-1]["id"] == "item_230"
+    assert len(seen) == 3
+
+
+@pytest.mark.asyncio
+async def test_fetch_quiz_items_failure_raises_runtime_error():
+    client, _ = make_client(lambda r: httpx.Response(500, text="boom"))
+    with pytest.raises(RuntimeError, match="Failed to fetch quiz items from Canvas: 500"):
+        await client.fetch_canvas_quiz_items(123, "quiz_abc")
+
+
+@pytest.mark.asyncio
+async def test_fetch_quiz_title_failure_raises():
+    client, _ = make_client(lambda r: httpx.Response(404, text="Not Found"))
+    with pytest.raises(RuntimeError, match="Failed to fetch quiz"):
+        await client.fetch_canvas_quiz_title(123, "quiz_abc")
+
+
+@pytest.mark.asyncio
+async def test_delete_quiz_failure_raises():
+    client, _ = make_client(lambda r: httpx.Response(403, text="Forbidden"))
+    with pytest.raises(RuntimeError, match="Failed to delete quiz"):
+        await client.delete_quiz_from_canvas(123, "quiz_abc")
+
+
+@pytest.mark.asyncio
+async def test_delete_quiz_already_gone_on_canvas_succeeds():
+    client, _ = make_client(lambda r: httpx.Response(404))
+    await client.delete_quiz_from_canvas(123, "quiz_abc")
+
+
+@pytest.mark.asyncio
+async def test_get_all_new_quizzes_returns_correct_structure():
+    quizzes = [{"id": 1, "title": "Quiz A", "published": True}, {"title": "No ID"}]
+    client, _ = make_client(lambda r: httpx.Response(200, json=quizzes))
+    result = await client.get_all_new_quizzes_for_course(123)
+
+    assert result == {"1": {"title": "Quiz A", "published": True}}
+
+
+@pytest.mark.asyncio
+async def test_get_all_new_quizzes_failure_raises():
+    client, _ = make_client(lambda r: httpx.Response(500, text="boom"))
+    with pytest.raises(RuntimeError, match="Failed to fetch New Quizzes"):
+        await client.get_all_new_quizzes_for_course(123)
+
+
+@pytest.mark.asyncio
+async def test_shared_client_is_not_closed():
+    http = httpx.AsyncClient(transport=httpx.MockTransport(lambda r: httpx.Response(200, json=[])))
+    async with AsyncCanvasClient(canvas_url=BASE_URL, access_token="t", client=http) as canvas:
+        await canvas.get_courses()
+    assert not http.is_closed
+    await http.aclose()
@@ -0,0 +1,233 @@
+"""
+Tests for canvas_rate_limit.py
+Mock Canvas servers keep a per-token leaky bucket and answer with X-Rate-Limit-Remaining / X-Request-Cost,
+or 403 "Rate Limit Exceeded" once the bucket is empty - the way Canvas does.
+"""
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import pytest
+import requests
+from canvas_rate_limit import (
+    CanvasRateLimits, RateLimitedAdapter, RateLimitedAsyncTransport, RateLimitedTransport, RateLimiter
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Bucket:
+    """Canvas-style leaky bucket per token."""
+
+    def __init__(self, capacity=100.0, refill_per_second=1000.0, cost=10.0):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.cost = cost
+        self.levels = {}
+        self.rejected = 0
+        self.max_concurrent = 0
+        self._concurrent = 0
+        self._lock = threading.Lock()
+
+    def take(self, token):
+        with self._lock:
+            level, at = self.levels.get(token, (self.capacity, time.monotonic()))
+            now = time.monotonic()
+            level = min(self.capacity, level + (now - at) * self.refill_per_second)
+            if level < self.cost:
+                self.levels[token] = (level, now)
+                self.rejected += 1
+                return None
+            level -= self.cost
+            self.levels[token] = (level, now)
+            return level
+
+    def headers(self, remaining):
+        return {"X-Rate-Limit-Remaining": f"{remaining:.1f}", "X-Request-Cost": f"{self.cost:.1f}"}
+
+
+def limits(**options):
+    return CanvasRateLimits(**{"capacity": 100.0, "refill_per_second": 1000.0, "reserve": 0.0, **options})
+
+
+# --- RateLimiter ---
+
+def test_calls_wait_once_reported_budget_is_used_up():
+    clock = FakeClock()
+    limiter = RateLimiter(capacity=100, refill_per_second=10, reserve=0, clock=clock)
+
+    assert limiter.try_acquire() == 0
+    limiter.release({"X-Rate-Limit-Remaining": "12", "X-Request-Cost": "10"})
+    # Cost estimate is smoothed from the default 5 towards 10
+    assert limiter.try_acquire() == 0
+    delay = limiter.try_acquire()
+    assert delay > 0
+
+    clock.now += delay + 0.01
+    assert limiter.try_acquire() == 0
+
+
+def test_concurrency_is_capped_even_with_budget_left():
+    limiter = RateLimiter(max_concurrency=2, clock=FakeClock())
+
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() > 0
+    limiter.release()
+    assert limiter.try_acquire() == 0
+
+
+def test_rate_limited_response_empties_the_estimate():
+    clock = FakeClock()
+    limiter = RateLimiter(capacity=700, refill_per_second=10, reserve=50, clock=clock)
+
+    limiter.try_acquire()
+    limiter.release({}, rate_limited=True)
+
+    assert limiter.try_acquire() > 5
+    assert limiter.metrics()["rate_limited_responses"] == 1
+
+
+def test_tokens_are_limited_independently():
+    registry = limits()
+    registry.for_token("a").try_acquire()
+
+    assert registry.metrics_for("a")["in_flight"] == 1
+    assert registry.metrics_for("b")["in_flight"] == 0
+    assert registry.for_request(httpx.Headers({"Authorization": "Bearer a"})) is registry.for_token("a")
+    assert registry.for_request(httpx.Headers({})) is None
+
+
+# --- httpx transports ---
+
+@pytest.mark.asyncio
+async def test_async_burst_is_queued_instead_of_failing():
+    bucket = Bucket()
+
+    async def handler(request):
+        remaining = bucket.take(request.headers["Authorization"])
+        if remaining is None:
+            return httpx.Response(403, text="403 Forbidden (Rate Limit Exceeded)", headers=bucket.headers(0))
+        await asyncio.sleep(0.005)
+        return httpx.Response(200, json={"ok": True}, headers=bucket.headers(remaining))
+
+    registry = limits()
+    transport = RateLimitedAsyncTransport(httpx.MockTransport(handler), registry)
+    async with httpx.AsyncClient(transport=transport) as client:
+        responses = await asyncio.gather(*[
+            client.get("https://canvas/api/v1/x", headers={"Authorization": "Bearer tok"}) for _ in range(40)
+        ])
+
+    assert [r.status_code for r in responses] == [200] * 40
+    metrics = registry.metrics_for("tok")
+    assert metrics["requests"] >= 40
+    assert metrics["throttled_waits"] > 0
+    assert metrics["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_403_is_retried():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(403, text="403 Forbidden (Rate Limit Exceeded)", headers={"X-Rate-Limit-Remaining": "0"})
+        return httpx.Response(200, json={"id": 1}, headers={"X-Rate-Limit-Remaining": "600"})
+
+    registry = limits()
+    transport = RateLimitedAsyncTransport(httpx.MockTransport(handler), registry)
+    async with httpx.AsyncClient(transport=transport) as client:
+        response = await client.post("https://canvas/api/x", json={"a": 1}, headers={"Authorization": "Bearer tok"})
+
+    assert response.status_code == 200
+    assert len(calls) == 2 and calls[1].content == b'{"a":1}'
+    assert registry.metrics_for("tok")["rate_limited_responses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_other_403s_are_returned_untouched():
+    async def handler(request):
+        return httpx.Response(403, text="user not authorized to perform that action")
+
+    transport = RateLimitedAsyncTransport(httpx.MockTransport(handler), limits())
+    async with httpx.AsyncClient(transport=transport) as client:
+        response = await client.get("https://canvas/api/x", headers={"Authorization": "Bearer tok"})
+
+    assert response.status_code == 403
+    assert response.text == "user not authorized to perform that action"
+
+
+def test_sync_transport_releases_slot_when_the_request_fails():
+    def handler(request):
+        raise httpx.ConnectError("boom")
+
+    registry = limits()
+    with httpx.Client(transport=RateLimitedTransport(httpx.MockTransport(handler), registry)) as client:
+        with pytest.raises(httpx.ConnectError):
+            client.get("https://canvas/api/x", headers={"Authorization": "Bearer tok"})
+
+    assert registry.metrics_for("tok")["in_flight"] == 0
+
+
+# --- requests adapter against a local mock Canvas ---
+
+class MockCanvas:
+    def __init__(self, bucket):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                remaining = bucket.take(self.headers["Authorization"])
+                if remaining is None:
+                    body, status, headers = b"403 Forbidden (Rate Limit Exceeded)", 403, bucket.headers(0)
+                else:
+                    body, status, headers = b'{"ok": true}', 200, bucket.headers(remaining)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_requests_burst_from_threads_never_surfaces_rate_limit():
+    bucket = Bucket(capacity=60.0, refill_per_second=600.0)
+    registry = limits(capacity=60.0, refill_per_second=600.0)
+    session = requests.Session()
+    session.mount("http://", RateLimitedAdapter(registry))
+    statuses = []
+
+    with MockCanvas(bucket) as canvas:
+        def call():
+            statuses.append(session.get(f"{canvas.url}/api/v1/x", headers={"Authorization": "Bearer tok"}).status_code)
+        threads = [threading.Thread(target=call) for _ in range(30)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    assert statuses == [200] * 30
+    assert registry.metrics_for("tok")["throttled_waits"] > 0
@@ -3,6 +3,7 @@ Unit, integration, and system tests for canvas_retriever.py
 """
 import pytest
 import hashlib
+import io
 from unittest.mock import patch, MagicMock
 from canvas_retriever import CanvasContentRetriever
 
@@ -19,6 +20,8 @@ def mock_response(ok=True, json_data=None, status_code=200, links=None):
     m.status_code = status_code
     m.json.return_value = json_data if json_data is not None else []
     m.content = b"fake file content"
+    m.iter_content.return_value = [b"fake file ", b"content"]
+    m.headers = {}
     m.links = links if links is not None else {}
     if not ok:
         m.raise_for_status.side_effect = Exception(f"HTTP {status_code}")
@@ -47,7 +50,7 @@ def test_get_courses_filters_out_student_enrollment():
         {"id": 1, "name": "Course A", "course_code": "A", "enrollments": [{"role": "TeacherEnrollment", "enrollment_state": "active"}]},
         {"id": 2, "name": "Course B", "course_code": "B", "enrollments": [{"role": "StudentEnrollment", "enrollment_state": "active"}]},
     ]
-    with patch("requests.get", return_value=mock_response(json_data=raw_courses)):
+    with patch("requests.Session.get", return_value=mock_response(json_data=raw_courses)):
         result = retriever.get_courses()
     assert len(result) == 1
     assert result[0]["id"] == 1
@@ -60,7 +63,7 @@ def test_get_courses_includes_ta_and_designer_enrollment():
         {"id": 2, "name": "Course B", "course_code": "B", "enrollments": [{"role": "DesignerEnrollment", "enrollment_state": "active"}]},
         {"id": 3, "name": "Course C", "course_code": "C", "enrollments": [{"role": "StudentEnrollment", "enrollment_state": "active"}]},
     ]
-    with patch("requests.get", return_value=mock_response(json_data=raw_courses)):
+    with patch("requests.Session.get", return_value=mock_response(json_data=raw_courses)):
         result = retriever.get_courses()
     assert len(result) == 2
     assert {r["id"] for r in result} == {1, 2}
@@ -73,7 +76,7 @@ def test_get_courses_returns_correct_fields():
     raw_courses = [
         {"id": 10, "name": "ML Engineering", "course_code": "CAI6108", "enrollments": [{"role": "TeacherEnrollment", "enrollment_state": "active"}]},
     ]
-    with patch("requests.get", return_value=mock_response(json_data=raw_courses)):
+    with patch("requests.Session.get", return_value=mock_response(json_data=raw_courses)):
         result = retriever.get_courses()
     assert result[0]["id"] == 10
     assert result[0]["name"] == "ML Engineering"
@@ -82,7 +85,7 @@ def test_get_courses_returns_correct_fields():
 
 def test_get_courses_failure_raises():
     retriever = make_retriever()
-    with patch("requests.get", return_value=mock_response(ok=False, status_code=401)):
+    with patch("requests.Session.get", return_value=mock_response(ok=False, status_code=401)):
         with pytest.raises(Exception):
             retriever.get_courses()
 
@@ -94,7 +97,7 @@ def test_get_course_files_returns_correct_fields():
     raw_files = [{"id": 1, "folder_id": 2, "display_name": "notes.pdf", "filename": "notes.pdf",
                   "content-type": "application/pdf", "url": "http://canvas/files/1", "size": 1024,
                   "created_at": "2024-01-01", "updated_at": "2024-01-02", "modified_at": "2024-01-02", "mime_class": "pdf"}]
-    with patch("requests.get", return_value=mock_response(json_data=raw_files)):
+    with patch("requests.Session.get", return_value=mock_response(json_data=raw_files)):
         result = retriever.get_course_files(123)
     assert result[0]["display_name"] == "notes.pdf"
     assert result[0]["mime_class"] == "pdf"
@@ -112,7 +115,7 @@ def test_get_course_files_follows_pagination():
                                        "size": None, "created_at": None, "updated_at": None,
                                        "modified_at": None, "mime_class": None}],
                           links={})
-    with patch("requests.get", side_effect=[page1, page2]):
+    with patch("requests.Session.get", side_effect=[page1, page2]):
         result = retriever.get_course_files(123)
     assert len(result) == 2
     assert result[0]["display_name"] == "file1.pdf"
@@ -121,7 +124,7 @@ def test_get_course_files_follows_pagination():
 
 def test_get_course_files_failure_raises():
     retriever = make_retriever()
-    with patch("requests.get", return_value=mock_response(ok=False, status_code=403)):
+    with patch("requests.Session.get", return_value=mock_response(ok=False, status_code=403)):
         with pytest.raises(Exception):
             retriever.get_course_files(123)
 
@@ -132,7 +135,7 @@ def test_get_course_quizzes_returns_correct_fields():
     retriever = make_retriever()
     raw_quizzes = [{"id": 5, "title": "Quiz 1", "description": "desc", "html_url": "http://canvas/quiz/5",
                     "question_count": 10, "points_possible": 10.0, "due_at": None, "published": True}]
-    with patch("requests.get", return_value=mock_response(json_data=raw_quizzes)):
+    with patch("requests.Session.get", return_value=mock_response(json_data=raw_quizzes)):
         result = retriever.get_course_quizzes(123)
     assert result[0]["id"] == 5
     assert result[0]["title"] == "Quiz 1"
@@ -147,14 +150,14 @@ def test_get_course_quizzes_follows_pagination():
     page2 = mock_response(json_data=[{"id": 2, "title": "Quiz B", "description": None, "html_url": None,
                                        "question_count": 3, "points_possible": 3.0, "due_at": None, "published": False}],
                           links={})
-    with patch("requests.get", side_effect=[page1, page2]):
+    with patch("requests.Session.get", side_effect=[page1, page2]):
         result = retriever.get_course_quizzes(123)
     assert len(result) == 2
 
 
 def test_get_course_quizzes_failure_raises():
     retriever = make_retriever()
-    with patch("requests.get", return_value=mock_response(ok=False, status_code=404)):
+    with patch("requests.Session.get", return_value=mock_response(ok=False, status_code=404)):
         with pytest.raises(Exception):
             retriever.get_course_quizzes(123)
 
@@ -164,7 +167,7 @@ def test_get_course_quizzes_failure_raises():
 def test_get_quiz_questions_returns_all_questions():
     retriever = make_retriever()
     raw_questions = [{"id": 1, "question_name": "Q1", "question_text": "What is X?"}]
-    with patch("requests.get", return_value=mock_response(json_data=raw_questions)):
+    with patch("requests.Session.get", return_value=mock_response(json_data=raw_questions)):
         result = retriever.get_quiz_questions(123, 456)
     assert len(result) == 1
     assert result[0]["question_name"] == "Q1"
@@ -172,7 +175,7 @@ def test_get_quiz_questions_returns_all_questions():
 
 def test_get_quiz_questions_failure_raises():
     retriever = make_retriever()
-    with patch("requests.get", return_value=mock_response(ok=False, status_code=403)):
+    with patch("requests.Session.get", return_value=mock_response(ok=False, status_code=403)):
         with pytest.raises(Exception):
             retriever.get_quiz_questions(123, 456)
 
@@ -181,31 +184,58 @@ def test_get_quiz_questions_failure_raises():
 
 def test_download_file_returns_bytes():
     retriever = make_retriever()
-    with patch("requests.get", return_value=mock_response(ok=True)):
+    with patch("requests.Session.get", return_value=mock_response(ok=True)):
         result = retriever.download_file("http://canvas/files/1/download")
     assert result == b"fake file content"
 
 
 def test_download_file_failure_raises():
     retriever = make_retriever()
-    with patch("requests.get", return_value=mock_response(ok=False, status_code=403)):
+    with patch("requests.Session.get", return_value=mock_response(ok=False, status_code=403)):
         with pytest.raises(Exception):
             retriever.download_file("http://canvas/files/1/download")
 
 
+
+def test_stream_file_writes_chunks_and_returns_hash():
+    retriever = make_retriever()
+    dest = io.BytesIO()
+    with patch("requests.Session.get", return_value=mock_response(ok=True)) as mock_get:
+        file_hash = retriever.stream_file("http://canvas/files/1/download", dest)
+    assert dest.getvalue() == b"fake file content"
+    assert file_hash == hashlib.sha256(b"fake file content").hexdigest()
+    assert mock_get.call_args[1]["stream"] is True
+
+
+def test_stream_file_rejects_content_length_over_limit():
+    retriever = make_retriever()
+    response = mock_response(ok=True)
+    response.headers = {"Content-Length": "5000"}
+    with patch("requests.Session.get", return_value=response):
+        with pytest.raises(ValueError, match="download limit"):
+            retriever.stream_file("http://canvas/files/1/download", io.BytesIO(), max_bytes=1000)
+    response.iter_content.assert_not_called()
+
+
+def test_download_file_stops_once_limit_is_crossed():
+    retriever = make_retriever()
+    with patch("requests.Session.get", return_value=mock_response(ok=True)):
+        with pytest.raises(ValueError, match="download limit"):
+            retriever.download_file("http://canvas/files/1/download", max_bytes=12)
+
 # --- Integration Tests: get_assignment_groups ---
 
 def test_get_assignment_groups_returns_id_and_name():
     retriever = make_retriever()
     raw_groups = [{"id": 1, "name": "Homework"}, {"id": 2, "name": "Quizzes"}]
-    with patch("requests.get", return_value=mock_response(json_data=raw_groups)):
+    with patch("requests.Session.get", return_value=mock_response(json_data=raw_groups)):
         result = retriever.get_assignment_groups(123)
     assert result == [{"id": 1, "name": "Homework"}, {"id": 2, "name": "Quizzes"}]
 
 
 def test_get_assignment_groups_failure_raises():
     retriever = make_retriever()
-    with patch("requests.get", return_value=mock_response(ok=False, status_code=500)):
+    with patch("requests.Session.get", return_value=mock_response(ok=False, status_code=500)):
         with pytest.raises(Exception):
             retriever.get_assignment_groups(123)
 
@@ -226,7 +256,7 @@ def test_get_all_course_content_returns_files_and_quizzes():
         mock_response(json_data=quiz_data),
         mock_response(json_data=question_data),
     ]
-    with patch("requests.get", side_effect=responses):
+    with patch("requests.Session.get", side_effect=responses):
         result = retriever.get_all_course_content(123)
 
     assert len(result["files"]) == 1
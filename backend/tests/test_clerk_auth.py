@@ -1,21 +1,161 @@
 """
-Unit tests for JWT decoding logic in clerk_auth.py
+Unit tests for JWT verification in clerk_auth.py
+Tokens are signed with a locally generated RSA key; the JWKS is a stub file on disk.
 """
 import pytest
 import base64
 import json
-import os
+import time
 from unittest.mock import AsyncMock, MagicMock, patch
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from clerk_auth import JWKSCache, verify_clerk_token
 
 
-def make_fake_jwt(payload: dict) -> str:
-    encoded = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
-    return f"fakeheader.{encoded}.fakesignature"
+PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+OTHER_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def make_jwk(private_key, kid: str) -> dict:
+    numbers = private_key.public_key().public_numbers()
+    return {
+        "kty": "RSA",
+        "kid": kid,
+        "alg": "RS256",
+        "n": b64url(numbers.n.to_bytes((numbers.n.bit_length() + 7) // 8, "big")),
+        "e": b64url(numbers.e.to_bytes(3, "big")),
+    }
+
+
+def make_signed_jwt(payload: dict, private_key=PRIVATE_KEY, kid: str = "key_1", alg: str = "RS256") -> str:
+    header = b64url(json.dumps({"alg": alg, "kid": kid, "typ": "JWT"}).encode())
+    body = b64url(json.dumps(payload).encode())
+    signature = private_key.sign(f"{header}.{body}".encode(), padding.PKCS1v15(), hashes.SHA256())
+    return f"{header}.{body}.{b64url(signature)}"
+
+
+@pytest.fixture
+def jwks_file(tmp_path):
+    path = tmp_path / "jwks.json"
+    path.write_text(json.dumps({"keys": [make_jwk(PRIVATE_KEY, "key_1")]}))
+    return path
+
+
+@pytest.fixture
+def stub_jwks(jwks_file):
+    """Swap the module JWKS cache for one that reads the stub file; returns the fetch counter."""
+    fetch = AsyncMock(side_effect=lambda: json.loads(jwks_file.read_text()))
+    with patch("clerk_auth.jwks_cache", JWKSCache(fetch=fetch, min_refresh_interval=0)):
+        yield fetch
+
+
+def valid_claims(**overrides) -> dict:
+    claims = {"sub": "user_test_123", "exp": time.time() + 60, "nbf": time.time() - 5}
+    claims.update(overrides)
+    return claims
 
 
 @pytest.mark.asyncio
-async def test_valid_token_extracts_correct_user_id():
-    fake_token = make_fake_jwt({"sub": "user_test_123"})
+async def test_valid_token_extracts_correct_user_id(stub_jwks):
+    result = await verify_clerk_token(make_signed_jwt(valid_claims()))
+    assert result["sub"] == "user_test_123"
+    assert result["email"] is None
+
+
+@pytest.mark.asyncio
+async def test_profile_claims_are_returned_when_present(stub_jwks):
+    token = make_signed_jwt(valid_claims(email="test@example.com", first_name="Test"))
+    result = await verify_clerk_token(token)
+    assert result["email"] == "test@example.com"
+    assert result["first_name"] == "Test"
+
+
+@pytest.mark.asyncio
+async def test_malformed_token_raises_value_error():
+    with pytest.raises(ValueError, match="Invalid token"):
+        await verify_clerk_token("onlytwoparts.here")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("header, payload", [([1, 2], {"sub": "u"}), ({"alg": "RS256"}, 42)])
+async def test_non_object_segments_raise_value_error(header, payload):
+    token = ".".join([b64url(json.dumps(header).encode()), b64url(json.dumps(payload).encode()), "sig"])
+    with pytest.raises(ValueError, match="Invalid token"):
+        await verify_clerk_token(token)
+
+
+@pytest.mark.asyncio
+async def test_token_signed_by_other_key_is_rejected(stub_jwks):
+    token = make_signed_jwt(valid_claims(), private_key=OTHER_KEY)
+    with pytest.raises(ValueError, match="bad signature"):
+        await verify_clerk_token(token)
+
+
+@pytest.mark.asyncio
+async def test_tampered_payload_is_rejected(stub_jwks):
+    header, _, signature = make_signed_jwt(valid_claims()).split(".")
+    forged_body = b64url(json.dumps(valid_claims(sub="someone_else")).encode())
+    with pytest.raises(ValueError, match="bad signature"):
+        await verify_clerk_token(f"{header}.{forged_body}.{signature}")
+
+
+@pytest.mark.asyncio
+async def test_expired_token_is_rejected(stub_jwks):
+    token = make_signed_jwt(valid_claims(exp=time.time() - 60))
+    with pytest.raises(ValueError, match="Token expired"):
+        await verify_clerk_token(token)
+
+
+@pytest.mark.asyncio
+async def test_token_before_nbf_is_rejected(stub_jwks):
+    token = make_signed_jwt(valid_claims(nbf=time.time() + 60))
+    with pytest.raises(ValueError, match="not yet valid"):
+        await verify_clerk_token(token)
+
+
+@pytest.mark.asyncio
+async def test_non_rs256_algorithm_is_rejected(stub_jwks):
+    token = make_signed_jwt(valid_claims(), alg="none")
+    with pytest.raises(ValueError, match="unsupported algorithm"):
+        await verify_clerk_token(token)
+
+
+@pytest.mark.asyncio
+async def test_jwks_is_fetched_once_for_many_verifications(stub_jwks):
+    for _ in range(5):
+        await verify_clerk_token(make_signed_jwt(valid_claims()))
+    assert stub_jwks.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_unknown_kid_triggers_refresh(stub_jwks, jwks_file):
+    await verify_clerk_token(make_signed_jwt(valid_claims()))
+
+    # Clerk rotates keys: the new kid only shows up in a fresh JWKS document
+    jwks_file.write_text(json.dumps({"keys": [make_jwk(PRIVATE_KEY, "key_1"), make_jwk(OTHER_KEY, "key_2")]}))
+    result = await verify_clerk_token(make_signed_jwt(valid_claims(), private_key=OTHER_KEY, kid="key_2"))
+
+    assert result["sub"] == "user_test_123"
+    assert stub_jwks.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_unknown_kid_refresh_is_rate_limited(jwks_file):
+    fetch = AsyncMock(side_effect=lambda: json.loads(jwks_file.read_text()))
+    with patch("clerk_auth.jwks_cache", JWKSCache(fetch=fetch, min_refresh_interval=3600)):
+        await verify_clerk_token(make_signed_jwt(valid_claims()))
+        for _ in range(3):
+            with pytest.raises(ValueError, match="unknown signing key"):
+                await verify_clerk_token(make_signed_jwt(valid_claims(), kid="bogus"))
+    assert fetch.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_fetch_profile_fills_missing_email(stub_jwks):
     mock_response = MagicMock()
     mock_response.status_code = 200
     mock_response.json.return_value = {
@@ -26,21 +166,17 @@ async def test_valid_token_extracts_correct_user_id():
     mock_client = AsyncMock()
     mock_client.get.return_value = mock_response
 
-    with patch.dict(os.environ, {"CLERK_SECRET_KEY": "test_key"}):
-        with patch("clerk_auth.CLERK_SECRET_KEY", "test_key"):
-            with patch("httpx.AsyncClient") as mock_async_client:
-                mock_async_client.return_value.__aenter__.return_value = mock_client
-                from clerk_auth import verify_clerk_token
-                result = await verify_clerk_token(fake_token)
+    with patch("clerk_auth.CLERK_SECRET_KEY", "test_key"):
+        with patch("httpx.AsyncClient") as mock_async_client:
+            mock_async_client.return_value.__aenter__.return_value = mock_client
+            result = await verify_clerk_token(make_signed_jwt(valid_claims()), fetch_profile=True)
 
-    assert result["sub"] == "user_test_123"
     assert result["email"] == "test@example.com"
+    assert result["last_name"] == "User"
 
 
 @pytest.mark.asyncio
-async def test_malformed_token_raises_value_error():
-    with patch.dict(os.environ, {"CLERK_SECRET_KEY": "test_key"}):
-        with patch("clerk_auth.CLERK_SECRET_KEY", "test_key"):
-            from clerk_auth import verify_clerk_token
-            with pytest.raises(ValueError, match="Invalid token"):
-                await verify_clerk_token("onlytwoparts.here")
+async def test_profile_is_not_fetched_by_default(stub_jwks):
+    with patch("httpx.AsyncClient") as mock_async_client:
+        await verify_clerk_token(make_signed_jwt(valid_claims()))
+    mock_async_client.assert_not_called()
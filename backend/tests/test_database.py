@@ -1,5 +1,7 @@
 import pytest
-from database import user_has_tokens
+from unittest.mock import patch
+from pymongo import ReturnDocument
+from database import user_has_tokens, get_or_create_user
 
 """
 Unit tests for the user_has_tokens function in database.py
@@ -17,3 +19,67 @@ def test_user_has_tokens_missing_gemini():
 def test_user_has_tokens_both_missing():
     user = {"canvas_token": None, "gemini_token": None}
     assert user_has_tokens(user) is False
+
+
+"""
+Unit tests for get_or_create_user in database.py (MongoDB is mocked)
+"""
+
+
+def run_get_or_create_user(clerk_id, user_data=None):
+    with patch("database.users_collection") as users:
+        users.find_one_and_update.return_value = {"clerk_id": clerk_id}
+        result = get_or_create_user(clerk_id, user_data)
+    return result, users
+
+
+def pipeline_stage(users):
+    return users.find_one_and_update.call_args.args[1][0]["$set"]
+
+
+def test_get_or_create_user_is_a_single_atomic_upsert():
+    result, users = run_get_or_create_user("user_1", {"email": "a@b.c"})
+
+    assert result == {"clerk_id": "user_1"}
+    users.find_one_and_update.assert_called_once()
+    users.find_one.assert_not_called()
+    users.update_one.assert_not_called()
+    users.insert_one.assert_not_called()
+    kwargs = users.find_one_and_update.call_args.kwargs
+    assert kwargs["upsert"] is True
+    assert kwargs["return_document"] == ReturnDocument.AFTER
+    assert users.find_one_and_update.call_args.args[0] == {"clerk_id": "user_1"}
+
+
+def test_get_or_create_user_sets_profile_fields_as_literals():
+    _, users = run_get_or_create_user("user_1", {"email": "$weird@b.c", "first_name": "A", "last_name": "B"})
+    stage = pipeline_stage(users)
+
+    assert stage["email"] == {"$literal": "$weird@b.c"}
+    assert stage["first_name"] == {"$literal": "A"}
+
+
+def test_get_or_create_user_none_fields_do_not_overwrite():
+    _, users = run_get_or_create_user("user_1", {"email": "a@b.c", "first_name": None, "last_name": None})
+    stage = pipeline_stage(users)
+
+    # Unknown fields fall back to the stored value (or None for a new user)
+    assert stage["first_name"] == {"$ifNull": ["$first_name", None]}
+    assert stage["last_name"] == {"$ifNull": ["$last_name", None]}
+
+
+def test_get_or_create_user_only_bumps_updated_at_when_profile_differs():
+    _, users = run_get_or_create_user("user_1", {"email": "a@b.c"})
+    condition, when_unchanged, when_changed = pipeline_stage(users)["updated_at"]["$cond"]
+
+    assert condition == {"$and": [{"$eq": ["$email", {"$literal": "a@b.c"}]}]}
+    assert when_unchanged["$ifNull"][0] == "$updated_at"
+    assert when_changed == when_unchanged["$ifNull"][1]
+
+
+def test_get_or_create_user_new_user_gets_full_schema():
+    _, users = run_get_or_create_user("user_1")
+    stage = pipeline_stage(users)
+
+    for field in ("university_id", "canvas_user_id", "canvas_token", "gemini_token", "created_at", "updated_at"):
+        assert field in stage
@@ -5,7 +5,8 @@ import pytest
 import os
 from cryptography.fernet import Fernet
 from unittest.mock import patch
-from encryption import encrypt, decrypt
+import encryption
+from encryption import encrypt, decrypt, TokenVault
 
 
 VALID_KEY = Fernet.generate_key().decode()
@@ -27,3 +28,48 @@ def test_missing_encryption_key_raises():
     with patch.dict(os.environ, {}, clear=True):
         with pytest.raises(RuntimeError, match="ENCRYPTION_KEY not set in environment"):
             encrypt("anything")
+
+
+# --- TokenVault ---
+
+def test_vault_serves_repeat_decrypts_from_cache():
+    vault = TokenVault([VALID_KEY])
+    ciphertext = vault.encrypt("canvas_token")
+    assert vault.decrypt(ciphertext) == "canvas_token"
+    assert vault.decrypt(ciphertext) == "canvas_token"
+    assert vault.stats()["hits"] == 1
+
+
+def test_vault_decrypts_values_encrypted_with_older_key():
+    old_key = Fernet.generate_key().decode()
+    old_ciphertext = Fernet(old_key.encode()).encrypt(b"legacy_token").decode()
+
+    vault = TokenVault([VALID_KEY, old_key])
+    assert vault.decrypt(old_ciphertext) == "legacy_token"
+
+
+def test_vault_rotate_reencrypts_under_newest_key():
+    old_key = Fernet.generate_key().decode()
+    old_ciphertext = Fernet(old_key.encode()).encrypt(b"legacy_token").decode()
+
+    rotated = TokenVault([VALID_KEY, old_key]).rotate(old_ciphertext)
+    assert TokenVault([VALID_KEY]).decrypt(rotated) == "legacy_token"
+
+
+def test_encryption_key_env_accepts_comma_separated_keys():
+    old_key = Fernet.generate_key().decode()
+    old_ciphertext = Fernet(old_key.encode()).encrypt(b"legacy_token").decode()
+    with patch.dict(os.environ, {"ENCRYPTION_KEY": f"{VALID_KEY},{old_key}"}):
+        assert decrypt(old_ciphertext) == "legacy_token"
+
+
+def test_init_vault_builds_cipher_once():
+    with patch.dict(os.environ, {"ENCRYPTION_KEY": VALID_KEY}):
+        vault = encryption.init_vault()
+    try:
+        # The environment is no longer consulted once the vault exists
+        with patch.dict(os.environ, {}, clear=True):
+            assert encryption.get_vault() is vault
+            assert decrypt(encrypt("my_secret_token")) == "my_secret_token"
+    finally:
+        encryption._vault = None
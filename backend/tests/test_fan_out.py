@@ -0,0 +1,81 @@
+"""
+Unit tests for fan_out.py
+"""
+import asyncio
+import threading
+import time
+import pytest
+from fan_out import fan_out, fan_out_threaded
+
+
+# --- fan_out (async) ---
+
+@pytest.mark.asyncio
+async def test_results_keep_input_order():
+    async def call(n):
+        await asyncio.sleep(0.01 * (5 - n))  # later items finish first
+        return n * 10
+
+    outcome = await fan_out([1, 2, 3, 4], call)
+    assert outcome.results == [10, 20, 30, 40]
+    assert outcome.ok
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_is_respected():
+    in_flight = {"now": 0, "max": 0}
+
+    async def call(n):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        return n
+
+    await fan_out(range(10), call, limit=3)
+    assert in_flight["max"] == 3
+
+
+@pytest.mark.asyncio
+async def test_failures_are_captured_with_partial_results():
+    async def call(n):
+        if n % 2:
+            raise RuntimeError(f"quiz {n} gone")
+        return n
+
+    outcome = await fan_out([0, 1, 2, 3], call)
+    assert outcome.results == [0, None, 2, None]
+    assert outcome.failed_items() == [1, 3]
+    assert str(outcome.failures[0]["error"]) == "quiz 1 gone"
+    assert not outcome.ok
+
+
+@pytest.mark.asyncio
+async def test_empty_input():
+    outcome = await fan_out([], None)
+    assert outcome.results == [] and outcome.ok
+
+
+# --- fan_out_threaded ---
+
+def test_threaded_runs_calls_concurrently_in_order():
+    barrier = threading.Barrier(3)
+
+    def call(n):
+        barrier.wait(timeout=2)  # deadlocks unless all three run at once
+        time.sleep(0.01 * (3 - n))
+        return n
+
+    outcome = fan_out_threaded([0, 1, 2], call, limit=3)
+    assert outcome.results == [0, 1, 2]
+
+
+def test_threaded_failures_are_captured():
+    def call(n):
+        if n == "bad":
+            raise ValueError("nope")
+        return n.upper()
+
+    outcome = fan_out_threaded(["a", "bad", "c"], call)
+    assert outcome.results == ["A", None, "C"]
+    assert outcome.failures[0]["index"] == 1
@@ -0,0 +1,149 @@
+"""
+Unit tests for GeminiFileCache in gemini_file_cache.py
+MongoDB is replaced by a tiny in-memory collection that supports the calls the cache makes.
+"""
+import itertools
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from gemini_file_cache import GeminiFileCache, metadata_cache_key, content_cache_key, api_key_fingerprint
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        self.docs = sorted(self.docs, key=lambda d: d[field], reverse=direction < 0)
+        return self
+
+    def skip(self, n):
+        self.docs = self.docs[n:]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+        self._ids = itertools.count(1)
+
+    def _matches(self, doc, query):
+        for field, expected in query.items():
+            if isinstance(expected, dict) and "$in" in expected:
+                if doc.get(field) not in expected["$in"]:
+                    return False
+            elif doc.get(field) != expected:
+                return False
+        return True
+
+    def find_one(self, query):
+        return next((dict(d) for d in self.docs if self._matches(d, query)), None)
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(d) for d in self.docs if self._matches(d, query)])
+
+    def update_one(self, query, update):
+        for doc in self.docs:
+            if self._matches(doc, query):
+                doc.update(update["$set"])
+                return
+
+    def find_one_and_update(self, query, update, upsert=False):
+        for doc in self.docs:
+            if self._matches(doc, query):
+                before = dict(doc)
+                doc.update(update["$set"])
+                return before
+        if upsert:
+            self.docs.append({"_id": next(self._ids), **query, **update["$set"]})
+        return None
+
+    def delete_one(self, query):
+        match = next((d for d in self.docs if self._matches(d, query)), None)
+        if match:
+            self.docs.remove(match)
+
+    def delete_many(self, query):
+        self.docs = [d for d in self.docs if not self._matches(d, query)]
+
+
+def make_upload(name, expires_in=timedelta(hours=48)):
+    return SimpleNamespace(
+        name=name,
+        uri=f"https://generativelanguage.googleapis.com/v1beta/{name}",
+        mime_type="application/pdf",
+        expiration_time=datetime.now(timezone.utc) + expires_in,
+    )
+
+
+# --- cache keys ---
+
+def test_metadata_cache_key_uses_id_and_modified_at():
+    assert metadata_cache_key({"id": 7, "modified_at": "2024-01-02T00:00:00Z"}) == "canvas:7:2024-01-02T00:00:00Z"
+
+
+def test_metadata_cache_key_requires_both_fields():
+    assert metadata_cache_key({"id": 7}) is None
+    assert metadata_cache_key({"modified_at": "2024-01-02"}) is None
+
+
+def test_api_key_is_never_stored_in_clear():
+    assert "secret_key" not in api_key_fingerprint("secret_key")
+
+
+# --- lookup / store ---
+
+def test_lookup_returns_stored_handle():
+    cache = GeminiFileCache(FakeCollection())
+    cache.store("key", ["canvas:1:t"], make_upload("files/a"))
+
+    handle = cache.lookup("key", "canvas:1:t")
+    assert handle.name == "files/a"
+    assert handle.mime_type == "application/pdf"
+
+
+def test_uploads_are_scoped_to_the_api_key():
+    cache = GeminiFileCache(FakeCollection())
+    cache.store("key_1", ["canvas:1:t"], make_upload("files/a"))
+    assert cache.lookup("key_2", "canvas:1:t") is None
+
+
+def test_handle_close_to_expiry_is_a_miss():
+    cache = GeminiFileCache(FakeCollection(), refresh_margin=timedelta(hours=2))
+    cache.store("key", ["canvas:1:t"], make_upload("files/a", expires_in=timedelta(minutes=30)))
+    assert cache.lookup("key", "canvas:1:t") is None
+
+
+def test_store_under_several_keys():
+    cache = GeminiFileCache(FakeCollection())
+    cache.store("key", ["canvas:1:t", content_cache_key("abc")], make_upload("files/a"))
+    assert cache.lookup("key", content_cache_key("abc")).name == "files/a"
+
+
+def test_replacing_an_entry_returns_old_upload_for_deletion():
+    cache = GeminiFileCache(FakeCollection())
+    cache.store("key", ["canvas:1:t"], make_upload("files/old"))
+    assert cache.store("key", ["canvas:1:t"], make_upload("files/new")) == ["files/old"]
+
+
+def test_least_recently_used_entries_are_evicted():
+    collection = FakeCollection()
+    cache = GeminiFileCache(collection, max_entries=2)
+    cache.store("key", ["canvas:1:t"], make_upload("files/1"))
+    cache.store("key", ["canvas:2:t"], make_upload("files/2"))
+    # Touch 1 so 2 becomes the least recently used
+    next(d for d in collection.docs if d["key"] == "canvas:1:t")["last_used_at"] += timedelta(seconds=5)
+    evicted = cache.store("key", ["canvas:3:t"], make_upload("files/3"))
+
+    assert evicted == ["files/2"]
+    assert cache.lookup("key", "canvas:2:t") is None
+    assert cache.lookup("key", "canvas:1:t") is not None
+
+
+def test_forget_removes_entry():
+    cache = GeminiFileCache(FakeCollection())
+    cache.store("key", ["canvas:1:t"], make_upload("files/a"))
+    cache.forget("key", "canvas:1:t")
+    assert cache.lookup("key", "canvas:1:t") is None
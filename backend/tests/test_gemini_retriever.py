@@ -3,9 +3,15 @@ Unit and integration tests for generate_quiz_from_files in gemini_retriever.py
 """
 import pytest
 import json
+import re
 import os
+import threading
+import time
+import httpx
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, MagicMock
 from gemini_retriever import generate_quiz_from_files
+from http_pool import shared_sync_client
 
 
 VALID_FILES = [
@@ -28,6 +34,10 @@ VALID_QUIZ_RESPONSE = json.dumps({
 })
 
 
+def four_choices(correct=0):
+    return [{"text": text, "is_correct": i == correct} for i, text in enumerate("ABCD")]
+
+
 def make_mock_gemini_client(response_text=VALID_QUIZ_RESPONSE):
     mock_upload = MagicMock()
     mock_upload.name = "files/fake123"
@@ -46,7 +56,8 @@ def make_mock_gemini_client(response_text=VALID_QUIZ_RESPONSE):
 def make_mock_http_response(status_code=200, content=b"PDF file bytes"):
     mock_resp = MagicMock()
     mock_resp.status_code = status_code
-    mock_resp.content = content
+    mock_resp.headers = {"Content-Length": str(len(content))}
+    mock_resp.iter_bytes.return_value = [content]
     return mock_resp
 
 
@@ -69,8 +80,8 @@ def test_file_missing_url_raises_value_error():
     mock_http = make_mock_http_response()
 
     with patch("gemini_retriever.genai.Client", return_value=mock_client):
-        with patch("httpx.Client") as mock_httpx:
-            mock_httpx.return_value.__enter__.return_value.get.return_value = mock_http
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = mock_http
             with pytest.raises(ValueError, match="missing a 'url'"):
                 generate_quiz_from_files(files, canvas_token="fake", gemini_token="fake_key")
 
@@ -80,8 +91,8 @@ def test_prompt_reflects_custom_question_count():
     mock_http = make_mock_http_response()
 
     with patch("gemini_retriever.genai.Client", return_value=mock_client):
-        with patch("httpx.Client") as mock_httpx:
-            mock_httpx.return_value.__enter__.return_value.get.return_value = mock_http
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = mock_http
             generate_quiz_from_files(VALID_FILES, canvas_token="fake", gemini_token="fake_key", question_count=10)
 
     call_args = mock_client.models.generate_content.call_args
@@ -97,8 +108,8 @@ def test_successful_quiz_generation_returns_questions():
     mock_http = make_mock_http_response()
 
     with patch("gemini_retriever.genai.Client", return_value=mock_client):
-        with patch("httpx.Client") as mock_httpx:
-            mock_httpx.return_value.__enter__.return_value.get.return_value = mock_http
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = mock_http
             result = generate_quiz_from_files(VALID_FILES, canvas_token="fake", gemini_token="fake_key")
 
     assert "questions" in result
@@ -110,8 +121,8 @@ def test_canvas_download_failure_raises_runtime_error():
     mock_http = make_mock_http_response(status_code=403)
 
     with patch("gemini_retriever.genai.Client", return_value=mock_client):
-        with patch("httpx.Client") as mock_httpx:
-            mock_httpx.return_value.__enter__.return_value.get.return_value = mock_http
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = mock_http
             with pytest.raises(RuntimeError, match="Failed to download"):
                 generate_quiz_from_files(VALID_FILES, canvas_token="fake", gemini_token="fake_key")
 
@@ -122,8 +133,8 @@ def test_gemini_upload_failure_raises_runtime_error():
     mock_http = make_mock_http_response()
 
     with patch("gemini_retriever.genai.Client", return_value=mock_client):
-        with patch("httpx.Client") as mock_httpx:
-            mock_httpx.return_value.__enter__.return_value.get.return_value = mock_http
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = mock_http
             with pytest.raises(RuntimeError, match="Failed to upload"):
                 generate_quiz_from_files(VALID_FILES, canvas_token="fake", gemini_token="fake_key")
 
@@ -133,8 +144,8 @@ def test_gemini_invalid_json_response_raises_runtime_error():
     mock_http = make_mock_http_response()
 
     with patch("gemini_retriever.genai.Client", return_value=mock_client):
-        with patch("httpx.Client") as mock_httpx:
-            mock_httpx.return_value.__enter__.return_value.get.return_value = mock_http
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = mock_http
             with pytest.raises(RuntimeError, match="Gemini returned invalid JSON"):
                 generate_quiz_from_files(VALID_FILES, canvas_token="fake", gemini_token="fake_key")
 
@@ -144,8 +155,8 @@ def test_gemini_missing_questions_field_raises_runtime_error():
     mock_http = make_mock_http_response()
 
     with patch("gemini_retriever.genai.Client", return_value=mock_client):
-        with patch("httpx.Client") as mock_httpx:
-            mock_httpx.return_value.__enter__.return_value.get.return_value = mock_http
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = mock_http
             with pytest.raises(RuntimeError, match="missing the 'questions' field"):
                 generate_quiz_from_files(VALID_FILES, canvas_token="fake", gemini_token="fake_key")
 
@@ -156,8 +167,8 @@ def test_gemini_markdown_fences_stripped_and_parsed():
     mock_http = make_mock_http_response()
 
     with patch("gemini_retriever.genai.Client", return_value=mock_client):
-        with patch("httpx.Client") as mock_httpx:
-            mock_httpx.return_value.__enter__.return_value.get.return_value = mock_http
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = mock_http
             result = generate_quiz_from_files(VALID_FILES, canvas_token="fake", gemini_token="fake_key")
 
     assert "questions" in result
@@ -168,8 +179,8 @@ def test_uploaded_files_deleted_after_generation():
     mock_http = make_mock_http_response()
 
     with patch("gemini_retriever.genai.Client", return_value=mock_client):
-        with patch("httpx.Client") as mock_httpx:
-            mock_httpx.return_value.__enter__.return_value.get.return_value = mock_http
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = mock_http
             generate_quiz_from_files(VALID_FILES, canvas_token="fake", gemini_token="fake_key")
 
     mock_client.files.delete.assert_called_once_with(name="files/fake123")
@@ -180,8 +191,8 @@ def test_uploaded_files_deleted_even_on_failure():
     mock_http = make_mock_http_response()
 
     with patch("gemini_retriever.genai.Client", return_value=mock_client):
-        with patch("httpx.Client") as mock_httpx:
-            mock_httpx.return_value.__enter__.return_value.get.return_value = mock_http
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = mock_http
             with pytest.raises(RuntimeError):
                 generate_quiz_from_files(VALID_FILES, canvas_token="fake", gemini_token="fake_key")
 
@@ -191,13 +202,605 @@ def test_uploaded_files_deleted_even_on_failure():
 def test_previous_questions_appended_to_prompt():
     mock_client = make_mock_gemini_client()
     mock_http = make_mock_http_response()
-    prev_questions = [{"question_stem": "Old Q?", "choices": []}]
+    prev_questions = [
+        {"question_stem": "What does photosynthesis produce?", "choices": []},
+        {"question_stem_html": "<p>Where does photosynthesis happen?</p>"},
+        {"question_text": "<p>Which pigment absorbs light?</p>"},
+    ]
 
     with patch("gemini_retriever.genai.Client", return_value=mock_client):
-        with patch("httpx.Client") as mock_httpx:
-            mock_httpx.return_value.__enter__.return_value.get.return_value = mock_http
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = mock_http
             generate_quiz_from_files(VALID_FILES, canvas_token="fake", gemini_token="fake_key", previous_questions=prev_questions)
 
     call_args = mock_client.models.generate_content.call_args
     prompt = call_args[1]["contents"][-1]
-    assert "Old Q?" in prompt
\ No newline at end of file
+    # A topic summary plus compact one-line questions, never the raw objects
+    assert "3 questions already exist" in prompt
+    assert "photosynthesis" in prompt and "pigment" in prompt
+    assert "- Where does photosynthesis happen?" in prompt
+    assert "<p>" not in prompt and "question_text" not in prompt
+
+
+def test_previous_questions_are_truncated_to_token_budget():
+    mock_client = make_mock_gemini_client()
+    prev_questions = [{"question_stem": f"Distinct question {i} about topic {i}?"} for i in range(50)]
+
+    with patch("gemini_retriever.genai.Client", return_value=mock_client):
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = make_mock_http_response()
+            result = generate_quiz_from_files(VALID_FILES, canvas_token="fake", gemini_token="fake_key",
+                                              previous_questions=prev_questions, context_token_budget=50)
+
+    prompt = mock_client.models.generate_content.call_args[1]["contents"][-1]
+    report = result["previous_context"]
+    assert report["previous_questions"] == 50
+    assert report["included"] + report["truncated"] == 50 and report["truncated"] > 0
+    assert report["estimated_tokens"] <= 50
+    assert f"({report['truncated']} more existing questions not shown)" in prompt
+
+
+def test_generated_near_duplicates_of_previous_questions_are_dropped():
+    response = json.dumps({"questions": [
+        {"question_stem": "What does photosynthesis produce in plants?", "choices": four_choices(), "rationale": ""},
+        {"question_stem": "Which organelle holds chlorophyll?", "choices": four_choices(), "rationale": ""},
+    ]})
+    mock_client = make_mock_gemini_client(response)
+    prev_questions = [{"question_text": "<p>What does photosynthesis produce in <b>plants</b>?</p>"}]
+
+    with patch("gemini_retriever.genai.Client", return_value=mock_client):
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = make_mock_http_response()
+            result = generate_quiz_from_files(VALID_FILES, canvas_token="fake", gemini_token="fake_key", previous_questions=prev_questions)
+
+    assert [q["question_stem"] for q in result["questions"]] == ["Which organelle holds chlorophyll?"]
+
+# --- Pipeline Tests (local fake Canvas server + fake Gemini client) ---
+
+class FakeGeminiClient:
+    """Stands in for genai.Client: records uploads/deletes, returns a canned quiz."""
+
+    def __init__(self, response_text=VALID_QUIZ_RESPONSE, fail_upload_for=None):
+        self.uploaded = []
+        self.deleted = []
+        self.prompts = []
+        self._lock = threading.Lock()
+        self._fail_upload_for = fail_upload_for
+        self.files = MagicMock()
+        self.files.upload.side_effect = self._upload
+        self.files.delete.side_effect = self._delete
+        self.models = MagicMock()
+        self.models.generate_content.side_effect = self._generate
+        self._response_text = response_text
+
+    def _upload(self, file, config):
+        if config["display_name"] == self._fail_upload_for:
+            raise Exception("quota exceeded")
+        handle = MagicMock()
+        handle.name = f"files/{config['display_name']}"
+        handle.content = file.read()
+        with self._lock:
+            self.uploaded.append(handle.name)
+        return handle
+
+    def _delete(self, name):
+        with self._lock:
+            self.deleted.append(name)
+
+    def _generate(self, model, contents, config):
+        self.prompts.append(contents)
+        response = MagicMock()
+        response.text = self._response_text
+        return response
+
+
+class FakeCanvas:
+    """
+    Local HTTP server serving /files/<name>. `delays` slows individual files down;
+    `barrier` (if set) makes every download wait until N downloads are in flight at once.
+    """
+
+    def __init__(self, files, delays=None, barrier=None):
+        self.files = files
+        self.delays = delays or {}
+        self.barrier = barrier
+        self.auth_headers = []
+        canvas = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                name = self.path.rsplit("/", 1)[-1]
+                canvas.auth_headers.append(self.headers.get("Authorization"))
+                if canvas.barrier:
+                    try:
+                        canvas.barrier.wait(timeout=5)
+                    except threading.BrokenBarrierError:
+                        self.send_response(500)
+                        self.end_headers()
+                        return
+                time.sleep(canvas.delays.get(name, 0))
+                body = canvas.files.get(name)
+                if body is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, name):
+        return f"http://127.0.0.1:{self.server.server_port}/files/{name}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def file_infos(canvas, names):
+    return [{"url": canvas.url(n), "display_name": n, "content_type": "application/pdf"} for n in names]
+
+
+def test_files_are_downloaded_concurrently():
+    names = ["a.pdf", "b.pdf", "c.pdf"]
+    gemini = FakeGeminiClient()
+    # Every download blocks until all three are in flight, so a serial loop would fail
+    with FakeCanvas({n: n.encode() for n in names}, barrier=threading.Barrier(3)) as canvas:
+        with patch("gemini_retriever.genai.Client", return_value=gemini):
+            result = generate_quiz_from_files(file_infos(canvas, names), canvas_token="tok", gemini_token="key", max_workers=3)
+
+    assert "questions" in result
+    assert sorted(gemini.uploaded) == [f"files/{n}" for n in names]
+    assert canvas.auth_headers == ["Bearer tok"] * 3
+
+
+def test_uploads_keep_file_order_even_when_first_file_is_slowest():
+    names = ["slow.pdf", "fast1.pdf", "fast2.pdf"]
+    gemini = FakeGeminiClient()
+    with FakeCanvas({n: n.encode() for n in names}, delays={"slow.pdf": 0.3}) as canvas:
+        with patch("gemini_retriever.genai.Client", return_value=gemini):
+            generate_quiz_from_files(file_infos(canvas, names), canvas_token="tok", gemini_token="key")
+
+    contents = gemini.prompts[0]
+    assert [c.name for c in contents[:-1]] == [f"files/{n}" for n in names]
+    assert contents[0].content == b"slow.pdf"
+
+
+def test_injected_http_client_is_used_for_all_files():
+    names = ["a.pdf", "b.pdf", "c.pdf", "d.pdf"]
+    with FakeCanvas({n: n.encode() for n in names}) as canvas, httpx.Client() as real_client:
+        spy = MagicMock(wraps=real_client)
+        with patch("gemini_retriever.genai.Client", return_value=FakeGeminiClient()):
+            with patch("gemini_retriever.shared_sync_client") as shared:
+                generate_quiz_from_files(file_infos(canvas, names), canvas_token="tok", gemini_token="key", http_client=spy)
+
+    assert spy.stream.call_count == 4
+    shared.assert_not_called()
+
+
+def test_downloads_use_the_shared_pool_by_default():
+    names = ["a.pdf", "b.pdf"]
+    with FakeCanvas({n: n.encode() for n in names}) as canvas:
+        with patch("gemini_retriever.genai.Client", return_value=FakeGeminiClient()):
+            with patch("gemini_retriever.shared_sync_client", wraps=shared_sync_client) as shared:
+                generate_quiz_from_files(file_infos(canvas, names), canvas_token="tok", gemini_token="key")
+                generate_quiz_from_files(file_infos(canvas, names), canvas_token="tok", gemini_token="key")
+
+    assert shared.call_count == 2
+
+
+def test_download_failure_fails_fast_and_cleans_up_uploads():
+    names = ["ok.pdf", "missing.pdf", "later.pdf"]
+    gemini = FakeGeminiClient()
+    with FakeCanvas({"ok.pdf": b"x", "later.pdf": b"y"}) as canvas:
+        with patch("gemini_retriever.genai.Client", return_value=gemini):
+            with pytest.raises(RuntimeError, match="Failed to download 'missing.pdf'"):
+                generate_quiz_from_files(file_infos(canvas, names), canvas_token="tok", gemini_token="key", max_workers=2)
+
+    # Anything that did get uploaded before/while failing is deleted, and nothing is generated
+    assert sorted(gemini.deleted) == sorted(gemini.uploaded)
+    gemini.models.generate_content.assert_not_called()
+
+
+def test_upload_failure_deletes_other_uploads():
+    names = ["a.pdf", "b.pdf", "bad.pdf"]
+    gemini = FakeGeminiClient(fail_upload_for="bad.pdf")
+    with FakeCanvas({n: n.encode() for n in names}, barrier=threading.Barrier(3)) as canvas:
+        with patch("gemini_retriever.genai.Client", return_value=gemini):
+            with pytest.raises(RuntimeError, match="Failed to upload 'bad.pdf'"):
+                generate_quiz_from_files(file_infos(canvas, names), canvas_token="tok", gemini_token="key", max_workers=3)
+
+    assert sorted(gemini.deleted) == sorted(gemini.uploaded)
+
+
+def test_missing_url_is_rejected_before_any_download():
+    files = [{"url": "http://127.0.0.1:9/files/a.pdf", "display_name": "a.pdf"}, {"display_name": "no_url.pdf"}]
+    with patch("gemini_retriever.genai.Client") as client_cls:
+        with pytest.raises(ValueError, match="index 1 is missing a 'url'"):
+            generate_quiz_from_files(files, canvas_token="tok", gemini_token="key")
+    client_cls.assert_not_called()
+
+
+# --- Streaming downloads / size limits ---
+
+def test_large_file_is_streamed_to_gemini_intact():
+    body = os.urandom(3 * 1024 * 1024 + 17)
+    gemini = FakeGeminiClient()
+    with FakeCanvas({"big.pdf": body}) as canvas:
+        with patch("gemini_retriever.genai.Client", return_value=gemini):
+            generate_quiz_from_files(file_infos(canvas, ["big.pdf"]), canvas_token="tok", gemini_token="key")
+
+    assert gemini.prompts[0][0].content == body
+
+
+def test_file_over_limit_by_size_metadata_is_rejected_before_download():
+    gemini = FakeGeminiClient()
+    with FakeCanvas({"big.pdf": b"x"}) as canvas:
+        files = [{**file_infos(canvas, ["big.pdf"])[0], "size": 200 * 1024 * 1024}]
+        with patch("gemini_retriever.genai.Client", return_value=gemini):
+            with pytest.raises(ValueError, match="'big.pdf' is larger than the 100 MB limit"):
+                generate_quiz_from_files(files, canvas_token="tok", gemini_token="key", max_file_bytes=100 * 1024 * 1024)
+
+    assert canvas.auth_headers == []
+
+
+def test_file_over_limit_by_content_length_is_rejected():
+    gemini = FakeGeminiClient()
+    with FakeCanvas({"big.pdf": b"x" * 2048}) as canvas:
+        with patch("gemini_retriever.genai.Client", return_value=gemini):
+            with pytest.raises(ValueError, match="larger than"):
+                generate_quiz_from_files(file_infos(canvas, ["big.pdf"]), canvas_token="tok", gemini_token="key", max_file_bytes=1024)
+
+    assert gemini.uploaded == []
+
+
+def test_download_without_content_length_stops_at_limit():
+    mock_http = make_mock_http_response()
+    mock_http.headers = {}
+    pulled = []
+
+    def chunks(chunk_size):
+        for _ in range(100):
+            pulled.append(1)
+            yield b"x" * 512
+
+    mock_http.iter_bytes.side_effect = chunks
+    mock_client = make_mock_gemini_client()
+    with patch("gemini_retriever.genai.Client", return_value=mock_client):
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = mock_http
+            with pytest.raises(ValueError, match="larger than"):
+                generate_quiz_from_files(VALID_FILES, canvas_token="tok", gemini_token="key", max_file_bytes=1024)
+
+    # Reading stops as soon as the limit is crossed instead of draining the whole body
+    assert len(pulled) == 3
+    mock_client.files.upload.assert_not_called()
+
+
+# --- Gemini upload cache ---
+
+class DictFileCache:
+    """Duck-typed GeminiFileCache backed by a dict: {(api_key, cache_key): handle}."""
+
+    def __init__(self):
+        self.entries = {}
+        self.forgotten = []
+
+    def lookup(self, api_key, cache_key):
+        return self.entries.get((api_key, cache_key))
+
+    def store(self, api_key, cache_keys, upload):
+        for key in cache_keys:
+            self.entries[(api_key, key)] = upload
+        return []
+
+    def forget(self, api_key, cache_key):
+        self.forgotten.append(cache_key)
+        self.entries.pop((api_key, cache_key), None)
+
+
+def cached_file_infos(canvas, names):
+    return [{**info, "id": i, "modified_at": "2024-01-01T00:00:00Z"} for i, info in enumerate(file_infos(canvas, names))]
+
+
+def test_repeat_generation_skips_download_and_upload():
+    names = ["a.pdf", "b.pdf"]
+    cache = DictFileCache()
+    with FakeCanvas({n: n.encode() for n in names}) as canvas:
+        files = cached_file_infos(canvas, names)
+        first, second = FakeGeminiClient(), FakeGeminiClient()
+        with patch("gemini_retriever.genai.Client", return_value=first):
+            generate_quiz_from_files(files, canvas_token="tok", gemini_token="key", file_cache=cache)
+        with patch("gemini_retriever.genai.Client", return_value=second):
+            generate_quiz_from_files(files, canvas_token="tok", gemini_token="key", file_cache=cache)
+
+    assert len(canvas.auth_headers) == 2  # only the first generation downloaded
+    assert second.uploaded == []
+    assert [c.name for c in second.prompts[0][:-1]] == ["files/a.pdf", "files/b.pdf"]
+
+
+def test_cached_uploads_are_not_deleted_after_generation():
+    cache = DictFileCache()
+    gemini = FakeGeminiClient()
+    with FakeCanvas({"a.pdf": b"a"}) as canvas:
+        with patch("gemini_retriever.genai.Client", return_value=gemini):
+            generate_quiz_from_files(cached_file_infos(canvas, ["a.pdf"]), canvas_token="tok", gemini_token="key", file_cache=cache)
+
+    assert gemini.deleted == []
+
+
+def test_same_content_without_metadata_skips_upload():
+    cache = DictFileCache()
+    with FakeCanvas({"a.pdf": b"same bytes", "copy.pdf": b"same bytes"}) as canvas:
+        first, second = FakeGeminiClient(), FakeGeminiClient()
+        with patch("gemini_retriever.genai.Client", return_value=first):
+            generate_quiz_from_files(file_infos(canvas, ["a.pdf"]), canvas_token="tok", gemini_token="key", file_cache=cache)
+        with patch("gemini_retriever.genai.Client", return_value=second):
+            generate_quiz_from_files(file_infos(canvas, ["copy.pdf"]), canvas_token="tok", gemini_token="key", file_cache=cache)
+
+    assert second.uploaded == []
+
+
+def test_cached_handle_gone_from_gemini_is_reuploaded():
+    cache = DictFileCache()
+    with FakeCanvas({"a.pdf": b"a"}) as canvas:
+        files = cached_file_infos(canvas, ["a.pdf"])
+        with patch("gemini_retriever.genai.Client", return_value=FakeGeminiClient()):
+            generate_quiz_from_files(files, canvas_token="tok", gemini_token="key", file_cache=cache)
+
+        gemini = FakeGeminiClient()
+        gemini.files.get.side_effect = Exception("404 file not found")
+        with patch("gemini_retriever.genai.Client", return_value=gemini):
+            generate_quiz_from_files(files, canvas_token="tok", gemini_token="key", file_cache=cache)
+
+    assert gemini.uploaded == ["files/a.pdf"]
+    assert cache.forgotten
+
+
+# --- scripted Gemini client (streaming, sharded and repair calls) ---
+
+def make_question(stem):
+    return {"question_stem": stem, "choices": four_choices(), "rationale": ""}
+
+
+def make_scripted_gemini_client(responses, barrier=None, chunk_size=7):
+    """
+    Answers generate_content / generate_content_stream calls from `responses`, in call order.
+    A shard call (prompt hint 'part k of n') gets responses[k-1] whatever order the shards run in,
+    and later calls continue after the shards' entries.
+    Each response is raw text, a list of questions, or an exception to raise.
+    """
+    mock_client = make_mock_gemini_client()
+    lock = threading.Lock()
+    state = {"offset": 0, "calls": 0}
+
+    def next_response(contents):
+        hint = re.search(r"part (\d+) of (\d+)", contents[-1])
+        with lock:
+            if hint:
+                index = int(hint.group(1)) - 1
+                state["offset"] = max(state["offset"], int(hint.group(2)))
+            else:
+                index = state["offset"] + state["calls"]
+                state["calls"] += 1
+        if hint and barrier:
+            barrier.wait(timeout=5)
+        answer = responses[index]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer if isinstance(answer, str) else json.dumps({"questions": answer})
+
+    def generate(model, contents, config):
+        return MagicMock(text=next_response(contents))
+
+    def generate_stream(model, contents, config):
+        text = next_response(contents)
+        return iter([MagicMock(text=text[i:i + chunk_size]) for i in range(0, len(text), chunk_size)])
+
+    mock_client.models.generate_content.side_effect = generate
+    mock_client.models.generate_content_stream.side_effect = generate_stream
+    return mock_client
+
+
+def generate_with(mock_client, **kwargs):
+    with patch("gemini_retriever.genai.Client", return_value=mock_client):
+        with patch("gemini_retriever.shared_sync_client") as mock_httpx:
+            mock_httpx.return_value.stream.return_value.__enter__.return_value = make_mock_http_response()
+            return generate_quiz_from_files(VALID_FILES, canvas_token="fake", gemini_token="fake_key", **kwargs)
+
+
+def prompt_of(mock_client, call):
+    return mock_client.models.generate_content.call_args_list[call].kwargs["contents"][-1]
+
+
+# --- streaming generation ---
+
+TWO_QUESTIONS = json.dumps({"questions": [
+    {"question_stem": "First {brace}?", "choices": four_choices(), "rationale": "r1"},
+    {"question_stem": "Second \"quoted\"?", "choices": four_choices(1), "rationale": "r2"},
+]})
+
+
+def test_streaming_hands_over_each_question_in_order():
+    seen = []
+    mock_client = make_scripted_gemini_client([TWO_QUESTIONS])
+
+    result = generate_with(mock_client, question_count=2, on_question=seen.append)
+
+    assert [q["question_stem"] for q in seen] == ["First {brace}?", 'Second "quoted"?']
+    assert result["questions"] == seen
+    mock_client.models.generate_content.assert_not_called()
+
+
+def test_truncated_stream_keeps_completed_questions():
+    seen = []
+    truncated = TWO_QUESTIONS[:TWO_QUESTIONS.index("Second") + 3]
+    mock_client = make_scripted_gemini_client([truncated])
+
+    result = generate_with(mock_client, question_count=2, on_question=seen.append, max_repair_rounds=0)
+
+    assert [q["question_stem"] for q in result["questions"]] == ["First {brace}?"]
+    assert result["questions"] == seen
+
+
+def test_truncated_stream_without_any_question_raises_runtime_error():
+    mock_client = make_scripted_gemini_client(['{"questions": [{"question_st'])
+
+    with pytest.raises(RuntimeError):
+        generate_with(mock_client, question_count=2, on_question=lambda question: None, max_repair_rounds=0)
+
+
+def test_invalid_streamed_questions_are_not_handed_over():
+    seen = []
+    mock_client = make_scripted_gemini_client([[make_question("Good?"), {"question_stem": "Bad?", "choices": [], "rationale": ""}]])
+
+    result = generate_with(mock_client, question_count=2, on_question=seen.append, max_repair_rounds=0)
+
+    assert [q["question_stem"] for q in seen] == ["Good?"]
+    assert result["questions"] == seen
+
+
+# --- sharded generation ---
+
+def test_large_request_is_split_into_parallel_shards():
+    mock_client = make_scripted_gemini_client([
+        [make_question("Q1"), make_question("Q2")],
+        [make_question("Q3"), make_question("Q4")],
+        [make_question("Q5")],
+    ], barrier=threading.Barrier(3))
+
+    result = generate_with(mock_client, question_count=5, shard_size=2)
+
+    assert [q["question_stem"] for q in result["questions"]] == ["Q1", "Q2", "Q3", "Q4", "Q5"]
+    prompts = [prompt_of(mock_client, call) for call in range(3)]
+    assert sorted(re.search(r"exactly (\d+)", p).group(1) for p in prompts) == ["1", "2", "2"]
+
+
+def test_shards_are_deduplicated_across_each_other():
+    mock_client = make_scripted_gemini_client([
+        [make_question("What is X?"), make_question("What is Y?")],
+        [make_question("what is  x"), make_question("What is Z?")],
+        [make_question("What is W?")],
+    ])
+
+    result = generate_with(mock_client, question_count=4, shard_size=2)
+
+    assert [q["question_stem"] for q in result["questions"]] == ["What is X?", "What is Y?", "What is Z?", "What is W?"]
+    assert "part " not in prompt_of(mock_client, 2)
+
+
+def test_one_malformed_shard_does_not_fail_the_quiz():
+    mock_client = make_scripted_gemini_client([
+        [make_question("Q1"), make_question("Q2")],
+        '{"questions": [{"question_stem": "trunc',
+        RuntimeError("Gemini content generation failed: 503"),
+    ])
+
+    result = generate_with(mock_client, question_count=6, shard_size=2)
+
+    assert [q["question_stem"] for q in result["questions"]] == ["Q1", "Q2"]
+    assert mock_client.models.generate_content.call_count == 3
+
+
+def test_all_shards_failing_raises_runtime_error():
+    mock_client = make_scripted_gemini_client(["not json", "not json"])
+
+    with pytest.raises(RuntimeError):
+        generate_with(mock_client, question_count=4, shard_size=2)
+
+
+def test_small_request_is_not_sharded():
+    mock_client = make_scripted_gemini_client([VALID_QUIZ_RESPONSE])
+
+    generate_with(mock_client, question_count=1, shard_size=10)
+
+    assert mock_client.models.generate_content.call_count == 1
+    assert "part 1 of" not in prompt_of(mock_client, 0)
+
+
+# --- validation and repair ---
+
+def test_only_invalid_questions_are_re_requested():
+    bad = {"question_stem": "Three choices?", "choices": four_choices()[:3], "rationale": ""}
+    mock_client = make_scripted_gemini_client([
+        [make_question("Good one?"), bad, make_question("Good two?")],
+        [make_question("Replacement?")],
+    ])
+
+    result = generate_with(mock_client, question_count=3)
+
+    assert [q["question_stem"] for q in result["questions"]] == ["Good one?", "Good two?", "Replacement?"]
+    repair_prompt = prompt_of(mock_client, 1)
+    assert "exactly 1 challenging" in repair_prompt
+    assert '"Three choices?" has 3 choices instead of 4' in repair_prompt
+    assert "- Good one?" in repair_prompt
+
+
+def test_truncated_response_keeps_complete_questions_and_tops_up():
+    full = json.dumps({"questions": [make_question("Kept?"), make_question("Cut off?")]})
+    mock_client = make_scripted_gemini_client([
+        full[:full.index("Cut off?")],
+        [make_question("Top-up?")],
+    ])
+
+    result = generate_with(mock_client, question_count=2)
+
+    assert [q["question_stem"] for q in result["questions"]] == ["Kept?", "Top-up?"]
+    assert "cut off" in prompt_of(mock_client, 1)
+
+
+def test_dropped_near_duplicates_are_re_requested():
+    previous = [{"question_text": "What does photosynthesis produce?"}]
+    mock_client = make_scripted_gemini_client([
+        [make_question("What does photosynthesis produce?"), make_question("New one?")],
+        [make_question("Replacement?")],
+    ])
+
+    result = generate_with(mock_client, question_count=2, previous_questions=previous)
+
+    assert [q["question_stem"] for q in result["questions"]] == ["New one?", "Replacement?"]
+    repair_prompt = prompt_of(mock_client, 1)
+    assert "exactly 1 challenging" in repair_prompt
+    assert '"What does photosynthesis produce?" repeats an existing question' in repair_prompt
+
+
+def test_repair_stops_after_max_rounds():
+    bad = {"question_stem": "No answer?", "choices": four_choices()[:2], "rationale": ""}
+    mock_client = make_scripted_gemini_client([[make_question("Fine?"), bad], [bad], [bad]])
+
+    result = generate_with(mock_client, question_count=2, max_repair_rounds=2)
+
+    assert [q["question_stem"] for q in result["questions"]] == ["Fine?"]
+    assert mock_client.models.generate_content.call_count == 3
+
+
+def test_all_questions_invalid_raises_runtime_error():
+    mock_client = make_scripted_gemini_client([[{"question_stem": "No answer?", "choices": four_choices()[:2], "rationale": ""}]])
+
+    with pytest.raises(RuntimeError, match="did not return any valid questions"):
+        generate_with(mock_client, question_count=1, max_repair_rounds=0)
+
+
+def test_all_questions_duplicates_raises_runtime_error():
+    mock_client = make_scripted_gemini_client([[make_question("What does photosynthesis produce?")]])
+    previous = [{"question_text": "What does photosynthesis produce?"}]
+
+    with pytest.raises(RuntimeError, match="duplicates an existing question"):
+        generate_with(mock_client, question_count=1, max_repair_rounds=0, previous_questions=previous)
+
+
+def test_no_questions_raises_runtime_error():
+    mock_client = make_scripted_gemini_client([[]])
+
+    with pytest.raises(RuntimeError, match="did not return any questions"):
+        generate_with(mock_client, question_count=1, max_repair_rounds=0)
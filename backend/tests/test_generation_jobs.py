@@ -0,0 +1,149 @@
+"""
+Unit tests for the in-process generation job queue in generation_jobs.py
+"""
+import asyncio
+import threading
+import pytest
+import pytest_asyncio
+from generation_jobs import GenerationQueue, QueueFullError
+
+
+@pytest_asyncio.fixture
+async def queue():
+    q = GenerationQueue(workers=2)
+    await q.start()
+    yield q
+    await q.stop()
+
+
+async def collect(queue, job, since=0):
+    return [event async for _, event in queue.follow(job, since)]
+
+
+@pytest.mark.asyncio
+async def test_job_runs_in_background_and_completes(queue):
+    release = asyncio.Event()
+
+    async def run(progress):
+        await release.wait()
+        return {"quiz_id": "abc"}
+
+    job = queue.submit("user_1", run)
+    assert job.status == "queued"  # submit returns before the work is done
+
+    release.set()
+    events = await asyncio.wait_for(collect(queue, job), timeout=2)
+
+    assert [e["stage"] for e in events] == ["queued", "started", "completed"]
+    assert job.snapshot()["result"] == {"quiz_id": "abc"}
+
+
+@pytest.mark.asyncio
+async def test_progress_reported_from_worker_threads_is_streamed_in_order(queue):
+    async def run(progress):
+        def blocking_work():
+            for i in range(1, 4):
+                progress({"stage": "downloading", "file": i, "total": 3})
+            progress({"stage": "generating"})
+
+        await asyncio.to_thread(blocking_work)
+        return "done"
+
+    job = queue.submit("user_1", run)
+    events = await asyncio.wait_for(collect(queue, job), timeout=2)
+
+    stages = [(e["stage"], e.get("file")) for e in events]
+    assert stages == [("queued", None), ("started", None), ("downloading", 1), ("downloading", 2),
+                      ("downloading", 3), ("generating", None), ("completed", None)]
+
+
+@pytest.mark.asyncio
+async def test_failure_keeps_status_code(queue):
+    class FakeHTTPException(Exception):
+        status_code = 400
+        detail = "No Gemini API key found."
+
+    async def run(progress):
+        raise FakeHTTPException()
+
+    job = queue.submit("user_1", run)
+    events = await asyncio.wait_for(collect(queue, job), timeout=2)
+
+    assert job.status == "failed"
+    assert events[-1] == {"stage": "failed", "error": {"status_code": 400, "detail": "No Gemini API key found."}}
+
+
+@pytest.mark.asyncio
+async def test_follow_resumes_from_index(queue):
+    async def run(progress):
+        progress({"stage": "generating"})
+        return 1
+
+    job = queue.submit("user_1", run)
+    await asyncio.wait_for(collect(queue, job), timeout=2)
+
+    assert [e["stage"] for e in await collect(queue, job, since=2)] == ["generating", "completed"]
+
+
+@pytest.mark.asyncio
+async def test_jobs_are_only_visible_to_their_owner(queue):
+    async def run(progress):
+        return None
+
+    job = queue.submit("user_1", run)
+    assert queue.get(job.id, "user_1") is job
+    assert queue.get(job.id, "user_2") is None
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_runs_jobs_concurrently(queue):
+    barrier = threading.Barrier(2)
+
+    async def run(progress):
+        # Both jobs must be running at once for the barrier to open
+        await asyncio.to_thread(barrier.wait, 2)
+        return "ok"
+
+    jobs = [queue.submit("user_1", run) for _ in range(2)]
+    for job in jobs:
+        await asyncio.wait_for(collect(queue, job), timeout=3)
+    assert [job.status for job in jobs] == ["completed", "completed"]
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_new_jobs():
+    q = GenerationQueue(workers=1, max_pending=1)
+    await q.start()
+    release = asyncio.Event()
+
+    async def run(progress):
+        await release.wait()
+
+    try:
+        q.submit("user_1", run)
+        await asyncio.sleep(0)  # let the worker pick up the first job
+        q.submit("user_1", run)
+        with pytest.raises(QueueFullError):
+            q.submit("user_1", run)
+    finally:
+        release.set()
+        await q.stop()
+
+
+@pytest.mark.asyncio
+async def test_finished_jobs_are_pruned_after_ttl():
+    now = [0.0]
+    q = GenerationQueue(workers=1, job_ttl=10, clock=lambda: now[0])
+    await q.start()
+
+    async def run(progress):
+        return None
+
+    try:
+        old = q.submit("user_1", run)
+        await asyncio.wait_for(collect(q, old), timeout=2)
+        now[0] = 11.0
+        q.submit("user_1", run)
+        assert q.get(old.id, "user_1") is None
+    finally:
+        await q.stop()
@@ -0,0 +1,67 @@
+"""
+Unit tests for http_pool.py
+"""
+import asyncio
+import threading
+import httpx
+import pytest
+import requests
+from unittest.mock import patch
+import http_pool
+from canvas_client import AsyncCanvasClient
+from canvas_retriever import CanvasContentRetriever
+
+
+def test_sync_pools_are_created_once_and_shared_across_threads():
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append((http_pool.shared_session(), http_pool.shared_sync_client()))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len({id(session) for session, _ in seen}) == 1
+    assert len({id(client) for _, client in seen}) == 1
+
+
+def test_session_applies_default_timeout():
+    session = http_pool.shared_session()
+    with patch.object(requests.Session, "request", return_value="ok") as request:
+        session.get("https://canvas.example/api")
+
+    assert request.call_args.kwargs["timeout"] == (http_pool.CONNECT_TIMEOUT_SECONDS, http_pool.READ_TIMEOUT_SECONDS)
+
+
+def test_session_keeps_an_explicit_timeout():
+    session = http_pool.shared_session()
+    with patch.object(requests.Session, "request", return_value="ok") as request:
+        session.get("https://canvas.example/api", timeout=2)
+
+    assert request.call_args.kwargs["timeout"] == 2
+
+
+def test_retriever_uses_shared_session_unless_one_is_injected():
+    own = requests.Session()
+    assert CanvasContentRetriever("https://canvas", "tok").session is http_pool.shared_session()
+    assert CanvasContentRetriever("https://canvas", "tok", session=own).session is own
+
+
+@pytest.mark.asyncio
+async def test_async_clients_share_one_pool_per_loop():
+    first = AsyncCanvasClient(canvas_url="https://canvas", access_token="a")
+    second = AsyncCanvasClient(canvas_url="https://canvas", access_token="b")
+    await first.aclose()
+
+    assert first._client is second._client is http_pool.shared_async_client()
+    assert not first._client.is_closed
+
+    other_loop_client = await asyncio.to_thread(lambda: asyncio.run(_shared_async_client()))
+    assert other_loop_client is not first._client
+
+    await http_pool.aclose_shared_clients()
+    assert first._client.is_closed
+    assert http_pool.shared_async_client() is not first._client
+
+
+async def _shared_async_client() -> httpx.AsyncClient:
+    return http_pool.shared_async_client()
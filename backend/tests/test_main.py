@@ -0,0 +1,656 @@
+"""
+Unit tests for request-level helpers in main.py
+Clerk, MongoDB and Canvas are all patched out.
+"""
+import asyncio
+import json
+import time
+import httpx
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi import HTTPException
+import main
+from canvas_client import AsyncCanvasClient
+from canvas_rate_limit import CanvasRateLimits
+from prompt_context import compact_line
+from quiz_state import QuizStateCache
+from quiz_sync import canvas_item_hash, question_from_canvas_item
+
+
+@pytest.fixture(autouse=True)
+def clear_session_cache():
+    main.session_cache.clear()
+    yield
+    main.session_cache.clear()
+
+
+# --- get_current_user session cache ---
+
+def clerk_identity(sub="user_1", exp=None, **profile):
+    return {"sub": sub, "exp": exp if exp is not None else time.time() + 60,
+            "email": profile.get("email"), "first_name": profile.get("first_name"), "last_name": profile.get("last_name")}
+
+
+@pytest.mark.asyncio
+async def test_repeat_request_in_same_session_skips_upsert():
+    verify = AsyncMock(return_value=clerk_identity(email="a@b.c"))
+    upsert = MagicMock(return_value={"clerk_id": "user_1", "email": "a@b.c"})
+
+    with patch("main.verify_clerk_token", verify), patch("main.get_or_create_user", upsert):
+        first = await main.get_current_user("Bearer token")
+        second = await main.get_current_user("Bearer token")
+
+    assert first == second
+    upsert.assert_called_once()
+    assert main.session_cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_invalid_token_returns_401():
+    verify = AsyncMock(side_effect=ValueError("Invalid token: bad signature"))
+    with patch("main.verify_clerk_token", verify):
+        with pytest.raises(HTTPException) as exc:
+            await main.get_current_user("Bearer token")
+    assert exc.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_expired_session_is_not_cached():
+    verify = AsyncMock(return_value=clerk_identity(exp=time.time() - 1, email="a@b.c"))
+
+    with patch("main.verify_clerk_token", verify), patch("main.get_or_create_user", MagicMock(return_value={"email": "a@b.c"})):
+        await main.get_current_user("Bearer token")
+
+    assert len(main.session_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_invalidate_cached_user_forces_reload():
+    verify = AsyncMock(return_value=clerk_identity(email="a@b.c"))
+    upsert = MagicMock(return_value={"clerk_id": "user_1", "email": "a@b.c"})
+
+    with patch("main.verify_clerk_token", verify), patch("main.get_or_create_user", upsert):
+        await main.get_current_user("Bearer token")
+        main.invalidate_cached_user("user_1")
+        await main.get_current_user("Bearer token")
+
+    assert upsert.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_clerk_profile_is_fetched_only_when_user_has_no_email():
+    verify = AsyncMock(return_value=clerk_identity())
+    upsert = MagicMock(side_effect=[{"clerk_id": "user_1", "email": None}, {"clerk_id": "user_1", "email": "a@b.c"}])
+    profile = AsyncMock(return_value={"email": "a@b.c", "first_name": "A", "last_name": "B"})
+
+    with patch("main.verify_clerk_token", verify), patch("main.get_or_create_user", upsert), patch("main.fetch_clerk_profile", profile):
+        user = await main.get_current_user("Bearer token")
+
+    assert user["email"] == "a@b.c"
+    profile.assert_awaited_once_with("user_1")
+    assert upsert.call_args_list[0].args == ("user_1", None)
+
+
+@pytest.mark.asyncio
+async def test_clerk_profile_is_skipped_for_known_user():
+    verify = AsyncMock(return_value=clerk_identity())
+    upsert = MagicMock(return_value={"clerk_id": "user_1", "email": "a@b.c"})
+    profile = AsyncMock()
+
+    with patch("main.verify_clerk_token", verify), patch("main.get_or_create_user", upsert), patch("main.fetch_clerk_profile", profile):
+        await main.get_current_user("Bearer token")
+
+    profile.assert_not_awaited()
+
+
+# --- record_publish_failure ---
+
+def test_publish_failure_keeps_partial_canvas_progress():
+    error = main.PublishError("item 2 failed", "quiz_abc", [{"canvas_item_id": "item_1"}, {"canvas_item_id": None}])
+    with patch("main.course_quizzes_collection") as collection:
+        main.record_publish_failure("65a000000000000000000001", error)
+
+    update = collection.update_one.call_args[0][1]["$set"]
+    assert update["status"] == "publish_failed"
+    assert update["new_quiz_id"] == "quiz_abc"
+    assert update["questions.0.canvas_item_id"] == "item_1"
+    assert update["questions.1.canvas_item_id"] is None
+
+
+def test_failure_before_shell_only_records_error():
+    with patch("main.course_quizzes_collection") as collection:
+        main.record_publish_failure("65a000000000000000000001", RuntimeError("Failed to create quiz shell: 401"))
+
+    update = collection.update_one.call_args[0][1]["$set"]
+    assert update["publish_metadata.last_error"] == "Failed to create quiz shell: 401"
+    assert "new_quiz_id" not in update
+
+
+# --- run_publish_job ---
+
+class DictJobStore(main.PublishJobStore):
+    """PublishJobStore with the MongoDB calls replaced by a single in-memory job."""
+
+    def __init__(self):
+        super().__init__(collection=None)
+        self.job = None
+
+    def claim(self, quiz_doc, publish, clerk_id):
+        if self.job is None or self.job["status"] == "completed":
+            self.job = {"_id": "job_1", "new_quiz_id": None, "items": {}}
+        self.job["status"] = "running"
+        return dict(self.job, items=dict(self.job["items"]))
+
+    def _checkpoint(self, job_id, fields):
+        for key, value in fields.items():
+            if key.startswith("items."):
+                self.job["items"][key[len("items."):]] = value
+            else:
+                self.job[key] = value
+
+    def _finish(self, job_id, status, error):
+        self.job["status"] = status
+
+
+class FlakyCanvas:
+    """Creates a shell + items; fails the item for `fail_question` once."""
+
+    def __init__(self, fail_question):
+        self.fail_question = fail_question
+        self.shells_created = 0
+        self.items_posted = []
+
+    async def publish_quiz_to_canvas(self, quiz_doc, publish, on_shell_created, on_item_created):
+        new_quiz_id = quiz_doc.get("new_quiz_id")
+        if not new_quiz_id:
+            self.shells_created += 1
+            new_quiz_id = "quiz_abc"
+            on_shell_created(new_quiz_id)
+        for q in quiz_doc["questions"]:
+            if q.get("canvas_item_id"):
+                continue
+            if q["internal_question_id"] == self.fail_question:
+                self.fail_question = None
+                raise main.PublishError("item failed", new_quiz_id, [])
+            self.items_posted.append(q["internal_question_id"])
+            on_item_created(q["internal_question_id"], f"item_{q['internal_question_id']}")
+        return {"new_quiz_id": new_quiz_id, "assignment_id": new_quiz_id, "questions": quiz_doc["questions"]}
+
+
+@pytest.mark.asyncio
+async def test_publish_job_retry_continues_from_checkpoint():
+    quiz_doc = {"_id": "quiz_1", "course_id": 1, "questions": [{"internal_question_id": q} for q in ("q1", "q2", "q3")]}
+    canvas = FlakyCanvas(fail_question="q2")
+    store = DictJobStore()
+
+    with patch("main.publish_jobs", store):
+        with pytest.raises(main.PublishError):
+            await main.run_publish_job(canvas, quiz_doc, False, "user_1")
+        assert store.job["status"] == "failed"
+
+        await main.run_publish_job(canvas, quiz_doc, False, "user_1")
+
+    assert canvas.shells_created == 1
+    assert canvas.items_posted == ["q1", "q2", "q3"]
+    assert store.job["status"] == "completed"
+
+
+@pytest.mark.asyncio
+async def test_publish_job_starts_over_when_resumed_shell_was_deleted():
+    quiz_doc = {"_id": "quiz_1", "course_id": 1, "new_quiz_id": "orphan",
+                "questions": [{"internal_question_id": q, "canvas_item_id": f"old_{q}"} for q in ("q1", "q2")]}
+    store = DictJobStore()
+    store.forget = lambda quiz_id: setattr(store, "job", None)
+
+    class OrphanCanvas(FlakyCanvas):
+        async def publish_quiz_to_canvas(self, quiz_doc, publish, on_shell_created, on_item_created):
+            if quiz_doc.get("new_quiz_id") == "orphan":
+                raise main.ShellNotFoundError("orphan")
+            return await super().publish_quiz_to_canvas(quiz_doc, publish, on_shell_created, on_item_created)
+
+    canvas = OrphanCanvas(fail_question=None)
+    with patch("main.publish_jobs", store), patch("main.course_quizzes_collection") as collection:
+        result = await main.run_publish_job(canvas, quiz_doc, False, "user_1")
+
+    assert result["new_quiz_id"] == "quiz_abc"
+    assert canvas.shells_created == 1
+    cleared = collection.update_one.call_args[0][1]["$set"]
+    assert cleared["new_quiz_id"] is None and cleared["questions.$[].canvas_item_id"] is None
+    assert store.job["status"] == "completed"
+
+
+# --- generation job endpoints ---
+
+def fake_generate_quiz_from_files(files, canvas_token, gemini_token, previous_questions, question_count,
+                                  file_cache=None, on_progress=None, on_question=None):
+    """Stands in for the Gemini pipeline: reports per-file progress and each question from the worker thread."""
+    for i, f in enumerate(files, start=1):
+        if on_progress:
+            on_progress({"stage": "downloading", "file": i, "total": len(files), "display_name": f["display_name"]})
+            on_progress({"stage": "uploading", "file": i, "total": len(files), "display_name": f["display_name"]})
+    if on_progress:
+        on_progress({"stage": "generating"})
+    questions = [{"question_stem": "Q?", "choices": [{"text": "A", "is_correct": True}], "rationale": ""}]
+    for question in questions:
+        if on_question:
+            on_question(question)
+    return {"questions": questions}
+
+
+@pytest.mark.asyncio
+async def test_generation_job_streams_progress_and_saves_quiz():
+    queue = main.GenerationQueue(workers=1)
+    await queue.start()
+    user = {"clerk_id": "user_1", "canvas_token": None, "gemini_token": None, "courses": []}
+    body = main.GenerateQuizRequest(files=[
+        {"url": "https://canvas/a.pdf", "display_name": "a.pdf"},
+        {"url": "https://canvas/b.pdf", "display_name": "b.pdf"},
+    ])
+
+    collection = MagicMock()
+    collection.insert_one.return_value.inserted_id = "quiz_123"
+    try:
+        with patch("main.generation_queue", queue), \
+                patch("main.generate_quiz_from_files", fake_generate_quiz_from_files), \
+                patch("main.course_quizzes_collection", collection), \
+                patch.dict("os.environ", {"CANVAS_TOKEN": "tok", "GEMINI_KEY": "key"}):
+            queued = await main.enqueue_generate_quiz(body, user)
+            response = await main.stream_generate_quiz_job(queued["job_id"], 0, user)
+            chunks = [chunk async for chunk in response.body_iterator]
+            status = await main.get_generate_quiz_job(queued["job_id"], user)
+    finally:
+        await queue.stop()
+
+    stages = [json.loads(chunk.split("data: ", 1)[1])["stage"] for chunk in chunks]
+    assert stages == ["queued", "started", "downloading", "uploading", "downloading", "uploading",
+                      "generating", "question", "saved", "completed"]
+    assert chunks[0].startswith("id: 0\n")
+    assert status["status"] == "completed"
+    assert status["result"]["quiz_id"] == "quiz_123"
+
+
+@pytest.mark.asyncio
+async def test_streaming_generation_sends_questions_before_saving():
+    user = {"clerk_id": "user_1", "canvas_token": None, "gemini_token": None, "courses": []}
+    body = main.GenerateQuizRequest(files=[{"url": "https://canvas/a.pdf", "display_name": "a.pdf"}], stream=True)
+
+    collection = MagicMock()
+    collection.insert_one.return_value.inserted_id = "quiz_123"
+    with patch("main.generate_quiz_from_files", fake_generate_quiz_from_files), \
+            patch("main.course_quizzes_collection", collection), \
+            patch.dict("os.environ", {"CANVAS_TOKEN": "tok", "GEMINI_KEY": "key"}):
+        response = await main.generate_quiz(body, user)
+        chunks = [chunk async for chunk in response.body_iterator]
+
+    assert response.media_type == "text/event-stream"
+    assert [chunk.split("\n", 1)[0] for chunk in chunks] == ["event: question", "event: saved"]
+    question = json.loads(chunks[0].split("data: ", 1)[1])
+    assert question == {"index": 0, "question": {"question_stem": "Q?", "choices": [{"text": "A", "is_correct": True}], "rationale": ""}}
+    assert json.loads(chunks[1].split("data: ", 1)[1])["quiz_id"] == "quiz_123"
+
+
+@pytest.mark.asyncio
+async def test_streaming_generation_is_kept_alive_after_client_disconnects():
+    user = {"clerk_id": "user_1", "canvas_token": None, "gemini_token": None, "courses": []}
+    body = main.GenerateQuizRequest(files=[{"url": "https://canvas/a.pdf", "display_name": "a.pdf"}], stream=True)
+
+    collection = MagicMock()
+    collection.insert_one.return_value.inserted_id = "quiz_123"
+    with patch("main.generate_quiz_from_files", fake_generate_quiz_from_files), \
+            patch("main.course_quizzes_collection", collection), \
+            patch.dict("os.environ", {"CANVAS_TOKEN": "tok", "GEMINI_KEY": "key"}):
+        stream = main.stream_generated_quiz(body, user)
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.gather(*main.streaming_generations)
+
+    collection.insert_one.assert_called_once()
+    assert not main.streaming_generations
+
+
+@pytest.mark.asyncio
+async def test_streaming_generation_reports_errors_as_events():
+    user = {"clerk_id": "user_1", "canvas_token": None, "gemini_token": None, "courses": []}
+    body = main.GenerateQuizRequest(files=[], stream=True)
+
+    with patch.dict("os.environ", {"CANVAS_TOKEN": "tok", "GEMINI_KEY": ""}):
+        response = await main.generate_quiz(body, user)
+        chunks = [chunk async for chunk in response.body_iterator]
+
+    assert len(chunks) == 1 and chunks[0].startswith("event: error\n")
+    assert json.loads(chunks[0].split("data: ", 1)[1])["status_code"] == 400
+
+
+@pytest.mark.asyncio
+async def test_generation_treats_saved_course_quizzes_as_previous_questions():
+    user = {"clerk_id": "user_1", "canvas_token": None, "gemini_token": None, "courses": [{"id": 7}]}
+    body = main.GenerateQuizRequest(files=[{"url": "https://canvas/a.pdf", "display_name": "a.pdf"}], course_id=7)
+    saved = {"question_stem_html": "<p>Saved Q?</p>", "choices": [
+        {"text_html": "<p>No</p>", "is_correct": False}, {"text_html": "<p>Yes</p>", "is_correct": True},
+    ]}
+    seen = {}
+
+    def generate(files, canvas_token, gemini_token, previous_questions, question_count, **kwargs):
+        seen["previous"] = previous_questions
+        return fake_generate_quiz_from_files(files, canvas_token, gemini_token, previous_questions, question_count)
+
+    collection = MagicMock()
+    collection.find.return_value = [{"_id": "q0", "questions": [saved]}]
+    collection.insert_one.return_value.inserted_id = "quiz_123"
+    with patch("main.generate_quiz_from_files", generate), \
+            patch("main.course_quizzes_collection", collection), \
+            patch("main.assert_course_access"), \
+            patch.dict("os.environ", {"CANVAS_TOKEN": "tok", "GEMINI_KEY": "key"}):
+        await main.create_generated_quiz(body, user)
+
+    assert seen["previous"] == [saved]
+    assert compact_line(seen["previous"][0]) == "- Saved Q? -> Yes"
+    query, projection = collection.find.call_args[0]
+    assert query == {"course_id": 7, "created_by_clerk_id": "user_1"}
+    assert {"questions.choices.text_html", "questions.choices.is_correct"} <= set(projection)
+
+
+@pytest.mark.asyncio
+async def test_cached_generation_skips_gemini_unless_forced_fresh():
+    user = {"clerk_id": "user_1", "canvas_token": None, "gemini_token": None, "courses": []}
+    files = [{"id": 21, "modified_at": "2026-01-01T00:00:00Z", "url": "https://canvas/a.pdf", "display_name": "a.pdf"}]
+    calls = []
+
+    def generate(*args, **kwargs):
+        calls.append(args)
+        return fake_generate_quiz_from_files(*args)
+
+    store = {}
+    cache = MagicMock()
+    cache.lookup.side_effect = lambda owner, key: store.get((owner, key))
+    cache.store.side_effect = lambda owner, key, quiz: store.__setitem__((owner, key), quiz)
+    collection = MagicMock()
+    collection.insert_one.return_value.inserted_id = "quiz_123"
+    with patch("main.generate_quiz_from_files", generate), \
+            patch("main.quiz_result_cache", cache), \
+            patch("main.course_quizzes_collection", collection), \
+            patch.dict("os.environ", {"CANVAS_TOKEN": "tok", "GEMINI_KEY": "key"}):
+        first = await main.create_generated_quiz(main.GenerateQuizRequest(files=files, use_cache=True), user)
+        second = await main.create_generated_quiz(main.GenerateQuizRequest(files=files, use_cache=True), user)
+        await main.create_generated_quiz(main.GenerateQuizRequest(files=files, use_cache=True, force_fresh=True), user)
+        await main.create_generated_quiz(main.GenerateQuizRequest(files=files), user)
+
+    assert len(calls) == 3
+    assert [q["question_stem_html"] for q in second["questions"]] == [q["question_stem_html"] for q in first["questions"]]
+    # A hit is still saved as its own draft with fresh ids
+    assert second["questions"][0]["internal_question_id"] != first["questions"][0]["internal_question_id"]
+    assert cache.store.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_unknown_generation_job_is_404():
+    with pytest.raises(HTTPException) as exc_info:
+        await main.get_generate_quiz_job("nope", {"clerk_id": "user_1"})
+    assert exc_info.value.status_code == 404
+
+
+# --- Canvas rate-limit metrics ---
+
+@pytest.mark.asyncio
+async def test_rate_limit_metrics_are_for_the_current_users_token():
+    registry = CanvasRateLimits()
+    registry.for_token("tok").try_acquire()
+    with patch("main.canvas_rate_limits", registry), patch.dict("os.environ", {"CANVAS_TOKEN": "tok"}):
+        metrics = await main.canvas_rate_limit_metrics({"clerk_id": "user_1", "canvas_token": None})
+
+    assert metrics["in_flight"] == 1
+    assert metrics["requests"] == 1
+
+
+# --- save_quiz_edits ---
+
+class PointsCanvas:
+    """Async Canvas stand-in whose bulk points update rejects `fail_items`."""
+
+    def __init__(self, fail_items=()):
+        self.fail_items = set(fail_items)
+        self.sent = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return None
+
+    async def update_items_points_on_canvas(self, course_id, new_quiz_id, points):
+        self.sent = dict(points)
+        return await main.fan_out(list(points), self._update)
+
+    async def _update(self, canvas_item_id):
+        if canvas_item_id in self.fail_items:
+            raise RuntimeError(f"Failed to update points for item {canvas_item_id}: 500")
+
+
+def edits_quiz(status="saved_to_canvas"):
+    return {
+        "_id": "65a000000000000000000001", "course_id": 7, "new_quiz_id": "quiz_abc", "status": status,
+        "questions": [{"internal_question_id": f"q{n}", "canvas_item_id": f"item_{n}"} for n in (1, 2, 3)],
+    }
+
+
+async def save_edits(quiz, canvas, points):
+    body = main.SaveQuizEditsBody(questions=[{"internal_question_id": q, "points_possible": p} for q, p in points.items()])
+    collection = MagicMock()
+    collection.find_one.return_value = quiz
+    with patch("main.course_quizzes_collection", collection), \
+            patch("main.assert_course_access"), \
+            patch("main.decrypt", lambda token: token), \
+            patch("main.AsyncCanvasClient", lambda **kwargs: canvas):
+        try:
+            return await main.save_quiz_edits(quiz["_id"], body, {"clerk_id": "user_1", "canvas_token": "tok"}), collection
+        except HTTPException as e:
+            return e, collection
+
+
+@pytest.mark.asyncio
+async def test_save_edits_sends_every_item_in_one_bulk_update():
+    canvas = PointsCanvas()
+    result, collection = await save_edits(edits_quiz(), canvas, {"q1": 2.0, "q3": 4.0})
+
+    assert result == {"saved": True, "updated": ["q1", "q3"]}
+    assert canvas.sent == {"item_1": 2.0, "item_3": 4.0}
+    update = collection.update_one.call_args[0][1]["$set"]
+    assert update["questions.0.points_possible"] == 2.0
+    assert update["questions.2.points_possible"] == 4.0
+
+
+@pytest.mark.asyncio
+async def test_save_edits_only_keeps_what_canvas_accepted():
+    result, collection = await save_edits(edits_quiz(), PointsCanvas(fail_items={"item_2"}), {"q1": 2.0, "q2": 3.0})
+
+    assert isinstance(result, HTTPException) and result.status_code == 502
+    assert "Saved 1 of 2" in result.detail and "q2" in result.detail
+    update = collection.update_one.call_args[0][1]["$set"]
+    assert "questions.0.points_possible" in update
+    assert "questions.1.points_possible" not in update
+
+
+@pytest.mark.asyncio
+async def test_save_edits_on_draft_skips_canvas():
+    canvas = PointsCanvas()
+    result, collection = await save_edits(edits_quiz(status="draft"), canvas, {"q2": 5.0})
+
+    assert result["updated"] == ["q2"]
+    assert canvas.sent == {}
+    assert collection.update_one.call_args[0][1]["$set"]["questions.1.points_possible"] == 5.0
+
+
+# --- sync_from_canvas ---
+
+def canvas_item(n, stem=None, points=1):
+    return {
+        "id": f"item_{n}", "position": n, "points_possible": points,
+        "entry": {
+            "item_body": stem or f"<p>Q{n}</p>",
+            "interaction_data": {"choices": [{"id": f"c{n}a", "item_body": "A"}, {"id": f"c{n}b", "item_body": "B"}]},
+            "scoring_data": {"value": f"c{n}a"},
+        },
+    }
+
+
+def synced_question(item, with_hash=True):
+    question = question_from_canvas_item(item, item["position"])
+    question["internal_question_id"] = f"q{item['position']}"
+    if not with_hash:
+        del question["canvas_hash"]
+    return question
+
+
+async def run_sync(questions, items):
+    quiz = {
+        "_id": "65a000000000000000000001", "course_id": 7, "new_quiz_id": "quiz_abc", "status": "saved_to_canvas",
+        "title": "Quiz", "question_count": len(questions), "questions": questions,
+    }
+    canvas = MagicMock()
+    canvas.__aenter__ = AsyncMock(return_value=canvas)
+    canvas.__aexit__ = AsyncMock(return_value=None)
+    canvas.fetch_canvas_quiz_title = AsyncMock(return_value="Quiz")
+    canvas.fetch_canvas_quiz_items = AsyncMock(return_value=items)
+    collection = MagicMock()
+    collection.find_one.return_value = quiz
+    collection.find_one_and_update.return_value = {**quiz, "_id": quiz["_id"]}
+    with patch("main.course_quizzes_collection", collection), \
+            patch("main.assert_course_access"), \
+            patch("main.decrypt", lambda token: token), \
+            patch("main.AsyncCanvasClient", lambda **kwargs: canvas):
+        result = await main.sync_from_canvas(quiz["_id"], {"clerk_id": "user_1", "canvas_token": "tok"})
+    return result, collection
+
+
+@pytest.mark.asyncio
+async def test_sync_skips_items_whose_hash_is_unchanged():
+    items = [canvas_item(n) for n in (1, 2, 3)]
+    result, collection = await run_sync([synced_question(item) for item in items], items)
+
+    assert result["changed_question_ids"] == []
+    collection.find_one_and_update.assert_not_called()
+    assert collection.find_one.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_sync_writes_only_the_changed_question():
+    items = [canvas_item(n) for n in (1, 2, 3)]
+    questions = [synced_question(item) for item in items]
+    items[1] = canvas_item(2, stem="<p>Edited in Canvas</p>", points=3)
+
+    result, collection = await run_sync(questions, items)
+
+    assert result["changed_question_ids"] == ["q2"]
+    update, = collection.find_one_and_update.call_args[0][1:]
+    kwargs = collection.find_one_and_update.call_args[1]
+    assert "questions" not in update["$set"]
+    assert update["$set"]["questions.$[q0]"]["question_stem_html"] == "<p>Edited in Canvas</p>"
+    assert update["$set"]["questions.$[q0]"]["canvas_hash"] == canvas_item_hash(items[1])
+    assert kwargs["array_filters"] == [{"q0.internal_question_id": "q2"}]
+    assert kwargs["return_document"] == main.ReturnDocument.AFTER
+    # The post-image comes back from the update itself
+    assert collection.find_one.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_sync_backfills_missing_hashes_without_reporting_changes():
+    items = [canvas_item(n) for n in (1, 2)]
+    result, collection = await run_sync([synced_question(item, with_hash=False) for item in items], items)
+
+    assert result["changed_question_ids"] == []
+    update = collection.find_one_and_update.call_args[0][1]["$set"]
+    assert sorted(update) == ["questions.$[q0]", "questions.$[q1]"]
+
+
+@pytest.mark.asyncio
+async def test_sync_rewrites_array_when_items_are_added_or_removed():
+    items = [canvas_item(n) for n in (1, 2, 3)]
+    questions = [synced_question(item) for item in items[:2]] + [{**synced_question(canvas_item(9)), "position": 9}]
+
+    result, collection = await run_sync(questions, items)
+
+    update = collection.find_one_and_update.call_args[0][1]["$set"]
+    assert [q["canvas_item_id"] for q in update["questions"]] == ["item_1", "item_2", "item_3"]
+    assert collection.find_one_and_update.call_args[1]["array_filters"] is None
+    assert len(result["changed_question_ids"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_sync_reads_every_page_of_a_large_quiz():
+    items = [canvas_item(n) for n in range(1, 251)]
+    items_url = "https://canvas.test/api/quiz/v1/courses/7/quizzes/quiz_abc/items"
+
+    def handler(request):
+        if not request.url.path.endswith("/items"):
+            return httpx.Response(200, json={"id": "quiz_abc", "title": "Quiz"})
+        page = int(request.url.params.get("page", "1"))
+        links = [f'<{items_url}?page=3&per_page=100>; rel="last"']
+        if page < 3:
+            links.append(f'<{items_url}?page={page + 1}&per_page=100>; rel="next"')
+        return httpx.Response(200, json=items[(page - 1) * 100:page * 100], headers={"Link": ", ".join(links)})
+
+    def make_canvas(**kwargs):
+        http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return AsyncCanvasClient(canvas_url="https://canvas.test", access_token="tok", client=http, quiz_state=QuizStateCache())
+
+    quiz = {
+        "_id": "65a000000000000000000001", "course_id": 7, "new_quiz_id": "quiz_abc", "status": "saved_to_canvas",
+        "title": "Quiz", "question_count": 250, "questions": [synced_question(item) for item in items],
+    }
+    collection = MagicMock()
+    collection.find_one.return_value = quiz
+    with patch("main.course_quizzes_collection", collection), \
+            patch("main.assert_course_access"), \
+            patch("main.decrypt", lambda token: token), \
+            patch("main.AsyncCanvasClient", make_canvas):
+        result = await main.sync_from_canvas(quiz["_id"], {"clerk_id": "user_1", "canvas_token": "tok"})
+
+    # Nothing changed on Canvas, so items past the first page must not be treated as deleted
+    assert result["changed_question_ids"] == []
+    collection.find_one_and_update.assert_not_called()
+
+
+# --- get_assessly_quizzes ---
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status", ["saved_to_canvas", "publish_failed"])
+async def test_quiz_deleted_on_canvas_reverts_and_clears_item_ids(status):
+    doc = {"_id": "65a000000000000000000001", "title": "Quiz", "status": status, "new_quiz_id": "gone"}
+    collection = MagicMock()
+    collection.find.return_value = [doc]
+    canvas = MagicMock()
+    canvas.__aenter__ = AsyncMock(return_value=canvas)
+    canvas.__aexit__ = AsyncMock(return_value=None)
+    canvas.get_all_new_quizzes_for_course = AsyncMock(return_value={})
+    jobs = MagicMock()
+    with patch("main.course_quizzes_collection", collection), \
+            patch("main.publish_jobs", jobs), \
+            patch("main.assert_course_access"), \
+            patch("main.decrypt", lambda token: token), \
+            patch("main.AsyncCanvasClient", lambda **kwargs: canvas):
+        await main.get_assessly_quizzes(7, {"clerk_id": "user_1", "canvas_token": "tok"})
+
+    update = collection.update_one.call_args[0][1]["$set"]
+    assert update["status"] == "generated_pending_review"
+    assert update["new_quiz_id"] is None
+    assert update["questions.$[].canvas_item_id"] is None
+    jobs.forget.assert_called_once_with(doc["_id"])
+
+
+@pytest.mark.asyncio
+async def test_failed_publish_can_be_reverted_to_draft_when_shell_is_gone():
+    quiz = {"_id": "65a000000000000000000001", "course_id": 7, "status": "publish_failed", "new_quiz_id": "gone", "questions": []}
+    collection = MagicMock()
+    collection.find_one.return_value = quiz
+    canvas = MagicMock()
+    canvas.__aenter__ = AsyncMock(return_value=canvas)
+    canvas.__aexit__ = AsyncMock(return_value=None)
+    canvas.delete_quiz_from_canvas = AsyncMock(return_value=None)
+    with patch("main.course_quizzes_collection", collection), \
+            patch("main.publish_jobs", MagicMock()), \
+            patch("main.assert_course_access"), \
+            patch("main.decrypt", lambda token: token), \
+            patch("main.AsyncCanvasClient", lambda **kwargs: canvas):
+        assert await main.revert_to_draft(quiz["_id"], {"clerk_id": "user_1", "canvas_token": "tok"}) == {"reverted": True}
+
+    assert collection.update_one.call_args[0][1]["$set"]["status"] == "generated_pending_review"
@@ -0,0 +1,55 @@
+"""
+Unit tests for prompt_context.py
+"""
+from prompt_context import compact_line, compact_previous_questions, correct_answer_text, estimate_tokens
+
+
+CANVAS_QUESTION = {
+    "id": 11,
+    "question_text": "<p>What is the <strong>powerhouse</strong> of the cell?</p>",
+    "answers": [
+        {"id": 1, "text": "Nucleus", "weight": 0, "comments": "No"},
+        {"id": 2, "html": "<p>Mitochondria</p>", "weight": 100, "comments": ""},
+    ],
+    "points_possible": 1,
+}
+STORED_QUESTION = {
+    "question_stem_html": "<p>Which base pairs with adenine &amp; why?</p>",
+    "choices": [{"text_html": "<p>Thymine</p>", "is_correct": True}, {"text_html": "<p>Guanine</p>", "is_correct": False}],
+}
+
+
+def test_estimate_tokens_rounds_up():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+
+
+def test_canvas_and_stored_questions_reduce_to_stem_and_answer():
+    assert compact_line(CANVAS_QUESTION) == "- What is the powerhouse of the cell? -> Mitochondria"
+    assert compact_line(STORED_QUESTION) == "- Which base pairs with adenine & why? -> Thymine"
+    assert correct_answer_text({"question_stem": "No answer marked", "choices": [{"text": "x"}]}) == ""
+    assert compact_line({"question_stem": "No answer marked"}) == "- No answer marked"
+
+
+def test_duplicates_and_empty_questions_are_dropped():
+    context = compact_previous_questions([CANVAS_QUESTION, dict(CANVAS_QUESTION, id=12), {"question_text": ""}, STORED_QUESTION])
+
+    assert len(context.lines) == 2
+    assert context.duplicates == 2
+    assert context.truncated == 0
+
+
+def test_lines_stop_at_token_budget_and_truncation_is_counted():
+    questions = [{"question_stem": f"Question number {i} on subject {i}?"} for i in range(20)]
+
+    context = compact_previous_questions(questions, token_budget=40)
+
+    assert context.tokens <= 40
+    assert context.truncated == 20 - len(context.lines) > 0
+    # Keeps the first questions, in order
+    assert context.lines[0] == "- Question number 0 on subject 0?"
+    assert context.report() == {
+        "previous_questions": 20, "included": len(context.lines), "duplicates": 0,
+        "truncated": context.truncated, "estimated_tokens": context.tokens,
+    }
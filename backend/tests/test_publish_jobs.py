@@ -0,0 +1,79 @@
+"""
+Unit tests for PublishJobStore in publish_jobs.py (MongoDB is mocked)
+"""
+import pytest
+from unittest.mock import MagicMock
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from publish_jobs import PublishJobStore, JobInProgressError
+
+
+QUIZ_ID = ObjectId()
+
+QUIZ_DOC = {
+    "_id": QUIZ_ID,
+    "course_id": 123,
+    "new_quiz_id": None,
+    "questions": [
+        {"internal_question_id": "q1", "canvas_item_id": None},
+        {"internal_question_id": "q2", "canvas_item_id": None},
+    ]
+}
+
+
+def test_claim_is_a_single_atomic_upsert():
+    collection = MagicMock()
+    collection.find_one_and_update.return_value = {"_id": "job_1", "status": "running"}
+    job = PublishJobStore(collection).claim(QUIZ_DOC, publish=True, clerk_id="user_1")
+
+    query, pipeline = collection.find_one_and_update.call_args[0]
+    assert job["_id"] == "job_1"
+    assert query["quiz_id"] == QUIZ_ID
+    # Only a job that isn't running (or whose lease ran out) can be claimed
+    assert {"status": {"$ne": "running"}} in query["$or"]
+    assert pipeline[0]["$set"]["status"] == "running"
+    assert collection.find_one_and_update.call_args[1]["upsert"] is True
+
+
+def test_claim_while_running_raises_job_in_progress():
+    collection = MagicMock()
+    collection.find_one_and_update.side_effect = DuplicateKeyError("E11000 duplicate key")
+    with pytest.raises(JobInProgressError):
+        PublishJobStore(collection).claim(QUIZ_DOC, publish=False, clerk_id="user_1")
+
+
+def test_resume_state_applies_checkpoints():
+    job = {"new_quiz_id": "quiz_abc", "items": {"q1": "item_1"}}
+    state = PublishJobStore(MagicMock()).resume_state(job, QUIZ_DOC)
+
+    assert state["new_quiz_id"] == "quiz_abc"
+    assert [q["canvas_item_id"] for q in state["questions"]] == ["item_1", None]
+    assert QUIZ_DOC["questions"][0]["canvas_item_id"] is None  # original untouched
+
+
+def test_resume_state_falls_back_to_quiz_progress():
+    quiz_doc = {**QUIZ_DOC, "new_quiz_id": "quiz_old", "questions": [{"internal_question_id": "q1", "canvas_item_id": "item_9"}]}
+    state = PublishJobStore(MagicMock()).resume_state({"new_quiz_id": None, "items": {}}, quiz_doc)
+
+    assert state["new_quiz_id"] == "quiz_old"
+    assert state["questions"][0]["canvas_item_id"] == "item_9"
+
+
+def test_record_item_checkpoints_one_field_and_extends_lease():
+    collection = MagicMock()
+    PublishJobStore(collection).record_item("job_1", "q2", "item_2")
+
+    query, update = collection.update_one.call_args[0]
+    assert query == {"_id": "job_1"}
+    assert update["$set"]["items.q2"] == "item_2"
+    assert update["$set"]["lease_expires_at"] is not None
+
+
+def test_fail_records_error_and_releases_claim():
+    collection = MagicMock()
+    PublishJobStore(collection).fail("job_1", RuntimeError("boom"))
+
+    update = collection.update_one.call_args[0][1]["$set"]
+    assert update["status"] == "failed"
+    assert update["last_error"] == "boom"
+    assert update["lease_expires_at"] is None
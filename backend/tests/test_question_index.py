@@ -0,0 +1,54 @@
+"""
+Unit tests for question_index.py
+"""
+import pytest
+from question_index import QuestionIndex, question_stem_text, topic_summary
+
+
+def test_stem_text_handles_every_question_shape():
+    assert question_stem_text({"question_stem": "Plain?"}) == "Plain?"
+    assert question_stem_text({"question_stem_html": "<p>Stored &amp; rendered</p>"}).strip() == "Stored & rendered"
+    assert question_stem_text({"question_text": "<div>From Canvas</div>"}).strip() == "From Canvas"
+    assert question_stem_text("bare string") == "bare string"
+    assert question_stem_text({"choices": []}) == ""
+
+
+def test_rewording_of_indexed_question_is_a_duplicate():
+    index = QuestionIndex()
+    index.add({"question_stem": "Which enzyme unwinds the DNA double helix during replication?"})
+
+    assert index.is_duplicate({"question_stem": "Which enzyme unwinds the DNA double helix during DNA replication?"})
+    assert index.is_duplicate({"question_text": "<p>which enzyme UNWINDS the DNA double-helix during replication</p>"})
+
+
+def test_different_question_is_not_a_duplicate():
+    index = QuestionIndex()
+    index.add({"question_stem": "Which enzyme unwinds the DNA double helix during replication?"})
+
+    assert not index.is_duplicate({"question_stem": "Which enzyme joins Okazaki fragments on the lagging strand?"})
+    assert not index.is_duplicate({"question_stem": ""})
+
+
+def test_lookups_scale_past_a_full_scan():
+    index = QuestionIndex()
+    index.add_all({"question_stem": f"In experiment number {i} what was the measured value of sample {i}?"} for i in range(2000))
+
+    assert len(index) == 2000
+    assert index.is_duplicate({"question_stem": "In experiment number 1234 what was the measured value of sample 1234?"})
+    assert not index.is_duplicate({"question_stem": "Why do leaves change colour in autumn?"})
+
+
+def test_num_perm_must_split_into_bands():
+    with pytest.raises(ValueError):
+        QuestionIndex(num_perm=10, bands=3)
+
+
+def test_topic_summary_lists_most_common_terms_first():
+    summary = topic_summary([
+        {"question_stem": "What is mitosis?"},
+        {"question_stem": "When does mitosis end?"},
+        {"question_stem": "What is meiosis?"},
+    ], max_terms=2)
+
+    assert summary.split(", ")[0] == "mitosis"
+    assert len(summary.split(", ")) == 2
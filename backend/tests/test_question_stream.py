@@ -0,0 +1,45 @@
+"""
+Unit tests for QuestionStreamParser in question_stream.py
+"""
+import json
+from question_stream import QuestionStreamParser
+
+
+QUIZ = {"questions": [
+    {"question_stem": "Which } closes {this}?", "choices": [{"text": "[a]", "is_correct": True}], "rationale": "r"},
+    {"question_stem": "Escaped \\\" quote and \\\\ backslash", "choices": [{"text": "b", "is_correct": False}], "rationale": ""},
+]}
+TEXT = json.dumps(QUIZ)
+
+
+def feed_in_chunks(text, size):
+    parser = QuestionStreamParser()
+    seen = []
+    for i in range(0, len(text), size):
+        seen.extend(parser.feed(text[i:i + size]))
+    return parser, seen
+
+
+def test_questions_are_emitted_for_every_chunk_size():
+    for size in (1, 2, 5, 17, len(TEXT)):
+        parser, seen = feed_in_chunks(TEXT, size)
+        assert seen == QUIZ["questions"], size
+        assert parser.text == TEXT
+
+
+def test_question_is_emitted_as_soon_as_it_closes():
+    parser = QuestionStreamParser()
+    first_end = TEXT.index('"rationale": "r"}') + len('"rationale": "r"}')
+
+    assert parser.feed(TEXT[:first_end - 1]) == []
+    assert parser.feed(TEXT[first_end - 1:first_end]) == [QUIZ["questions"][0]]
+
+
+def test_markdown_fence_before_json_is_ignored():
+    _, seen = feed_in_chunks("```json\n" + TEXT + "\n```", 4)
+    assert seen == QUIZ["questions"]
+
+
+def test_incomplete_question_is_not_emitted():
+    _, seen = feed_in_chunks(TEXT[:-30], 3)
+    assert seen == QUIZ["questions"][:1]
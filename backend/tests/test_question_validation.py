@@ -0,0 +1,39 @@
+"""
+Unit tests for validate_question in question_validation.py
+"""
+from question_validation import validate_question
+
+
+def make_question(**overrides):
+    question = {
+        "question_stem": "What is X?",
+        "choices": [{"text": t, "is_correct": t == "B"} for t in "ABCD"],
+        "rationale": "Because.",
+    }
+    question.update(overrides)
+    return question
+
+
+def test_valid_question_has_no_problems():
+    assert validate_question(make_question()) == []
+    assert validate_question(make_question(rationale="")) == []
+
+
+def test_wrong_number_of_choices():
+    question = make_question(choices=[{"text": t, "is_correct": t == "A"} for t in "ABC"])
+    assert validate_question(question) == ["has 3 choices instead of 4"]
+
+
+def test_no_or_several_correct_choices():
+    assert validate_question(make_question(choices=[{"text": t, "is_correct": False} for t in "ABCD"])) == ["has no correct choice"]
+    assert validate_question(make_question(choices=[{"text": t, "is_correct": True} for t in "ABCD"])) == ["has 4 correct choices instead of 1"]
+
+
+def test_missing_fields_are_reported():
+    problems = validate_question({"choices": [{"text": "", "is_correct": True}, {"text": "B"}, "C", {"text": "D", "is_correct": False}]})
+    assert "has no question_stem" in problems
+    assert "choice 1 has no text" in problems
+    assert "choice 2 has no true/false is_correct" in problems
+    assert "choice 3 has no text" in problems
+    assert validate_question("not a question") == ["is not a JSON object"]
+    assert "has no choices list" in validate_question(make_question(choices=None))
@@ -0,0 +1,76 @@
+"""
+Unit tests for quiz_result_cache.py
+MongoDB is replaced by a tiny in-memory collection that supports the calls the cache makes.
+"""
+from datetime import datetime, timedelta, timezone
+from quiz_result_cache import QuizResultCache, result_cache_key
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+
+    def find_one(self, query):
+        return next((d for d in self.docs if all(d.get(k) == v for k, v in query.items())), None)
+
+    def update_one(self, query, update, upsert=False):
+        doc = self.find_one(query)
+        if doc is None and upsert:
+            doc = dict(query)
+            self.docs.append(doc)
+        if doc is not None:
+            doc.update(update["$set"])
+
+
+FILES = [
+    {"id": 1, "modified_at": "2026-01-01T00:00:00Z", "url": "u1", "display_name": "a.pdf"},
+    {"id": 2, "modified_at": "2026-01-02T00:00:00Z", "url": "u2", "display_name": "b.pdf"},
+]
+QUIZ = {"questions": [{"question_stem": "Q?", "choices": [], "rationale": ""}]}
+
+
+def test_key_ignores_file_and_quiz_id_order():
+    assert result_cache_key(FILES, 5, 7, [3, 4]) == result_cache_key(FILES[::-1], 5, 7, [4, 3])
+
+
+def test_key_changes_with_any_input():
+    base = result_cache_key(FILES, 5, 7, [3])
+    edited = [dict(FILES[0], modified_at="2026-02-01T00:00:00Z"), FILES[1]]
+
+    assert result_cache_key(edited, 5, 7, [3]) != base
+    assert result_cache_key(FILES, 6, 7, [3]) != base
+    assert result_cache_key(FILES, 5, 7, []) != base
+    assert result_cache_key(FILES, 5, 7, [3], prompt_version="other") != base
+
+
+def test_files_without_canvas_metadata_are_not_cacheable():
+    assert result_cache_key([{"url": "u", "display_name": "x.pdf"}], 5, None, []) is None
+    assert result_cache_key([], 5, None, []) is None
+
+
+def test_stored_result_is_returned_to_its_owner_only():
+    cache = QuizResultCache(FakeCollection())
+    cache.store("user_1", "k", QUIZ)
+
+    assert cache.lookup("user_1", "k") == QUIZ
+    assert cache.lookup("user_2", "k") is None
+    assert cache.lookup("user_1", "other") is None
+
+
+def test_expired_entry_is_a_miss_even_before_mongo_removes_it():
+    collection = FakeCollection()
+    cache = QuizResultCache(collection, ttl=timedelta(hours=1))
+    cache.store("user_1", "k", QUIZ)
+    collection.docs[0]["expires_at"] = (datetime.now(timezone.utc) - timedelta(seconds=1)).replace(tzinfo=None)
+
+    assert cache.lookup("user_1", "k") is None
+
+
+def test_store_replaces_existing_entry():
+    collection = FakeCollection()
+    cache = QuizResultCache(collection)
+    cache.store("user_1", "k", QUIZ)
+    cache.store("user_1", "k", {"questions": []})
+
+    assert len(collection.docs) == 1
+    assert cache.lookup("user_1", "k") == {"questions": []}
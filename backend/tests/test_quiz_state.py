@@ -0,0 +1,53 @@
+"""
+Unit tests for QuizStateCache in quiz_state.py
+"""
+from quiz_state import QuizStateCache
+
+QUIZ_URL = "https://ufl.instructure.com/api/quiz/v1/courses/1/quizzes/12"
+
+
+def test_remember_keeps_etag_for_conditional_reads():
+    cache = QuizStateCache()
+    cache.remember("token", QUIZ_URL, {"id": "12"}, {"ETag": '"v1"', "Last-Modified": "Tue, 01 Sep 2026 10:00:00 GMT"})
+
+    assert cache.get("token", QUIZ_URL).conditional_headers() == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Tue, 01 Sep 2026 10:00:00 GMT",
+    }
+
+
+def test_state_is_per_token():
+    cache = QuizStateCache()
+    cache.remember("token-a", QUIZ_URL, {"id": "12"})
+    assert cache.get("token-b", QUIZ_URL) is None
+
+
+def test_older_response_does_not_replace_newer_state():
+    cache = QuizStateCache()
+    cache.remember("token", QUIZ_URL, {"id": "12", "published": True, "updated_at": "2026-09-01T10:00:05Z"})
+    cache.remember("token", QUIZ_URL, {"id": "12", "published": False, "updated_at": "2026-09-01T10:00:01Z"})
+
+    assert cache.get("token", QUIZ_URL).body["published"] is True
+
+
+def test_merge_applies_fields_and_drops_stale_etag():
+    cache = QuizStateCache()
+    cache.remember("token", QUIZ_URL, {"id": "12", "published": False}, {"ETag": '"v1"'})
+    cache.merge("token", QUIZ_URL, {"published": True})
+
+    state = cache.get("token", QUIZ_URL)
+    assert state.body == {"id": "12", "published": True}
+    assert state.conditional_headers() == {}
+
+
+def test_forget_drops_quiz_and_its_items_only():
+    cache = QuizStateCache()
+    cache.remember("token", QUIZ_URL, {"id": "12"})
+    cache.remember("token", f"{QUIZ_URL}/items/1", {"id": "1"})
+    cache.remember("token", f"{QUIZ_URL}3", {"id": "123"})
+
+    cache.forget("token", QUIZ_URL)
+
+    assert cache.get("token", QUIZ_URL) is None
+    assert cache.get("token", f"{QUIZ_URL}/items/1") is None
+    assert cache.get("token", f"{QUIZ_URL}3") is not None
@@ -0,0 +1,102 @@
+"""
+Unit tests for the Canvas sync helpers in quiz_sync.py
+"""
+from quiz_sync import HASH_FIELD, canvas_item_hash, merge_canvas_item, plan_canvas_sync, question_from_canvas_item
+
+
+def make_item(**overrides):
+    item = {
+        "id": "item_1", "position": 1, "points_possible": 1,
+        "entry": {
+            "item_body": "<p>2+2?</p>",
+            "interaction_data": {"choices": [{"id": "a", "item_body": "3"}, {"id": "b", "item_body": "4"}]},
+            "scoring_data": {"value": "b"},
+        },
+    }
+    item.update(overrides)
+    return item
+
+
+def test_hash_ignores_fields_we_do_not_mirror():
+    assert canvas_item_hash(make_item()) == canvas_item_hash(make_item(updated_at="2026-10-01T00:00:00Z"))
+
+
+def test_hash_changes_with_mirrored_fields():
+    base = canvas_item_hash(make_item())
+    assert canvas_item_hash(make_item(points_possible=2)) != base
+    assert canvas_item_hash(make_item(position=2)) != base
+    entry = {**make_item()["entry"], "scoring_data": {"value": "a"}}
+    assert canvas_item_hash(make_item(entry=entry)) != base
+
+
+def test_new_question_carries_hash_and_correct_choice():
+    question = question_from_canvas_item(make_item(), 1)
+    assert question[HASH_FIELD] == canvas_item_hash(make_item())
+    assert [c["is_correct"] for c in question["choices"]] == [False, True]
+
+
+def test_merge_reports_changes_and_refreshes_hash():
+    stored = question_from_canvas_item(make_item(), 1)
+    edited = make_item(points_possible=5)
+
+    updated, changed = merge_canvas_item(stored, edited)
+
+    assert changed
+    assert updated["points_possible"] == 5
+    assert updated[HASH_FIELD] == canvas_item_hash(edited)
+
+
+def test_merge_of_identical_item_only_sets_hash():
+    stored = question_from_canvas_item(make_item(), 1)
+    del stored[HASH_FIELD]
+
+    updated, changed = merge_canvas_item(stored, make_item())
+
+    assert not changed
+    assert updated[HASH_FIELD] == canvas_item_hash(make_item())
+
+
+# --- plan_canvas_sync ---
+
+def make_numbered_item(n, **overrides):
+    return make_item(**{"id": f"item_{n}", "position": n, **overrides})
+
+
+def synced_quiz(items):
+    questions = [{**question_from_canvas_item(i, 0), "internal_question_id": f"q{i['position']}"} for i in items]
+    return {"title": "Quiz", "question_count": len(questions), "questions": questions}
+
+
+def test_plan_is_empty_when_nothing_changed():
+    items = [make_numbered_item(n) for n in (1, 2, 3)]
+    plan = plan_canvas_sync(synced_quiz(items), "Quiz", items)
+
+    assert plan.set_fields == {}
+    assert not plan.content_changed
+
+
+def test_plan_reorder_rewrites_array_in_canvas_order():
+    items = [make_numbered_item(n) for n in (1, 2, 3)]
+    quiz = synced_quiz(items)
+    items[0], items[2] = make_numbered_item(1, position=3), make_numbered_item(3, position=1)
+
+    plan = plan_canvas_sync(quiz, "Quiz", items)
+
+    assert [q["internal_question_id"] for q in plan.set_fields["questions"]] == ["q3", "q2", "q1"]
+    assert plan.array_filters is None
+    assert plan.changed_question_ids == ["q3", "q1"]
+
+
+def test_plan_merges_additions_deletions_and_edits_in_one_pass():
+    items = [make_numbered_item(n) for n in (1, 2, 3)]
+    quiz = synced_quiz(items)
+    canvas = [make_numbered_item(1, points_possible=4), items[2], make_numbered_item(4)]
+
+    plan = plan_canvas_sync(quiz, "Renamed", canvas)
+
+    questions = plan.set_fields["questions"]
+    assert [q["canvas_item_id"] for q in questions] == ["item_1", "item_3", "item_4"]
+    assert questions[0]["points_possible"] == 4
+    assert plan.set_fields["title"] == "Renamed"
+    assert "question_count" not in plan.set_fields
+    assert plan.changed_question_ids[0] == "q1" and len(plan.changed_question_ids) == 2
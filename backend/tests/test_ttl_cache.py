@@ -0,0 +1,74 @@
+"""
+Unit tests for TTLCache in ttl_cache.py
+"""
+import pytest
+from ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_returns_stored_value_and_counts_hit():
+    cache = TTLCache(maxsize=4, ttl=10)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_missing_key_counts_miss():
+    cache = TTLCache(maxsize=4, ttl=10)
+    assert cache.get("nope", "default") == "default"
+    assert cache.stats()["misses"] == 1
+
+
+def test_entry_expires_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=4, ttl=10, clock=clock)
+    cache.set("a", 1)
+    clock.now = 10.1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_per_entry_ttl_overrides_default():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=4, ttl=100, clock=clock)
+    cache.set("short", 1, ttl=1)
+    clock.now = 2
+    assert cache.get("short") is None
+
+
+def test_non_positive_ttl_is_not_stored():
+    cache = TTLCache(maxsize=4, ttl=10)
+    cache.set("expired", 1, ttl=-5)
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_discard_where_drops_matching_keys():
+    cache = TTLCache(maxsize=4, ttl=10)
+    cache.set(("user_1", 100), "x")
+    cache.set(("user_1", 200), "y")
+    cache.set(("user_2", 100), "z")
+    assert cache.discard_where(lambda key: key[0] == "user_1") == 2
+    assert cache.get(("user_2", 100)) == "z"
+
+
+def test_invalid_maxsize_raises():
+    with pytest.raises(ValueError):
+        TTLCache(maxsize=0)